@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+クラッシュ復旧用の自動保存ジャーナル
+描画操作を追記専用のファイルにバックグラウンドスレッドで書き込み、
+定期的に画像全体のチェックポイントを書いてファイルを圧縮する
+"""
+
+from typing import List, Optional, Tuple
+import io
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from PIL import Image
+
+import canvas_ops
+
+# ジャーナルの既定の保存先
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".simple_py_paint", "autosave.journal")
+
+# ファイル先頭のマジックナンバー
+JOURNAL_MAGIC = b"SPPJ1\n"
+
+# レコードの種類
+RECORD_BASE = 1        # セッション開始時の画像（これだけなら復旧不要）
+RECORD_CHECKPOINT = 2  # 画像全体のチェックポイント
+RECORD_OPERATION = 3   # 描画操作（JSON）
+
+# レコードのヘッダ: 種類, ペイロード長, CRC32
+_RECORD_HEADER = struct.Struct("<BII")
+
+# 書き込みスレッドへの停止要求
+_STOP = object()
+
+
+def _encode_image(image: Image.Image) -> bytes:
+    """
+    チェックポイント用に画像をエンコードする（速度優先のPNG）
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def _iter_records(file):
+    """
+    ジャーナルのレコードを順に読み出す
+    書き込み途中でクラッシュした末尾の壊れたレコードは無視する
+
+    Yields:
+        (種類, ペイロード)のタプル
+    """
+    if file.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+        return
+    while True:
+        header = file.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            return
+        kind, length, crc = _RECORD_HEADER.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield kind, payload
+
+
+def has_recovery_data(path: str = DEFAULT_JOURNAL_PATH) -> bool:
+    """
+    復旧可能な内容がジャーナルに残っているかを確認する
+
+    Args:
+        path: ジャーナルのパス
+
+    Returns:
+        セッション開始時以降の変更が記録されていればTrue
+    """
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, "rb") as file:
+            return any(kind != RECORD_BASE for kind, _ in _iter_records(file))
+    except OSError:
+        return False
+
+
+def document_journal_path(number: int, base_path: str = DEFAULT_JOURNAL_PATH) -> str:
+    """
+    タブで開いたドキュメントごとのジャーナルのパス（1番目のドキュメントは既定のパス）
+
+    Args:
+        number: ドキュメントの番号（1から）
+        base_path: 1番目のドキュメントのジャーナルのパス
+
+    Returns:
+        ジャーナルのパス
+    """
+    if number == 1:
+        return base_path
+    root, extension = os.path.splitext(base_path)
+    return f"{root}-{number}{extension}"
+
+
+def find_recovery_journals(base_path: str = DEFAULT_JOURNAL_PATH, max_documents: int = 64) -> List[Tuple[int, str]]:
+    """
+    復旧可能な内容が残っているドキュメントのジャーナルを探す
+
+    Args:
+        base_path: 1番目のドキュメントのジャーナルのパス
+        max_documents: 確認するドキュメントの番号の上限
+
+    Returns:
+        (ドキュメントの番号, ジャーナルのパス)のリスト
+    """
+    journals = []
+    for number in range(1, max_documents + 1):
+        path = document_journal_path(number, base_path)
+        if has_recovery_data(path):
+            journals.append((number, path))
+    return journals
+
+
+def replay_journal(path: str = DEFAULT_JOURNAL_PATH) -> Optional[Image.Image]:
+    """
+    ジャーナルを再生して最後の状態の画像を復元する
+
+    Args:
+        path: ジャーナルのパス
+
+    Returns:
+        復元した画像（復元できない場合はNone）
+        適用できない操作があった場合はその直前までの画像
+    """
+    image = None
+    try:
+        with open(path, "rb") as file:
+            for kind, payload in _iter_records(file):
+                if kind in (RECORD_BASE, RECORD_CHECKPOINT):
+                    image = Image.open(io.BytesIO(payload))
+                    image.load()
+                elif kind == RECORD_OPERATION and image is not None:
+                    try:
+                        image = canvas_ops.apply_operation(image, json.loads(payload))
+                    except (ValueError, KeyError, TypeError) as e:
+                        # 適用できない操作以降は再生せず、直前までの画像を復元する
+                        print(f"ジャーナルの操作を適用できません: {e}")
+                        break
+    except OSError as e:
+        print(f"ジャーナルの読み込みエラー: {e}")
+    return image
+
+
+class AutosaveJournal:
+    """
+    追記専用の自動保存ジャーナル
+    UIスレッドは操作をキューに積むだけで、エンコードと書き込みは書き込みスレッドで行う
+    """
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH, fsync_interval: float = 1.0,
+                 checkpoint_every: int = 200):
+        """
+        ジャーナルの初期化
+
+        Args:
+            path: ジャーナルのパス
+            fsync_interval: fsyncをまとめて行う間隔（秒）
+            checkpoint_every: チェックポイントを書くまでの操作数
+        """
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.checkpoint_every = checkpoint_every
+        self.operations_since_checkpoint = 0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._file = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def checkpoint_due(self) -> bool:
+        """
+        チェックポイントを書くべきかどうか
+        """
+        return self.operations_since_checkpoint >= self.checkpoint_every
+
+    def start(self, image: Image.Image, recovered: bool = False) -> None:
+        """
+        現在の画像を起点にジャーナルを開始する（既存のジャーナルは置き換える）
+
+        Args:
+            image: 現在の描画データ
+            recovered: 復旧した画像から開始する場合はTrue（再度のクラッシュに備え復旧対象として残す）
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        kind = RECORD_CHECKPOINT if recovered else RECORD_BASE
+        self._queue.put((kind, image.copy()))
+        self._thread = threading.Thread(target=self._writer_loop, name="autosave-journal", daemon=True)
+        self._thread.start()
+
+    def record(self, operation: dict) -> None:
+        """
+        描画操作を記録する
+
+        Args:
+            operation: canvas_ops.apply_operationで再生できる操作
+        """
+        if self._thread is None:
+            return
+        self.operations_since_checkpoint += 1
+        self._queue.put((RECORD_OPERATION, operation))
+
+    def checkpoint(self, image: Image.Image) -> None:
+        """
+        画像全体のチェックポイントを書き、それ以前の記録を破棄する
+
+        Args:
+            image: 現在の描画データ（コピーして書き込みスレッドに渡す）
+        """
+        if self._thread is None:
+            return
+        self.operations_since_checkpoint = 0
+        self._queue.put((RECORD_CHECKPOINT, image.copy()))
+
+    def close(self, discard: bool = False) -> None:
+        """
+        書き込みスレッドを停止してジャーナルを閉じる
+
+        Args:
+            discard: 正常終了時などでジャーナルを削除する場合はTrue
+        """
+        if self._thread is not None:
+            self._queue.put((_STOP, None))
+            self._thread.join()
+            self._thread = None
+        if discard and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _writer_loop(self) -> None:
+        """
+        書き込みスレッドの処理
+        キューに溜まった操作をまとめて書き込み、fsyncは一定間隔でまとめて行う
+        """
+        last_sync = time.monotonic()
+        unsynced = False
+        while True:
+            try:
+                timeout = self.fsync_interval if unsynced else None
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            try:
+                for kind, payload in batch:
+                    if kind is _STOP:
+                        stop = True
+                    elif kind == RECORD_OPERATION:
+                        data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+                        self._write_record(kind, data)
+                        unsynced = True
+                    else:
+                        self._rotate(kind, _encode_image(payload))
+                        unsynced = False
+                        last_sync = time.monotonic()
+
+                if self._file is not None and unsynced and (
+                        stop or time.monotonic() - last_sync >= self.fsync_interval):
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    unsynced = False
+                    last_sync = time.monotonic()
+            except OSError as e:
+                print(f"ジャーナルの書き込みエラー: {e}")
+
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write_record(self, kind: int, payload: bytes) -> None:
+        """
+        レコードを1件追記する
+        """
+        if self._file is None:
+            return
+        self._file.write(_RECORD_HEADER.pack(kind, len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+
+    def _rotate(self, kind: int, image_data: bytes) -> None:
+        """
+        チェックポイントだけを含む新しいジャーナルに置き換える
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.write(JOURNAL_MAGIC)
+            tmp_file.write(_RECORD_HEADER.pack(kind, len(image_data), zlib.crc32(image_data)))
+            tmp_file.write(image_data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+
+        if self._file is not None:
+            self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "ab")
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+スタンプ方式のブラシ
+ストロークに沿って一定間隔でダブ（円形のマスク）を置き、溜まったモーションイベントの分を一度に合成する
+ダブのマスクはサイズと硬さごとに作成してLRUでキャッシュする
+"""
+
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import math
+import time
+
+import numpy as np
+from PIL import Image, ImageColor
+
+import selection_ops
+
+# ブラシの種類と表示名（"line"は従来のImageDraw.lineによる描画）
+BRUSH_LABELS = {
+    "line": "線",
+    "hard": "ハード",
+    "soft": "ソフト",
+}
+
+Box = Tuple[int, int, int, int]
+
+
+def make_dab(diameter: float, soft: bool) -> np.ndarray:
+    """
+    ダブのマスクを作成する
+
+    Args:
+        diameter: 直径（ピクセル、小数も可）
+        soft: 周辺に向かって滑らかに薄くなるマスクにする場合はTrue
+
+    Returns:
+        0〜1の不透明度の正方形の配列
+    """
+    radius = max(diameter / 2, 0.5)
+    size = int(math.ceil(diameter)) + 2
+    center = (size - 1) / 2
+    coordinates = np.arange(size, dtype=np.float32) - center
+    distance = np.sqrt(coordinates[:, None] ** 2 + coordinates[None, :] ** 2)
+    if soft:
+        t = np.clip(distance / radius, 0.0, 1.0)
+        return ((1.0 - t * t) ** 2).astype(np.float32)
+    # 縁の1ピクセルだけアンチエイリアスする
+    return np.clip(radius + 0.5 - distance, 0.0, 1.0).astype(np.float32)
+
+
+class DabCache:
+    """
+    ダブのマスクのLRUキャッシュ
+    直径は0.25ピクセル単位に丸めてキーにする（速度で太さを変えてもキャッシュが増えすぎないように）
+    """
+    def __init__(self, max_entries: int = 128):
+        """
+        Args:
+            max_entries: 保持するマスクの最大数
+        """
+        self.max_entries = max_entries
+        self._masks: "OrderedDict[Tuple[int, bool], np.ndarray]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._masks)
+
+    def get(self, diameter: float, soft: bool) -> np.ndarray:
+        """
+        ダブのマスクを取得する（なければ作成する）
+
+        Args:
+            diameter: 直径
+            soft: 柔らかいブラシかどうか
+
+        Returns:
+            マスク（書き換えないこと）
+        """
+        key = (max(1, int(round(diameter * 4))), soft)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = make_dab(key[0] / 4, soft)
+            self._masks[key] = mask
+            if len(self._masks) > self.max_entries:
+                self._masks.popitem(last=False)
+        else:
+            self._masks.move_to_end(key)
+        return mask
+
+
+class BrushStroke:
+    """
+    スタンプ方式のブラシによる1本のストローク
+    ストローク全体の被覆率を保持し、重なったダブで色が濃くならないようにする
+    """
+    def __init__(self, size: Tuple[int, int], color, diameter: float, soft: bool, opacity: float = 1.0,
+                 spacing: float = 0.25, cache: Optional[DabCache] = None, ink=None,
+                 velocity_width: bool = False, velocity_opacity: bool = False):
+        """
+        Args:
+            size: キャンバスのサイズ
+            color: 色（"#RRGGBB"・色名・RGBタプル）
+            diameter: ブラシの直径
+            soft: 柔らかいブラシかどうか
+            opacity: 不透明度 (0〜1)
+            spacing: ダブの間隔（直径に対する比率）
+            cache: ダブのマスクのキャッシュ
+            ink: インデックスカラーの描画データに書き込むパレット番号
+            velocity_width: ポインタの速度が速いほど細くする場合はTrue
+            velocity_opacity: ポインタの速度が速いほど薄くする場合はTrue
+        """
+        self.size = size
+        self.rgb = np.asarray(ImageColor.getrgb(color)[:3] if isinstance(color, str) else color[:3],
+                              dtype=np.float32)
+        self.diameter = diameter
+        self.soft = soft
+        self.opacity = opacity
+        self.spacing = spacing
+        self.cache = cache or DabCache()
+        self.ink = ink
+        self.velocity_width = velocity_width
+        self.velocity_opacity = velocity_opacity
+
+        # 操作として記録する点（[x, y, 直径, 不透明度]、モーションイベントごと）
+        self.points: List[List[float]] = []
+        self.bounds: Optional[Box] = None
+        self.last_diameter = diameter
+
+        self._last: Optional[Tuple[float, float]] = None
+        self._last_time: Optional[float] = None
+        self._residual = 0.0
+        self._speed = 0.0
+        self._pending: List[Tuple[List[Tuple[float, float]], np.ndarray, float]] = []
+        self._coverage: Optional[np.ndarray] = None
+        self._original: Optional[np.ndarray] = None
+        self._touched: Optional[np.ndarray] = None
+
+    def to_operation(self, color: str) -> dict:
+        """
+        canvas_ops.apply_operationで再生できる操作
+        """
+        return {"op": "brush", "color": color, "soft": self.soft, "spacing": self.spacing,
+                "points": self.points}
+
+    def add_point(self, x: float, y: float, time_ms: Optional[float] = None,
+                  diameter: Optional[float] = None, opacity: Optional[float] = None) -> None:
+        """
+        ストロークに点を追加し、前の点からのダブを合成待ちにする（合成はflushでまとめて行う）
+
+        Args:
+            x, y: 座標
+            time_ms: イベントの時刻（ミリ秒、速度の計算に使う。Noneの場合は現在時刻）
+            diameter: 直径（記録した操作の再生時に指定、Noneの場合は速度から求める）
+            opacity: 不透明度（記録した操作の再生時に指定）
+        """
+        if diameter is None or opacity is None:
+            diameter, opacity = self._dynamics(x, y, time_ms)
+        # 記録した操作の再生で同じ結果になるよう、記録する値に丸めてから使う
+        diameter, opacity = round(diameter, 2), round(opacity, 3)
+        self.points.append([x, y, diameter, opacity])
+        self.last_diameter = diameter
+
+        if self._last is None:
+            centers = [(x, y)]
+            self._residual = 0.0
+        else:
+            centers = self._place_stamps(self._last, (x, y), max(0.5, diameter * self.spacing))
+        self._last = (x, y)
+        if centers:
+            self._pending.append((centers, self.cache.get(diameter, self.soft), opacity))
+
+    def flush(self, image: Image.Image) -> Optional[Box]:
+        """
+        合成待ちのダブをまとめて描画データに合成する（外接矩形だけを一度に読み書きする）
+
+        Args:
+            image: 描画データ（その場で書き換える）
+
+        Returns:
+            書き換えた矩形（書き換えていない場合はNone）
+        """
+        if not self._pending:
+            return None
+        pending, self._pending = self._pending, []
+        stamps = []
+        for centers, mask, opacity in pending:
+            offset = (mask.shape[0] - 1) / 2
+            weighted = mask * opacity if opacity < 1.0 else mask
+            for cx, cy in centers:
+                stamps.append((math.floor(cx - offset + 0.5), math.floor(cy - offset + 0.5), weighted))
+        x0 = min(stamp[0] for stamp in stamps)
+        y0 = min(stamp[1] for stamp in stamps)
+        x1 = max(stamp[0] + stamp[2].shape[1] for stamp in stamps)
+        y1 = max(stamp[1] + stamp[2].shape[0] for stamp in stamps)
+
+        # 今回のダブの被覆率を最大値で重ねる
+        coverage = np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+        for left, top, weighted in stamps:
+            target = coverage[top - y0:top - y0 + weighted.shape[0], left - x0:left - x0 + weighted.shape[1]]
+            np.maximum(target, weighted, out=target)
+
+        box = selection_ops.clip_box((x0, y0, x1, y1), self.size)
+        if box is None:
+            return None
+        coverage = coverage[box[1] - y0:box[3] - y0, box[0] - x0:box[2] - x0]
+        width, height = self.size
+        if self._coverage is None:
+            self._coverage = np.zeros((height, width), dtype=np.float32)
+        stroke = self._coverage[box[1]:box[3], box[0]:box[2]]
+        np.maximum(stroke, coverage, out=stroke)
+
+        region = selection_ops.read_region(image, box)
+        if image.mode == "P":
+            # インデックスカラーは半透明にできないため、被覆率が半分以上のピクセルだけを塗る
+            region[stroke >= 0.5] = self.ink
+        else:
+            # ストローク開始前の色から合成し直す（まとめて合成する単位によらず同じ結果になる）
+            if self._original is None:
+                self._original = np.zeros((height, width, 3), dtype=np.uint8)
+                self._touched = np.zeros((height, width), dtype=bool)
+            original = self._original[box[1]:box[3], box[0]:box[2]]
+            touched = self._touched[box[1]:box[3], box[0]:box[2]]
+            untouched = ~touched
+            original[untouched] = region[untouched]
+            touched[:] = True
+            blended = original + (self.rgb - original) * stroke[..., None]
+            region = np.rint(blended).astype(np.uint8)
+        selection_ops.write_region(image, box, region)
+
+        if self.bounds is None:
+            self.bounds = box
+        else:
+            self.bounds = (min(self.bounds[0], box[0]), min(self.bounds[1], box[1]),
+                           max(self.bounds[2], box[2]), max(self.bounds[3], box[3]))
+        return box
+
+    def _dynamics(self, x: float, y: float, time_ms: Optional[float]) -> Tuple[float, float]:
+        """
+        ポインタの速度からダブの直径と不透明度を求める
+        """
+        now = time_ms if time_ms is not None else time.perf_counter() * 1000
+        if self._last is not None and self._last_time is not None and now > self._last_time:
+            speed = math.hypot(x - self._last[0], y - self._last[1]) / (now - self._last_time)
+            # 急な変化を抑えるため指数移動平均をとる
+            self._speed = 0.7 * self._speed + 0.3 * speed
+        self._last_time = now
+
+        # 速度（ピクセル/ミリ秒）が1で約2/3、3で半分になる
+        factor = 1.0 / (1.0 + 0.5 * self._speed)
+        diameter = self.diameter * max(factor, 0.25) if self.velocity_width else self.diameter
+        opacity = self.opacity * max(factor, 0.2) if self.velocity_opacity else self.opacity
+        return diameter, opacity
+
+    def _place_stamps(self, start: Tuple[float, float], end: Tuple[float, float],
+                      spacing: float) -> List[Tuple[float, float]]:
+        """
+        線分上に一定間隔でダブの中心を置く（前の線分の余りを引き継ぐ）
+        """
+        length = math.hypot(end[0] - start[0], end[1] - start[1])
+        offset = spacing - self._residual
+        if length < offset:
+            self._residual += length
+            return []
+        centers = []
+        while offset <= length:
+            t = offset / length
+            centers.append((start[0] + (end[0] - start[0]) * t, start[1] + (end[1] - start[1]) * t))
+            offset += spacing
+        self._residual = length - (offset - spacing)
+        return centers
+
+
+def replay_brush(image: Image.Image, operation: dict, ink) -> Optional[Box]:
+    """
+    記録したブラシの操作を描画データに適用する（全ての点のダブを一度に合成する）
+
+    Args:
+        image: 描画データ
+        operation: BrushStroke.to_operationの操作
+        ink: インデックスカラーの場合のパレット番号
+
+    Returns:
+        書き換えた矩形（書き換えていない場合はNone）
+    """
+    stroke = BrushStroke(image.size, operation["color"], 1.0, operation["soft"],
+                         spacing=operation["spacing"], ink=ink)
+    for x, y, diameter, opacity in operation["points"]:
+        stroke.add_point(x, y, diameter=diameter, opacity=opacity)
+    stroke.flush(image)
+    return stroke.bounds
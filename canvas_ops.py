@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+描画データ（PIL Image）に対する操作
+PaintAppとUIを持たない処理（ジャーナルの復元など）で同じ結果になるよう共通化している
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+
+import brush_engine
+import selection_ops
+
+# インデックスカラー（Pモード）のパレットに登録できる色の数
+INDEXED_MAX_COLORS = 256
+
+# 図形ツールで描ける図形
+SHAPES = ("line", "rectangle", "ellipse")
+
+
+def hex_to_rgb(hex_color: str) -> Tuple[int, int, int]:
+    """
+    16進数カラーコードをRGBタプルに変換
+
+    Args:
+        hex_color: #RRGGBBの形式の色
+
+    Returns:
+        (R, G, B)のタプル
+    """
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+
+def new_canvas_image(width: int, height: int, mode: str = "RGB") -> Image.Image:
+    """
+    白紙の描画データを作成する
+    インデックスカラー（Pモード）の場合はパレットの0番を白にする
+
+    Args:
+        width: 幅
+        height: 高さ
+        mode: "RGB"または"P"
+
+    Returns:
+        白紙の描画データ
+    """
+    if mode == "P":
+        image = Image.new("P", (width, height), 0)
+        image.putpalette([255, 255, 255])
+        return image
+    return Image.new("RGB", (width, height), "white")
+
+
+def ink_for(image: Image.Image, color):
+    """
+    描画データに描画するためのインクを返す
+    Pモードではパレット番号に変換し、未登録の色はパレットに追加する
+
+    Args:
+        image: 描画先の画像
+        color: 色（"#RRGGBB"・色名・RGBタプル）
+
+    Returns:
+        RGBモードでは色をそのまま、Pモードではパレット番号（パレットが一杯の場合はNone）
+    """
+    if image.mode != "P":
+        return color
+    rgb = ImageColor.getrgb(color)[:3] if isinstance(color, str) else tuple(color[:3])
+    index = image.palette.colors.get(rgb)
+    if index is not None:
+        return index
+    # Pillowはパレットが一杯でもエラーにせず既存の番号を返すため、事前に確認する
+    if len(image.getpalette()) // 3 >= INDEXED_MAX_COLORS:
+        return None
+    return image.palette.getcolor(rgb, image)
+
+
+def prepare_ink(image: Image.Image, color) -> Tuple[Image.Image, object]:
+    """
+    インクを用意する（Pモードでパレットが一杯の場合はRGBモードに変換する）
+
+    Args:
+        image: 描画先の画像
+        color: 色
+
+    Returns:
+        (描画先の画像, インク)のタプル
+    """
+    ink = ink_for(image, color)
+    if ink is None:
+        image = image.convert("RGB")
+        ink = color
+    return image, ink
+
+
+def to_indexed(image: Image.Image) -> Optional[Image.Image]:
+    """
+    描画データをインデックスカラー（1ピクセル1バイト）に変換する
+    色を減らさずに正確に変換できる場合だけ変換する
+
+    Args:
+        image: RGBモードの画像
+
+    Returns:
+        Pモードの画像（256色を超える場合はNone）
+    """
+    if image.mode == "P":
+        return image
+    rgb = image if image.mode == "RGB" else image.convert("RGB")
+    colors = rgb.getcolors(INDEXED_MAX_COLORS)
+    if colors is None:
+        return None
+
+    # 白を0番にして、キャンバス外（サイズ変更で広がった部分）が白になるようにする
+    palette_colors = sorted({color for _, color in colors} - {(255, 255, 255)})
+    palette_colors.insert(0, (255, 255, 255))
+
+    pixels = np.asarray(rgb, dtype=np.uint32)
+    keys = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+    palette_keys = np.array([(r << 16) | (g << 8) | b for r, g, b in palette_colors], dtype=np.uint32)
+    order = np.argsort(palette_keys)
+    indices = order[np.searchsorted(palette_keys[order], keys)].astype(np.uint8)
+
+    indexed = Image.frombytes("P", rgb.size, indices.tobytes())
+    indexed.putpalette([channel for color in palette_colors for channel in color])
+    return indexed
+
+
+def draw_stroke(draw: ImageDraw.ImageDraw, points: Sequence[Tuple[int, int]], color, width: int) -> None:
+    """
+    連続する点を線分でつないで描画する（PaintApp.drawと同じ線分単位の描画）
+
+    Args:
+        draw: 描画先のImageDraw
+        points: ストロークの点のリスト
+        color: 線の色
+        width: 線の太さ
+    """
+    for i in range(1, len(points)):
+        x1, y1 = points[i - 1]
+        x2, y2 = points[i]
+        draw.line((x1, y1, x2, y2), fill=color, width=width)
+
+
+def shape_bounds(points: Sequence[Tuple[int, int]], width: int,
+                 size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
+    """
+    図形を描画した時に書き換わる可能性がある矩形
+    太い枠は細い図形の外接矩形からはみ出すことがあるため、線の太さの分だけ広げる
+
+    Args:
+        points: 図形の始点と終点
+        width: 線の太さ
+        size: キャンバスのサイズ
+
+    Returns:
+        キャンバス内に切り詰めた矩形 (x0, y0, x1, y1)（キャンバス外の場合はNone）
+    """
+    (x0, y0), (x1, y1) = points
+    box = (max(min(x0, x1) - width, 0), max(min(y0, y1) - width, 0),
+           min(max(x0, x1) + width + 1, size[0]), min(max(y0, y1) + width + 1, size[1]))
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return None
+    return box
+
+
+def draw_shape(draw: ImageDraw.ImageDraw, shape: str, points: Sequence[Tuple[int, int]], color, width: int) -> None:
+    """
+    始点と終点から直線・四角形・楕円を描画する（四角形と楕円は枠のみ）
+
+    Args:
+        draw: 描画先のImageDraw
+        shape: "line", "rectangle", "ellipse"のいずれか
+        points: 図形の始点と終点
+        color: 線の色
+        width: 線の太さ
+    """
+    (x0, y0), (x1, y1) = points
+    if shape == "line":
+        draw.line((x0, y0, x1, y1), fill=color, width=width)
+        return
+    box = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+    if shape == "rectangle":
+        draw.rectangle(box, outline=color, width=width)
+    elif shape == "ellipse":
+        draw.ellipse(box, outline=color, width=width)
+    else:
+        raise ValueError(f"未知の図形です: {shape}")
+
+
+def flood_fill(image: Image.Image, x: int, y: int, fill_color: Tuple[int, int, int]) -> bool:
+    """
+    指定された位置から塗りつぶしを行う
+
+    Args:
+        image: 塗りつぶす画像
+        x: X座標
+        y: Y座標
+        fill_color: 塗りつぶす色（Pモードではパレット番号）
+
+    Returns:
+        画像が変更されたかどうか
+    """
+    # 座標が画像範囲内かチェック
+    x = max(0, min(x, image.width - 1))
+    y = max(0, min(y, image.height - 1))
+
+    # クリックした位置の色を取得
+    target_color = image.getpixel((x, y))
+
+    # 塗りつぶす色と同じ場合は何もしない
+    if target_color == fill_color:
+        return False
+
+    try:
+        # PIL 10.0.0以降ではfloodfill関数を使用
+        ImageDraw.floodfill(image, (x, y), fill_color)
+    except Exception:
+        # フォールバック: 独自の塗りつぶしアルゴリズム
+        custom_flood_fill(image, x, y, target_color, fill_color)
+    return True
+
+
+def custom_flood_fill(image: Image.Image, x: int, y: int, target_color, fill_color) -> None:
+    """
+    カスタム塗りつぶしアルゴリズム（フォールバック用）
+
+    Args:
+        image: 塗りつぶす画像
+        x, y: 開始座標
+        target_color: 置き換え対象の色
+        fill_color: 塗りつぶす色
+    """
+    if target_color == fill_color:
+        return
+
+    # スタックベースの塗りつぶしアルゴリズム
+    stack = [(x, y)]
+    pixels = image.load()
+    width, height = image.size
+
+    while stack:
+        current_x, current_y = stack.pop()
+
+        if (current_x < 0 or current_x >= width or
+            current_y < 0 or current_y >= height):
+            continue
+
+        if pixels[current_x, current_y] != target_color:
+            continue
+
+        pixels[current_x, current_y] = fill_color
+
+        # 隣接する4方向のピクセルをスタックに追加
+        stack.append((current_x + 1, current_y))
+        stack.append((current_x - 1, current_y))
+        stack.append((current_x, current_y + 1))
+        stack.append((current_x, current_y - 1))
+
+
+def resize_canvas_image(image: Image.Image, width: int, height: int) -> Image.Image:
+    """
+    キャンバスのサイズを変更した新しい描画データを作成する
+    既存の描画内容は左上から可能な範囲でコピーする
+
+    Args:
+        image: 元の描画データ
+        width: 新しい幅
+        height: 新しい高さ
+
+    Returns:
+        新しい描画データ
+    """
+    if image.mode == "P":
+        # パレットを引き継ぐ（0番は白）
+        resized = Image.new("P", (width, height), 0)
+        resized.putpalette(image.getpalette())
+    else:
+        resized = Image.new("RGB", (width, height), "white")
+
+    paste_width = min(image.width, width)
+    paste_height = min(image.height, height)
+    if paste_width > 0 and paste_height > 0:
+        resized.paste(image.crop((0, 0, paste_width, paste_height)), (0, 0))
+    return resized
+
+
+def apply_operation(image: Image.Image, operation: dict) -> Image.Image:
+    """
+    記録された描画操作を画像に適用する
+
+    操作は以下の形式の辞書:
+        {"op": "stroke", "color": 色, "width": 太さ, "points": [[x, y], ...]}
+        {"op": "fill", "x": X座標, "y": Y座標, "color": "#RRGGBB"}
+        {"op": "shape", "shape": 図形, "color": 色, "width": 太さ, "points": [[x0, y0], [x1, y1]]}
+        {"op": "brush", "color": 色, "soft": 柔らかさ, "spacing": 間隔, "points": [[x, y, 直径, 不透明度], ...]}
+        {"op": "resize", "width": 幅, "height": 高さ}
+        {"op": "clear"}
+        選択範囲の操作（cut, move, paste）はselection_ops.apply_selection_operationを参照
+
+    Args:
+        image: 適用先の画像
+        operation: 描画操作
+
+    Returns:
+        操作後の画像（サイズ変更やクリアでは新しい画像になる）
+    """
+    kind = operation["op"]
+    if kind == "stroke":
+        image, ink = prepare_ink(image, operation["color"])
+        draw_stroke(ImageDraw.Draw(image), [tuple(point) for point in operation["points"]],
+                    ink, operation["width"])
+    elif kind == "fill":
+        image, ink = prepare_ink(image, hex_to_rgb(operation["color"]))
+        flood_fill(image, operation["x"], operation["y"], ink)
+    elif kind == "shape":
+        image, ink = prepare_ink(image, operation["color"])
+        draw_shape(ImageDraw.Draw(image), operation["shape"], [tuple(point) for point in operation["points"]],
+                   ink, operation["width"])
+    elif kind == "brush":
+        image, ink = prepare_ink(image, operation["color"])
+        brush_engine.replay_brush(image, operation, ink if image.mode == "P" else None)
+    elif kind == "resize":
+        image = resize_canvas_image(image, operation["width"], operation["height"])
+    elif kind == "clear":
+        image = new_canvas_image(image.width, image.height, image.mode)
+    elif kind in selection_ops.SELECTION_OPERATIONS:
+        image = selection_ops.apply_selection_operation(image, operation)
+    else:
+        raise ValueError(f"未知の操作です: {kind}")
+    return image
@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+LAN内で複数人が同じキャンバスに描画するための共同編集サーバーとクライアント
+ビットマップではなく描画操作（ストローク・塗りつぶしなど）の差分をやり取りする
+画像の読み込みなど操作として再生できない変化だけはキャンバス全体を送る
+（アンドゥなどの履歴の移動は、変わるピクセルだけの貼り付け操作として送る）
+
+サーバーの起動:
+    python collab.py --host 0.0.0.0 --port 8765
+"""
+
+from typing import List, Optional, Tuple
+import argparse
+import io
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+import zlib
+
+from PIL import Image
+
+import canvas_ops
+
+# フレームの種類
+FRAME_OPERATIONS = 1  # 描画操作のバッチ（zlib圧縮したJSON）
+FRAME_SNAPSHOT = 2    # 参加時や画像の読み込みの後に送るキャンバス全体（PNG）
+
+# フレームのヘッダ: 種類, ペイロード長
+_FRAME_HEADER = struct.Struct(">BI")
+
+DEFAULT_PORT = 8765
+
+
+def encode_operations(operations: List[dict]) -> bytes:
+    """
+    描画操作のバッチをエンコードする
+    ストロークの座標は直前の点との差分にしてから圧縮する
+
+    Args:
+        operations: canvas_ops.apply_operationで再生できる操作のリスト
+
+    Returns:
+        エンコードしたバイト列
+    """
+    compact = []
+    for operation in operations:
+        if operation["op"] == "stroke":
+            deltas = []
+            prev_x, prev_y = 0, 0
+            for x, y in operation["points"]:
+                deltas.extend((x - prev_x, y - prev_y))
+                prev_x, prev_y = x, y
+            operation = {"op": "stroke", "color": operation["color"],
+                         "width": operation["width"], "d": deltas}
+        compact.append(operation)
+    return zlib.compress(json.dumps(compact, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_operations(data: bytes) -> List[dict]:
+    """
+    encode_operationsでエンコードしたバッチを復元する
+
+    Args:
+        data: エンコードされたバイト列
+
+    Returns:
+        描画操作のリスト
+    """
+    operations = []
+    for operation in json.loads(zlib.decompress(data)):
+        if operation["op"] == "stroke":
+            deltas = operation.pop("d")
+            points = []
+            x, y = 0, 0
+            for i in range(0, len(deltas), 2):
+                x += deltas[i]
+                y += deltas[i + 1]
+                points.append((x, y))
+            operation["points"] = points
+        operations.append(operation)
+    return operations
+
+
+def encode_snapshot(image: Image.Image) -> bytes:
+    """
+    キャンバス全体をエンコードする
+
+    Args:
+        image: キャンバスの画像
+
+    Returns:
+        PNGのバイト列
+    """
+    output = io.BytesIO()
+    image.save(output, format="PNG", compress_level=1)
+    return output.getvalue()
+
+
+def decode_snapshot(data: bytes) -> Image.Image:
+    """
+    encode_snapshotでエンコードしたキャンバスを復元する
+
+    Args:
+        data: PNGのバイト列
+
+    Returns:
+        RGBモードのキャンバスの画像
+    """
+    snapshot = Image.open(io.BytesIO(data))
+    snapshot.load()
+    return snapshot.convert("RGB")
+
+
+def coalesce_operations(operations: List[dict]) -> List[dict]:
+    """
+    続けて描かれた同じ色・太さのストロークの断片を1つにまとめる
+
+    Args:
+        operations: 描画操作のリスト
+
+    Returns:
+        まとめた描画操作のリスト
+    """
+    merged: List[dict] = []
+    for operation in operations:
+        if merged and operation["op"] == "stroke" and merged[-1]["op"] == "stroke":
+            last = merged[-1]
+            if (last["color"] == operation["color"] and last["width"] == operation["width"]
+                    and tuple(last["points"][-1]) == tuple(operation["points"][0])):
+                last["points"].extend(operation["points"][1:])
+                continue
+        if operation["op"] == "stroke":
+            operation = dict(operation, points=list(operation["points"]))
+        merged.append(operation)
+    return merged
+
+
+def send_frame(sock: socket.socket, kind: int, payload: bytes) -> None:
+    """
+    フレームを1つ送信する
+    """
+    sock.sendall(_FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    """
+    指定したバイト数を受信する（接続が閉じられた場合はNone）
+    """
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> Optional[Tuple[int, bytes]]:
+    """
+    フレームを1つ受信する
+
+    Returns:
+        (種類, ペイロード)のタプル（接続が閉じられた場合はNone）
+    """
+    header = _recv_exact(sock, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    kind, length = _FRAME_HEADER.unpack(header)
+    payload = _recv_exact(sock, length)
+    if payload is None:
+        return None
+    return kind, payload
+
+
+class _CollabRequestHandler(socketserver.BaseRequestHandler):
+    """
+    クライアント1台分の接続を処理する
+    """
+    def handle(self):
+        server: "CollabServer" = self.server
+        send_lock = threading.Lock()
+        with server.lock:
+            with send_lock:
+                send_frame(self.request, FRAME_SNAPSHOT, encode_snapshot(server.document))
+            server.clients[self.request] = send_lock
+
+        try:
+            while True:
+                frame = recv_frame(self.request)
+                if frame is None:
+                    break
+                kind, payload = frame
+                if kind not in (FRAME_OPERATIONS, FRAME_SNAPSHOT):
+                    continue
+                server.broadcast(self.request, payload, kind)
+        except OSError:
+            pass
+        finally:
+            with server.lock:
+                server.clients.pop(self.request, None)
+
+
+class CollabServer(socketserver.ThreadingTCPServer):
+    """
+    共同編集サーバー
+    受け取った操作やキャンバス全体をサーバー上のキャンバスに反映し、他のクライアントへそのまま中継する
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                 width: int = 800, height: int = 600):
+        """
+        サーバーの初期化
+
+        Args:
+            host: 待ち受けるアドレス
+            port: 待ち受けるポート（0の場合は空いているポート）
+            width: キャンバスの幅
+            height: キャンバスの高さ
+        """
+        super().__init__((host, port), _CollabRequestHandler)
+        self.document = Image.new("RGB", (width, height), "white")
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def broadcast(self, sender: socket.socket, payload: bytes, kind: int = FRAME_OPERATIONS) -> None:
+        """
+        操作をサーバーのキャンバスに適用し、送信元以外のクライアントへ中継する
+        （受信したペイロードを再エンコードせずに転送する）
+
+        Args:
+            sender: 送信元のソケット
+            payload: エンコード済みの操作のバッチ、またはキャンバス全体
+            kind: フレームの種類（FRAME_SNAPSHOTの場合はサーバーのキャンバスを置き換える）
+        """
+        if kind == FRAME_SNAPSHOT:
+            snapshot = decode_snapshot(payload)
+        else:
+            operations = decode_operations(payload)
+        with self.lock:
+            if kind == FRAME_SNAPSHOT:
+                self.document = snapshot
+            else:
+                for operation in operations:
+                    self.document = canvas_ops.apply_operation(self.document, operation)
+            targets = [(sock, lock) for sock, lock in self.clients.items() if sock is not sender]
+            for sock, send_lock in targets:
+                try:
+                    with send_lock:
+                        send_frame(sock, kind, payload)
+                except OSError:
+                    self.clients.pop(sock, None)
+
+    def start_background(self) -> threading.Thread:
+        """
+        別スレッドでサーバーを起動する（テストやアプリへの組み込み用）
+        """
+        thread = threading.Thread(target=self.serve_forever, name="collab-server", daemon=True)
+        thread.start()
+        return thread
+
+
+class CollabClient:
+    """
+    共同編集クライアント
+    送信する操作は一定間隔でまとめて圧縮し、受信した操作はキューに溜めて
+    UIスレッドから取り出す
+    キャンバス全体は{"op": "snapshot", "image": 画像}の操作として送受信する
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, batch_interval: float = 0.03):
+        """
+        クライアントの初期化
+
+        Args:
+            host: サーバーのアドレス
+            port: サーバーのポート
+            batch_interval: 送信する操作をまとめる間隔（秒）
+        """
+        self.host = host
+        self.port = port
+        self.batch_interval = batch_interval
+        self.sock: Optional[socket.socket] = None
+        self.connected = False
+
+        self._outbox: "queue.Queue" = queue.Queue()
+        self._inbox: "queue.Queue" = queue.Queue()
+        self._send_thread: Optional[threading.Thread] = None
+
+    def connect(self, timeout: float = 5.0) -> Image.Image:
+        """
+        サーバーに接続し、現在のキャンバスを受け取る
+
+        Args:
+            timeout: 接続のタイムアウト（秒）
+
+        Returns:
+            サーバー上の現在のキャンバス
+        """
+        self.sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        frame = recv_frame(self.sock)
+        if frame is None or frame[0] != FRAME_SNAPSHOT:
+            raise ConnectionError("サーバーからキャンバスを受信できませんでした")
+        self.sock.settimeout(None)
+
+        self.connected = True
+        threading.Thread(target=self._receive_loop, name="collab-receive", daemon=True).start()
+        self._send_thread = threading.Thread(target=self._send_loop, name="collab-send", daemon=True)
+        self._send_thread.start()
+        return decode_snapshot(frame[1])
+
+    def send(self, operation: dict) -> None:
+        """
+        描画操作を送信キューに積む
+
+        Args:
+            operation: canvas_ops.apply_operationで再生できる操作
+        """
+        if self.connected:
+            self._outbox.put(operation)
+
+    def send_snapshot(self, image: Image.Image) -> None:
+        """
+        操作として再生できない変化の後のキャンバス全体を送信キューに積む
+        （それまでに積んだ操作の後に送られる）
+
+        Args:
+            image: 現在のキャンバス（コピーして送信スレッドに渡す）
+        """
+        if self.connected:
+            self._outbox.put({"op": "snapshot", "image": image.convert("RGB")})
+
+    def receive_operations(self) -> List[dict]:
+        """
+        受信済みの操作を全て取り出す（UIスレッドから呼ぶ）
+
+        Returns:
+            他のクライアントの描画操作のリスト
+        """
+        operations = []
+        while True:
+            try:
+                operations.extend(self._inbox.get_nowait())
+            except queue.Empty:
+                return operations
+
+    def close(self) -> None:
+        """
+        接続を閉じる
+        """
+        if self.sock is None:
+            return
+        # 送信待ちの操作を送り切ってから切断する
+        self._outbox.put(None)
+        if self._send_thread is not None:
+            self._send_thread.join(timeout=1.0)
+        self.connected = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.sock = None
+
+    def _receive_loop(self) -> None:
+        """
+        受信スレッドの処理
+        """
+        try:
+            while self.connected:
+                frame = recv_frame(self.sock)
+                if frame is None:
+                    break
+                kind, payload = frame
+                if kind == FRAME_OPERATIONS:
+                    self._inbox.put(decode_operations(payload))
+                elif kind == FRAME_SNAPSHOT:
+                    self._inbox.put([{"op": "snapshot", "image": decode_snapshot(payload)}])
+        except OSError:
+            pass
+        self.connected = False
+
+    def _send_loop(self) -> None:
+        """
+        送信スレッドの処理
+        最初の操作が届いてからbatch_intervalの間に溜まった操作をまとめて送る
+        """
+        while True:
+            operation = self._outbox.get()
+            if operation is None:
+                return
+            batch = [operation]
+            time.sleep(self.batch_interval)
+            while True:
+                try:
+                    operation = self._outbox.get_nowait()
+                except queue.Empty:
+                    break
+                if operation is None:
+                    self._flush(batch)
+                    return
+                batch.append(operation)
+            self._flush(batch)
+
+    def _flush(self, batch: List[dict]) -> None:
+        """
+        まとめた操作を送信する（キャンバス全体はその前後の操作と分けて順に送る）
+        """
+        try:
+            operations: List[dict] = []
+            for operation in batch:
+                if operation["op"] != "snapshot":
+                    operations.append(operation)
+                    continue
+                if operations:
+                    send_frame(self.sock, FRAME_OPERATIONS, encode_operations(coalesce_operations(operations)))
+                    operations = []
+                send_frame(self.sock, FRAME_SNAPSHOT, encode_snapshot(operation["image"]))
+            if operations:
+                send_frame(self.sock, FRAME_OPERATIONS, encode_operations(coalesce_operations(operations)))
+        except OSError:
+            self.connected = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simple Paint 共同編集サーバー")
+    parser.add_argument("--host", default="0.0.0.0", help="待ち受けるアドレス")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="待ち受けるポート")
+    parser.add_argument("--width", type=int, default=800, help="キャンバスの幅")
+    parser.add_argument("--height", type=int, default=600, help="キャンバスの高さ")
+    args = parser.parse_args()
+
+    server = CollabServer(args.host, args.port, args.width, args.height)
+    print(f"共同編集サーバーを起動しました: {args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
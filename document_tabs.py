@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+1つのウィンドウで複数のドキュメントをタブで開く
+I/O処理用のワーカーは全てのドキュメントで1つを共有し、sketch-rnnのモデルもプロセス内で1つだけ読み込む
+（ドキュメントごとに持つのは描画データ・履歴・ストロークの点などの内容に比例するものだけ）
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+import tkinter as tk
+from tkinter import ttk
+
+from autosave_journal import document_journal_path
+from paint_app import PaintApp
+
+# ドキュメントごとのメモリ上の履歴の上限の既定値
+DEFAULT_HISTORY_BUDGET_BYTES = 64 * 1024 * 1024
+
+
+def next_document_number(used: Iterable[int]) -> int:
+    """
+    開いているドキュメントで使われていない最小の番号（ジャーナルのパスに使う）
+
+    Args:
+        used: 開いているドキュメントの番号
+
+    Returns:
+        1以上の番号
+    """
+    used = set(used)
+    number = 1
+    while number in used:
+        number += 1
+    return number
+
+
+class DocumentTabs:
+    """
+    タブで開いたドキュメント（PaintApp）の管理
+    """
+    def __init__(self, root, render_scale: int = 1,
+                 history_budget_bytes: int = DEFAULT_HISTORY_BUDGET_BYTES,
+                 max_workers: int = 4, autosave: bool = True):
+        """
+        Args:
+            root: tkinterのルートウィンドウ
+            render_scale: 描画データの表示に対する倍率
+            history_budget_bytes: ドキュメントごとのメモリ上の履歴の上限
+            max_workers: 共有するI/O処理用のワーカーのスレッド数
+            autosave: ドキュメントごとに自動保存ジャーナルを書く場合はTrue
+        """
+        self.root = root
+        self.render_scale = render_scale
+        self.history_budget_bytes = history_budget_bytes
+        self.autosave = autosave
+        self.io_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="paint-io")
+        self.documents: Dict[str, Tuple[int, PaintApp]] = {}  # タブのフレーム名 -> (番号, ドキュメント)
+
+        toolbar = tk.Frame(root, bg="#f0f0f0")
+        toolbar.pack(side=tk.TOP, fill=tk.X, padx=10, pady=(5, 0))
+        tk.Button(toolbar, text="新規タブ", bg="#e0e0e0", command=self.new_document).pack(side=tk.LEFT, padx=2)
+        tk.Button(toolbar, text="タブを閉じる", bg="#e0e0e0",
+                  command=self.close_current_document).pack(side=tk.LEFT, padx=2)
+
+        self.notebook = ttk.Notebook(root)
+        self.notebook.pack(expand=tk.YES, fill=tk.BOTH)
+
+        # キーボードショートカットは選択中のドキュメントに振り分ける
+        root.bind("<Control-c>", lambda event: self.dispatch("copy_selection"))
+        root.bind("<Control-x>", lambda event: self.dispatch("cut_selection"))
+        root.bind("<Control-v>", lambda event: self.dispatch("paste_clipboard"))
+        root.bind("<Escape>", lambda event: self.dispatch("release_selection"))
+        root.bind("<Control-t>", lambda event: self.new_document())
+        root.bind("<Control-w>", lambda event: self.close_current_document())
+        root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    @property
+    def current(self) -> Optional[PaintApp]:
+        """
+        選択中のタブのドキュメント
+        """
+        selected = self.notebook.select()
+        document = self.documents.get(str(selected))
+        return document[1] if document else None
+
+    def new_document(self, number: Optional[int] = None, recover: bool = False) -> PaintApp:
+        """
+        新しいタブでドキュメントを開く
+
+        Args:
+            number: ドキュメントの番号（Noneの場合は空いている最小の番号）
+            recover: 番号に対応するジャーナルから復旧する場合はTrue
+
+        Returns:
+            開いたドキュメント
+        """
+        if number is None:
+            number = next_document_number(number for number, _ in self.documents.values())
+        frame = tk.Frame(self.notebook)
+        app = PaintApp(frame, render_scale=self.render_scale, io_executor=self.io_executor,
+                       history_budget_bytes=self.history_budget_bytes)
+        self.documents[str(frame)] = (number, app)
+        self.notebook.add(frame, text=f"無題 {number}")
+        self.notebook.select(frame)
+        if self.autosave:
+            app.start_autosave(document_journal_path(number), recover=recover)
+        return app
+
+    def close_current_document(self) -> None:
+        """
+        選択中のタブのドキュメントを閉じる（最後のタブを閉じた場合は空のドキュメントを開く）
+        """
+        selected = str(self.notebook.select())
+        if selected not in self.documents:
+            return
+        _, app = self.documents.pop(selected)
+        app.close()
+        frame = self.notebook.nametowidget(selected)
+        self.notebook.forget(frame)
+        frame.destroy()
+        if not self.documents:
+            self.new_document()
+
+    def dispatch(self, method: str) -> None:
+        """
+        選択中のドキュメントのメソッドを呼び出す
+
+        Args:
+            method: メソッド名
+        """
+        app = self.current
+        if app is not None:
+            getattr(app, method)()
+
+    def on_close(self) -> None:
+        """
+        ウィンドウを閉じる時の処理（全てのドキュメントを閉じてから共有のワーカーを止める）
+        """
+        for _, app in self.documents.values():
+            app.close()
+        self.documents = {}
+        self.io_executor.shutdown(wait=False)
+        self.root.destroy()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+UIを持たないPaintAppの描画処理
+PaintAppと同じイベントハンドラ（start_draw, draw, stop_drawなど）を持ち、
+描画データと履歴だけを更新する。操作記録の再生やベンチマークに使う
+"""
+
+from PIL import Image, ImageDraw
+
+import brush_engine
+import canvas_ops
+import selection_ops
+from history_store import HistoryStore
+from stroke_simplifier import StrokeSimplifier
+
+
+class HeadlessPaint:
+    """
+    Tkinterを使わないPaintAppの代替
+    """
+    def __init__(self, width: int = 800, height: int = 600):
+        """
+        初期化
+
+        Args:
+            width: キャンバスの幅
+            height: キャンバスの高さ
+        """
+        self.canvas_width = width
+        self.canvas_height = height
+
+        self.current_color = "#000000"
+        self.brush_size = 3
+        self.brush_type = "line"
+        self.velocity_width = False
+        self.velocity_opacity = False
+        self.tool = "pen"
+
+        self.drawing_data = Image.new("RGB", (self.canvas_width, self.canvas_height), "white")
+        self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+
+        self.prev_x = None
+        self.prev_y = None
+        self.shape_start = None
+        self.brush_stroke = None
+        self.dab_cache = brush_engine.DabCache()
+        self.simplify_strokes = True
+        self.stroke_simplifier = StrokeSimplifier()
+
+        # 選択範囲（PaintAppと同じく、移動中・貼り付け中のピクセルは確定するまで描画データに書き込まない）
+        self.selection = None
+        self.selection_points = []
+        self.selection_drag = None
+        self.clipboard = None
+        self.floating_clip = None
+        self.floating_regions = []
+
+        self.history = HistoryStore()
+        self.save_state()
+
+    def start_draw(self, event) -> None:
+        """
+        描画開始時の処理（PaintApp.start_drawと同じ）
+
+        Args:
+            event: x, y属性（とイベントの時刻のtime属性）を持つイベント
+        """
+        if self.tool in selection_ops.SELECTION_TOOLS:
+            self.start_selection(event.x, event.y)
+            return
+        self.commit_selection()
+
+        if self.tool == "fill":
+            self.flood_fill(event.x, event.y)
+        elif self.tool in canvas_ops.SHAPES:
+            self.shape_start = (max(0, min(event.x, self.canvas_width - 1)),
+                                max(0, min(event.y, self.canvas_height - 1)))
+        else:
+            self.prev_x = max(0, min(event.x, self.canvas_width - 1))
+            self.prev_y = max(0, min(event.y, self.canvas_height - 1))
+            time_ms = getattr(event, "time", None)
+            if self.tool == "pen" and self.brush_type != "line":
+                self.drawing_data, ink = canvas_ops.prepare_ink(self.drawing_data, self.current_color)
+                self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+                self.brush_stroke = brush_engine.BrushStroke(
+                    self.drawing_data.size, self.current_color, self.brush_size, self.brush_type == "soft",
+                    cache=self.dab_cache, ink=ink if self.drawing_data.mode == "P" else None,
+                    velocity_width=self.velocity_width, velocity_opacity=self.velocity_opacity)
+                self.brush_stroke.add_point(self.prev_x, self.prev_y, time_ms)
+            if self.simplify_strokes:
+                self.stroke_simplifier.start(self.prev_x, self.prev_y, time_ms)
+
+    def draw(self, event) -> None:
+        """
+        描画中の処理（PaintApp.drawと同じ）
+
+        Args:
+            event: x, y属性（とイベントの時刻のtime属性）を持つイベント
+        """
+        if self.tool in selection_ops.SELECTION_TOOLS:
+            self.update_selection(event.x, event.y)
+            return
+        if self.prev_x and self.prev_y:
+            x = max(0, min(event.x, self.canvas_width - 1))
+            y = max(0, min(event.y, self.canvas_height - 1))
+            time_ms = getattr(event, "time", None)
+            if self.stroke_simplifier.anchor is None:
+                self.draw_stroke_point(x, y, time_ms)
+                return
+            point = self.stroke_simplifier.add(x, y, time_ms)
+            if point is not None:
+                self.draw_stroke_point(*point)
+
+    def draw_stroke_point(self, x, y, time_ms=None) -> None:
+        """
+        ストロークの確定した点までを描画する（PaintApp.draw_stroke_pointと同じ）
+        """
+        if self.brush_stroke is not None:
+            # 合成はPaintAppのアイドル時と同様にまとめて行う
+            self.brush_stroke.add_point(x, y, time_ms)
+        elif self.tool in ("pen", "eraser"):
+            color = self.current_color if self.tool == "pen" else "white"
+            self.drawing_data_draw.line((self.prev_x, self.prev_y, x, y), fill=color, width=self.brush_size)
+        self.prev_x = x
+        self.prev_y = y
+
+    def stop_draw(self, event) -> None:
+        """
+        描画終了時の処理（PaintApp.stop_drawと同じ）
+
+        Args:
+            event: x, y属性を持つイベント
+        """
+        if self.stroke_simplifier.anchor is not None:
+            point = self.stroke_simplifier.finish()
+            if point is not None and self.prev_x is not None:
+                self.draw_stroke_point(*point)
+        self.prev_x = None
+        self.prev_y = None
+        if self.tool in selection_ops.SELECTION_TOOLS:
+            self.finish_selection()
+            return
+        if self.brush_stroke is not None:
+            self.brush_stroke.flush(self.drawing_data)
+            self.brush_stroke = None
+        if self.tool in canvas_ops.SHAPES:
+            self.finish_shape(event.x, event.y)
+        elif self.tool != "fill":
+            self.save_state()
+
+    def finish_shape(self, x: int, y: int) -> None:
+        """
+        図形を描画して外接矩形だけを履歴に記録する（PaintApp.finish_shapeと同じ）
+        """
+        if self.shape_start is None:
+            return
+        start = self.shape_start
+        self.shape_start = None
+        end = (max(0, min(x, self.canvas_width - 1)), max(0, min(y, self.canvas_height - 1)))
+        if end == start:
+            return
+        points = [start, end]
+        box = canvas_ops.shape_bounds(points, self.brush_size, (self.canvas_width, self.canvas_height))
+        self.drawing_data, ink = canvas_ops.prepare_ink(self.drawing_data, self.current_color)
+        self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+        before = self.drawing_data.crop(box)
+        canvas_ops.draw_shape(self.drawing_data_draw, self.tool, points, ink, self.brush_size)
+        self.history.push_patch(self.drawing_data, [(box, before, self.drawing_data.crop(box))])
+
+    def start_selection(self, x: int, y: int) -> None:
+        """
+        選択範囲の作成、または選択範囲の移動を開始する（PaintApp.start_selectionと同じ）
+        """
+        x = max(0, min(x, self.canvas_width - 1))
+        y = max(0, min(y, self.canvas_height - 1))
+        if self.floating_clip and self.floating_clip.contains(x, y):
+            self.selection_drag = (x, y)
+            return
+        if self.selection and self.selection.contains(x, y):
+            self.lift_selection()
+            self.selection_drag = (x, y)
+            return
+        self.commit_selection()
+        self.selection_points = [(x, y)]
+
+    def update_selection(self, x: int, y: int) -> None:
+        """
+        ドラッグ中の選択範囲、または移動中のピクセルの位置を更新する（PaintApp.update_selectionと同じ）
+        """
+        x = max(0, min(x, self.canvas_width - 1))
+        y = max(0, min(y, self.canvas_height - 1))
+        if self.selection_drag:
+            self.floating_clip.x += x - self.selection_drag[0]
+            self.floating_clip.y += y - self.selection_drag[1]
+            self.selection_drag = (x, y)
+        elif self.selection_points:
+            if self.tool == "select":
+                self.selection_points[1:] = [(x, y)]
+            else:
+                self.selection_points.append((x, y))
+
+    def finish_selection(self) -> None:
+        """
+        ドラッグを終えて選択範囲を確定する（PaintApp.finish_selectionと同じ）
+        """
+        if self.selection_drag:
+            self.selection_drag = None
+            return
+        points = self.selection_points
+        self.selection_points = []
+        if len(points) < 2:
+            return
+        size = (self.canvas_width, self.canvas_height)
+        if self.tool == "select":
+            (x0, y0), (x1, y1) = points[0], points[-1]
+            self.selection = selection_ops.Selection.rectangle(x0, y0, x1, y1, size)
+        else:
+            self.selection = selection_ops.Selection.lasso(points, size)
+
+    def lift_selection(self) -> None:
+        """
+        選択範囲のピクセルを持ち上げる（PaintApp.lift_selectionと同じ）
+        """
+        box = self.selection.box
+        before = self.drawing_data.crop(box)
+        self.drawing_data, self.floating_clip = selection_ops.lift_region(self.drawing_data, self.selection)
+        self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+        self.floating_regions = [(box, before, self.drawing_data.crop(box))]
+        self.selection = None
+
+    def commit_selection(self) -> None:
+        """
+        移動中・貼り付け中のピクセルを確定し、選択を解除する（PaintApp.commit_selectionと同じ）
+        """
+        clip = self.floating_clip
+        if clip:
+            self.floating_clip = None
+            regions = self.floating_regions
+            box = selection_ops.clip_box(clip.box, (self.canvas_width, self.canvas_height))
+            if box:
+                before = self.drawing_data.crop(box)
+                self.drawing_data, _ = selection_ops.paste_clip(self.drawing_data, clip)
+                self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+                regions = regions + [(box, before, self.drawing_data.crop(box))]
+            if regions:
+                self.history.push_patch(self.drawing_data, regions)
+            self.floating_regions = []
+        self.selection = None
+        self.selection_drag = None
+
+    def release_selection(self) -> None:
+        self.commit_selection()
+
+    def copy_selection(self) -> None:
+        """
+        選択範囲をクリップボードにコピーする（PaintApp.copy_selectionと同じ）
+        """
+        if self.floating_clip:
+            self.clipboard = self.floating_clip
+        elif self.selection:
+            self.clipboard = selection_ops.copy_region(self.drawing_data, self.selection)
+
+    def cut_selection(self) -> None:
+        """
+        選択範囲をクリップボードにコピーして白で消去する（PaintApp.cut_selectionと同じ）
+        """
+        if self.floating_clip:
+            self.clipboard = self.floating_clip
+            self.floating_clip = None
+            if self.floating_regions:
+                self.history.push_patch(self.drawing_data, self.floating_regions)
+            self.floating_regions = []
+        elif self.selection:
+            box = self.selection.box
+            before = self.drawing_data.crop(box)
+            self.clipboard = selection_ops.copy_region(self.drawing_data, self.selection)
+            self.drawing_data = selection_ops.erase_region(self.drawing_data, self.selection)
+            self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+            self.history.push_patch(self.drawing_data, [(box, before, self.drawing_data.crop(box))])
+        else:
+            return
+        self.selection = None
+
+    def paste_clipboard(self) -> None:
+        """
+        クリップボードのピクセルをコピー元の位置に貼り付ける（PaintApp.paste_clipboardと同じ）
+        """
+        if not self.clipboard:
+            return
+        if self.tool not in selection_ops.SELECTION_TOOLS:
+            self.change_tool("select")
+        self.commit_selection()
+        clip = self.clipboard
+        self.floating_clip = selection_ops.Clip(clip.pixels, clip.mask, clip.mode, clip.palette, clip.x, clip.y)
+        self.floating_regions = []
+
+    def change_tool(self, tool: str) -> None:
+        # 選択ツール以外に切り替えたら、移動中・貼り付け中の選択範囲を確定する（PaintAppと同じ）
+        if tool not in selection_ops.SELECTION_TOOLS:
+            self.commit_selection()
+        self.tool = tool
+
+    def set_color(self, color: str) -> None:
+        self.current_color = color
+
+    def change_brush_size(self, size) -> None:
+        self.brush_size = int(size)
+
+    @property
+    def stroke_width(self) -> int:
+        """
+        描画データに描く線の太さ（PaintAppと異なり倍率は常に1）
+        """
+        return self.brush_size
+
+    def set_brush(self, brush_type: str) -> None:
+        self.brush_type = brush_type
+
+    def set_velocity_dynamics(self, velocity_width: bool, velocity_opacity: bool) -> None:
+        self.velocity_width = velocity_width
+        self.velocity_opacity = velocity_opacity
+
+    def set_simplify_strokes(self, simplify: bool) -> None:
+        self.simplify_strokes = simplify
+
+    def flood_fill(self, x: int, y: int) -> None:
+        """
+        塗りつぶし（PaintApp.flood_fillと同じ）
+        """
+        x = max(0, min(x, self.canvas_width - 1))
+        y = max(0, min(y, self.canvas_height - 1))
+        if canvas_ops.flood_fill(self.drawing_data, x, y, canvas_ops.hex_to_rgb(self.current_color)):
+            self.save_state()
+
+    def save_state(self) -> None:
+        self.history.push(self.drawing_data)
+
+    def undo(self) -> None:
+        self.commit_selection()
+        state = self.history.undo(self.drawing_data)
+        if state is not None:
+            self.drawing_data = state
+            self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+
+    def redo(self) -> None:
+        self.commit_selection()
+        state = self.history.redo(self.drawing_data)
+        if state is not None:
+            self.drawing_data = state
+            self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+
+    def jump_to_history(self, index: int) -> None:
+        self.commit_selection()
+        state = self.history.jump(index, self.drawing_data)
+        if state is not None:
+            self.drawing_data = state
+            self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
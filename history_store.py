@@ -0,0 +1,603 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+アンドゥ/リドゥ用の履歴ストア
+履歴の件数ではなくメモリ使用量（バイト数）で管理し、
+古い履歴は圧縮した上で一時ファイルへ退避する
+選択範囲の移動などキャンバスの一部だけを書き換える操作は、変更した矩形の前後だけを保持する
+"""
+
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Sequence, Tuple
+import tempfile
+import zlib
+
+from PIL import Image, ImageChops
+
+
+Box = Tuple[int, int, int, int]
+
+
+class _HistoryEntry:
+    """
+    履歴1件分のデータ
+    生の画像・圧縮済みバイト列・一時ファイル上の位置のいずれかで保持する
+    部分的な変更の場合、imageは変更した矩形の変更前と変更後を縦に並べた画像になる
+    """
+    __slots__ = ("mode", "size", "palette", "image", "data", "offset", "length", "patches", "canvas_size",
+                 "serial")
+
+    def __init__(self, image: Image.Image, patches: Optional[List[Tuple[Box, int]]] = None,
+                 canvas_size: Optional[Tuple[int, int]] = None):
+        self.mode = image.mode
+        self.size = image.size
+        # インデックスカラーの場合は圧縮時にパレットが失われないよう保持する
+        self.palette = image.getpalette() if image.mode == "P" else None
+        self.image: Optional[Image.Image] = image
+        self.data: Optional[bytes] = None
+        self.offset: Optional[int] = None
+        self.length = 0
+        # 部分的な変更の場合の(矩形, 画像内の変更前の位置)のリストとキャンバスのサイズ
+        self.patches = patches
+        self.canvas_size = canvas_size
+        # 履歴の先頭が破棄されても変わらない通し番号（サムネイルのキャッシュのキーに使う）
+        self.serial = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        """
+        メモリ上で占有しているおおよそのバイト数
+        """
+        if self.image is not None:
+            return self.image.width * self.image.height * len(self.image.getbands())
+        if self.data is not None:
+            return len(self.data)
+        return 0
+
+    @property
+    def on_disk(self) -> bool:
+        return self.image is None and self.data is None
+
+
+class EntrySnapshot:
+    """
+    履歴1件分の参照のスナップショット
+    履歴ストアはスレッドセーフではないため、ワーカースレッドで状態を組み立てる場合はこれを渡す
+    （保持する画像とバイト列は履歴ストアが書き換えないため共有してよい）
+    """
+    __slots__ = ("serial", "mode", "size", "palette", "image", "data", "patches")
+
+    def __init__(self, entry: _HistoryEntry, data: Optional[bytes]):
+        self.serial = entry.serial
+        self.mode = entry.mode
+        self.size = entry.size
+        self.palette = entry.palette
+        self.image = entry.image
+        self.data = data
+        self.patches = entry.patches
+
+
+def _decode(mode: str, size: Tuple[int, int], palette: Optional[list], data: bytes) -> Image.Image:
+    """
+    圧縮済みのバイト列から画像を復元する
+    """
+    image = Image.frombytes(mode, size, zlib.decompress(data))
+    if palette is not None:
+        image.putpalette(palette)
+    return image
+
+
+def _overlap(a: Box, b: Box) -> Optional[Box]:
+    """
+    2つの矩形の重なり（重ならない場合はNone）
+    """
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return None
+    return box
+
+
+def _paste_patches(packed: Image.Image, patches: List[Tuple[Box, int]], image: Image.Image,
+                   before: bool) -> Image.Image:
+    """
+    部分的な変更を描画データに貼り付ける
+
+    Args:
+        packed: 変更した矩形の変更前と変更後を縦に並べた画像
+        patches: (矩形, 画像内の変更前の位置)のリスト
+        image: 適用先の描画データ（その場で書き換える）
+        before: 変更前に戻す場合はTrue、変更後にする場合はFalse
+
+    Returns:
+        適用後の描画データ
+    """
+    if packed.mode != image.mode and image.mode == "P":
+        image = image.convert("RGB")
+    for box, top in (reversed(patches) if before else patches):
+        width, height = box[2] - box[0], box[3] - box[1]
+        y = top if before else top + height
+        image.paste(packed.crop((0, y, width, y + height)), box[:2])
+    return image
+
+
+def iter_snapshot_states(snapshots: Sequence[EntrySnapshot]) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    スナップショットから各状態を先頭から順に組み立てる（ワーカースレッドから呼んでよい）
+
+    Args:
+        snapshots: HistoryStore.snapshotの戻り値（先頭は全体の状態）
+
+    Yields:
+        (通し番号, 状態の画像)のタプル（画像は次の状態の組み立てで書き換えられるため、必要ならコピーする）
+    """
+    image = None
+    for snapshot in snapshots:
+        packed = snapshot.image
+        if packed is None:
+            packed = _decode(snapshot.mode, snapshot.size, snapshot.palette, snapshot.data)
+        if snapshot.patches is None:
+            image = packed.copy()
+        else:
+            image = _paste_patches(packed, snapshot.patches, image, before=False)
+        yield snapshot.serial, image
+
+
+class HistoryStore:
+    """
+    メモリ予算付きの操作履歴
+    予算を超えると最近使われていない履歴から順に圧縮し、
+    それでも超える場合は圧縮済みデータを一時ファイルへ退避する
+    """
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024, max_disk_bytes: int = 1024 * 1024 * 1024,
+                 compress_level: int = 1):
+        """
+        履歴ストアの初期化
+
+        Args:
+            max_bytes: メモリ上に保持する履歴の上限バイト数
+            max_disk_bytes: 一時ファイルに退避する履歴の上限バイト数（超えた場合は古い履歴から破棄）
+            compress_level: zlibの圧縮レベル (1〜9)
+        """
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.compress_level = compress_level
+        self.entries: List[_HistoryEntry] = []
+        self.index = -1
+        self._next_serial = 0
+
+        # 生の画像で保持している履歴（最近使われた順）
+        self._lru: "OrderedDict[int, _HistoryEntry]" = OrderedDict()
+
+        # 退避用の一時ファイル（必要になるまで作成しない）
+        self._spill_file = None
+        self._spill_end = 0
+        self._spill_live = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def can_undo(self) -> bool:
+        return self.index > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self.index < len(self.entries) - 1
+
+    @property
+    def serials(self) -> List[int]:
+        """
+        各履歴の通し番号
+        """
+        return [entry.serial for entry in self.entries]
+
+    @property
+    def memory_bytes(self) -> int:
+        """
+        メモリ上の履歴の合計バイト数
+        """
+        return sum(entry.memory_bytes for entry in self.entries)
+
+    @property
+    def disk_bytes(self) -> int:
+        """
+        一時ファイルに退避している履歴の合計バイト数
+        """
+        return self._spill_live
+
+    def push(self, image: Image.Image) -> None:
+        """
+        新しい状態を履歴に追加する
+        現在位置より後の履歴（リドゥ分）は破棄される
+
+        Args:
+            image: 保存する画像（コピーして保持する）
+        """
+        self._append(_HistoryEntry(image.copy()))
+
+    def push_patch(self, image: Image.Image, regions: Sequence[Tuple[Box, Image.Image, Image.Image]]) -> None:
+        """
+        キャンバスの一部だけを書き換えた状態を履歴に追加する
+        描画データ全体ではなく、変更した矩形の変更前と変更後だけを保持する
+
+        Args:
+            image: 変更後の描画データ
+            regions: 適用順の(矩形, 変更前の画像, 変更後の画像)のリスト
+        """
+        # 変更前が現在位置の状態と一致しない場合（サイズの変更・履歴に記録しない変更の後など）は全体を保持する
+        if not self.entries or not regions or not self._matches_current(image.size, regions):
+            self.push(image)
+            return
+
+        # 全てインデックスカラーの場合だけPモードのまま保持する（パレットは後から追加されるだけ）
+        mode = "P" if all(before.mode == after.mode == "P" for _, before, after in regions) else "RGB"
+        width = max(box[2] - box[0] for box, _, _ in regions)
+        height = sum(2 * (box[3] - box[1]) for box, _, _ in regions)
+        packed = Image.new(mode, (width, height))
+        if mode == "P":
+            packed.putpalette(regions[-1][2].getpalette())
+
+        patches = []
+        top = 0
+        for box, before, after in regions:
+            region_height = box[3] - box[1]
+            packed.paste(before.convert(mode) if before.mode != mode else before, (0, top))
+            packed.paste(after.convert(mode) if after.mode != mode else after, (0, top + region_height))
+            patches.append((tuple(box), top))
+            top += 2 * region_height
+
+        self._append(_HistoryEntry(packed, patches, image.size))
+
+    def _matches_current(self, size: Tuple[int, int], regions: Sequence[Tuple[Box, Image.Image, Image.Image]]) -> bool:
+        """
+        部分的な変更の変更前が現在位置の状態と一致するかどうか
+        （部分的な変更は直前の状態に適用するため、一致しない場合は全体の状態として記録する必要がある）
+
+        Args:
+            size: 変更後の描画データのサイズ
+            regions: 適用順の(矩形, 変更前の画像, 変更後の画像)のリスト
+
+        Returns:
+            一致する場合はTrue
+        """
+        entry = self.entries[self.index]
+        if (entry.canvas_size if entry.patches is not None else entry.size) != size:
+            return False
+        checked: List[Box] = []
+        for box, before, _ in regions:
+            # 先に適用する矩形と重なる場合は、その変更後が変更前になるため比べない
+            if any(_overlap(box, other) for other in checked):
+                continue
+            checked.append(box)
+            current = self._region_state(self.index, box)
+            if ImageChops.difference(current.convert("RGB"), before.convert("RGB")).getbbox() is not None:
+                return False
+        return True
+
+    def _region_state(self, index: int, box: Box) -> Image.Image:
+        """
+        指定位置の状態の矩形だけを組み立てる（全体の状態は組み立てない）
+        """
+        base = index
+        while self.entries[base].patches is not None:
+            base -= 1
+        region = self._entry_image(self.entries[base]).crop(box)
+        for position in range(base + 1, index + 1):
+            entry = self.entries[position]
+            packed = self._entry_image(entry)
+            if packed.mode != region.mode and region.mode == "P":
+                region = region.convert("RGB")
+            for patch_box, top in entry.patches:
+                overlap = _overlap(box, patch_box)
+                if overlap is None:
+                    continue
+                # 変更後は変更前の下に並んでいる
+                y = top + patch_box[3] - patch_box[1]
+                region.paste(packed.crop((overlap[0] - patch_box[0], y + overlap[1] - patch_box[1],
+                                          overlap[2] - patch_box[0], y + overlap[3] - patch_box[1])),
+                             (overlap[0] - box[0], overlap[1] - box[1]))
+        return region
+
+    def _discard_redo(self) -> None:
+        """
+        現在位置より後の履歴（リドゥ分）を破棄する
+        """
+        if self.index < len(self.entries) - 1:
+            for entry in self.entries[self.index + 1:]:
+                self._discard(entry)
+            del self.entries[self.index + 1:]
+
+    def _append(self, entry: _HistoryEntry) -> None:
+        """
+        履歴の末尾に追加して現在位置にする
+        """
+        self._discard_redo()
+        entry.serial = self._next_serial
+        self._next_serial += 1
+        self.entries.append(entry)
+        self.index = len(self.entries) - 1
+        self._touch(entry)
+        self._enforce_budget()
+
+    def undo(self, current: Optional[Image.Image] = None) -> Optional[Image.Image]:
+        """
+        1つ前の状態を返す
+
+        Args:
+            current: 現在の描画データ（部分的な変更は、渡された場合その矩形だけを書き戻す）
+
+        Returns:
+            1つ前の状態の画像（戻れない場合はNone）
+        """
+        if not self.can_undo:
+            return None
+        return self.jump(self.index - 1, current)
+
+    def redo(self, current: Optional[Image.Image] = None) -> Optional[Image.Image]:
+        """
+        1つ後の状態を返す
+
+        Args:
+            current: 現在の描画データ（部分的な変更は、渡された場合その矩形だけを書き換える）
+
+        Returns:
+            1つ後の状態の画像（進めない場合はNone）
+        """
+        if not self.can_redo:
+            return None
+        return self.jump(self.index + 1, current)
+
+    def jump(self, index: int, current: Optional[Image.Image] = None) -> Optional[Image.Image]:
+        """
+        指定位置の状態に直接移動する（間の状態は組み立てない）
+
+        Args:
+            index: 移動先の履歴の位置
+            current: 現在の描画データ（間の履歴が全て部分的な変更なら、その矩形だけを順に書き換える）
+
+        Returns:
+            移動先の状態の画像（移動できない場合はNone）
+        """
+        if not 0 <= index < len(self.entries) or index == self.index:
+            return None
+        backward = index < self.index
+        path = range(self.index, index, -1) if backward else range(self.index + 1, index + 1)
+        in_place = current is not None and all(
+            self.entries[position].patches is not None and self.entries[position].canvas_size == current.size
+            for position in path)
+        self.index = index
+        if not in_place:
+            return self.get(index)
+        for position in path:
+            current = self._apply_patches(self.entries[position], current, before=backward)
+        self._enforce_budget()
+        return current
+
+    def snapshot(self, start: int = 0) -> List[EntrySnapshot]:
+        """
+        指定位置以降の状態をワーカースレッドで組み立てるためのスナップショット
+        指定位置が部分的な変更の場合は、直前の全体の状態から含める
+
+        Args:
+            start: 最初に必要な履歴の位置
+
+        Returns:
+            EntrySnapshotのリスト（iter_snapshot_statesに渡す）
+        """
+        while start > 0 and self.entries[start].patches is not None:
+            start -= 1
+        snapshots = []
+        for entry in self.entries[start:]:
+            data = entry.data
+            if entry.image is None and data is None:
+                # 一時ファイルはこのスレッドで読んでおく
+                self._spill_file.seek(entry.offset)
+                data = self._spill_file.read(entry.length)
+            snapshots.append(EntrySnapshot(entry, data))
+        return snapshots
+
+    def get(self, index: int) -> Image.Image:
+        """
+        指定位置の状態を取り出す（圧縮・退避されている場合は透過的に展開する）
+
+        Args:
+            index: 履歴の位置
+
+        Returns:
+            状態の画像のコピー
+        """
+        image = self._state(index)
+        self._enforce_budget()
+        return image
+
+    def _state(self, index: int) -> Image.Image:
+        """
+        指定位置の状態を組み立てる（メモリ予算の調整は呼び出し側で行う）
+        """
+        # 部分的な変更の場合は直前の全体の状態から変更を順に適用する
+        base = index
+        while self.entries[base].patches is not None:
+            base -= 1
+        image = self._entry_image(self.entries[base]).copy()
+        for position in range(base + 1, index + 1):
+            image = self._apply_patches(self.entries[position], image, before=False)
+        return image
+
+    def _entry_image(self, entry: _HistoryEntry) -> Image.Image:
+        """
+        履歴の画像を取り出す（コピーはしない）
+        """
+        if entry.image is None:
+            entry.image = self._restore(entry)
+            self._release_compressed(entry)
+        self._touch(entry)
+        return entry.image
+
+    def _apply_patches(self, entry: _HistoryEntry, image: Image.Image, before: bool) -> Image.Image:
+        """
+        部分的な変更の履歴を描画データに適用する
+
+        Args:
+            entry: 部分的な変更の履歴
+            image: 適用先の描画データ（その場で書き換える）
+            before: 変更前に戻す場合はTrue、変更後にする場合はFalse
+
+        Returns:
+            適用後の描画データ
+        """
+        return _paste_patches(self._entry_image(entry), entry.patches, image, before)
+
+    def clear(self) -> None:
+        """
+        全ての履歴を破棄する
+        """
+        for entry in self.entries:
+            self._discard(entry)
+        self.entries = []
+        self.index = -1
+        self._reset_spill_file()
+
+    def close(self) -> None:
+        """
+        履歴を破棄して一時ファイルを閉じる
+        """
+        self.clear()
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def _touch(self, entry: _HistoryEntry) -> None:
+        """
+        生の画像で保持している履歴を最近使われたものとして記録
+        """
+        self._lru[id(entry)] = entry
+        self._lru.move_to_end(id(entry))
+
+    def _enforce_budget(self) -> None:
+        """
+        メモリ予算を超えている間、古い履歴を圧縮・退避する
+        """
+        current = self.entries[self.index] if self.entries else None
+        total = self.memory_bytes
+
+        # まず最近使われていない生の画像を圧縮
+        while total > self.max_bytes:
+            victim = next((e for e in self._lru.values() if e is not current), None)
+            if victim is None:
+                break
+            before = victim.memory_bytes
+            self._compress(victim)
+            total -= before - victim.memory_bytes
+
+        # それでも超える場合は圧縮済みデータを古い順に一時ファイルへ退避
+        if total > self.max_bytes:
+            for entry in self.entries:
+                if total <= self.max_bytes:
+                    break
+                if entry.data is not None:
+                    total -= len(entry.data)
+                    self._spill(entry)
+
+        # 一時ファイルの上限を超えた場合は最も古い履歴から破棄
+        while self._spill_live > self.max_disk_bytes and self.index > 0:
+            # 先頭は常に全体の状態にする（部分的な変更は直前の状態がないと復元できない）
+            if self.entries[1].patches is not None:
+                self._materialize(1)
+            self._discard(self.entries.pop(0))
+            self.index -= 1
+
+        if self._spill_live == 0:
+            self._reset_spill_file()
+        elif self._spill_end > 2 * self._spill_live:
+            self._compact_spill_file()
+
+    def _materialize(self, index: int) -> None:
+        """
+        部分的な変更の履歴を全体の状態に置き換える
+        """
+        image = self._state(index)
+        serial = self.entries[index].serial
+        self._discard(self.entries[index])
+        self.entries[index] = _HistoryEntry(image)
+        self.entries[index].serial = serial
+        self._compress(self.entries[index])
+
+    def _compress(self, entry: _HistoryEntry) -> None:
+        """
+        生の画像をzlibで圧縮して保持する
+        """
+        entry.data = zlib.compress(entry.image.tobytes(), self.compress_level)
+        entry.image = None
+        self._lru.pop(id(entry), None)
+
+    def _spill(self, entry: _HistoryEntry) -> None:
+        """
+        圧縮済みデータを一時ファイルへ書き出す
+        """
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix="simple_paint_history_")
+        self._spill_file.seek(self._spill_end)
+        self._spill_file.write(entry.data)
+        entry.offset = self._spill_end
+        entry.length = len(entry.data)
+        entry.data = None
+        self._spill_end += entry.length
+        self._spill_live += entry.length
+
+    def _restore(self, entry: _HistoryEntry) -> Image.Image:
+        """
+        圧縮済み・退避済みの履歴から画像を復元する
+        """
+        data = entry.data
+        if data is None:
+            self._spill_file.seek(entry.offset)
+            data = self._spill_file.read(entry.length)
+        return _decode(entry.mode, entry.size, entry.palette, data)
+
+    def _release_compressed(self, entry: _HistoryEntry) -> None:
+        """
+        展開済みの履歴から圧縮データと一時ファイル上の領域を解放する
+        """
+        entry.data = None
+        if entry.offset is not None:
+            self._spill_live -= entry.length
+            entry.offset = None
+            entry.length = 0
+
+    def _discard(self, entry: _HistoryEntry) -> None:
+        """
+        履歴を破棄する
+        """
+        self._lru.pop(id(entry), None)
+        self._release_compressed(entry)
+        entry.image = None
+
+    def _reset_spill_file(self) -> None:
+        """
+        一時ファイルに有効なデータがなくなったら先頭から再利用する
+        """
+        self._spill_end = 0
+        self._spill_live = 0
+        if self._spill_file is not None:
+            self._spill_file.truncate(0)
+
+    def _compact_spill_file(self) -> None:
+        """
+        一時ファイル上の不要な領域を詰める
+        """
+        # オフセット順に前方へ詰めるため、未読の領域を上書きすることはない
+        spilled = sorted((entry for entry in self.entries if entry.offset is not None),
+                         key=lambda entry: entry.offset)
+        offset = 0
+        for entry in spilled:
+            if entry.offset != offset:
+                self._spill_file.seek(entry.offset)
+                chunk = self._spill_file.read(entry.length)
+                self._spill_file.seek(offset)
+                self._spill_file.write(chunk)
+                entry.offset = offset
+            offset += entry.length
+        self._spill_file.truncate(offset)
+        self._spill_end = offset
+        self._spill_live = offset
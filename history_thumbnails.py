@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+履歴パネル用のサムネイル
+履歴のスナップショットからワーカースレッドで状態を順に組み立てて縮小し、通し番号ごとにキャッシュする
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from history_store import EntrySnapshot, iter_snapshot_states
+
+# サムネイルの最大サイズ
+THUMBNAIL_SIZE = (96, 72)
+
+
+def make_thumbnail(image: Image.Image, size: Tuple[int, int] = THUMBNAIL_SIZE) -> Image.Image:
+    """
+    縦横比を保ったまま縮小したRGBの画像を作成する（元の画像は書き換えない）
+
+    Args:
+        image: 元の画像
+        size: 最大の幅と高さ
+
+    Returns:
+        縮小した画像
+    """
+    scale = min(size[0] / image.width, size[1] / image.height, 1.0)
+    width, height = max(1, round(image.width * scale)), max(1, round(image.height * scale))
+    rgb = image if image.mode == "RGB" else image.convert("RGB")
+    return rgb.resize((width, height), Image.BILINEAR, reducing_gap=2.0)
+
+
+def render_thumbnails(snapshots: Sequence[EntrySnapshot], wanted: Iterable[int],
+                      size: Tuple[int, int] = THUMBNAIL_SIZE) -> List[Tuple[int, Image.Image]]:
+    """
+    スナップショットから必要な状態のサムネイルを作成する（ワーカースレッドで実行する）
+
+    Args:
+        snapshots: HistoryStore.snapshotの戻り値
+        wanted: サムネイルが必要な履歴の通し番号
+        size: サムネイルの最大サイズ
+
+    Returns:
+        (通し番号, サムネイル)のリスト
+    """
+    wanted = set(wanted)
+    results = []
+    for serial, image in iter_snapshot_states(snapshots):
+        if serial in wanted:
+            results.append((serial, make_thumbnail(image, size)))
+    return results
+
+
+class ThumbnailCache:
+    """
+    履歴の通し番号ごとのサムネイルのキャッシュ
+    """
+    def __init__(self, size: Tuple[int, int] = THUMBNAIL_SIZE):
+        """
+        Args:
+            size: サムネイルの最大サイズ
+        """
+        self.size = size
+        self.thumbnails: Dict[int, Image.Image] = {}
+
+    def get(self, serial: int) -> Optional[Image.Image]:
+        return self.thumbnails.get(serial)
+
+    def missing(self, serials: Sequence[int]) -> List[int]:
+        """
+        サムネイルがまだない通し番号（履歴の順）
+        """
+        return [serial for serial in serials if serial not in self.thumbnails]
+
+    def update(self, results: Iterable[Tuple[int, Image.Image]], serials: Sequence[int]) -> None:
+        """
+        作成したサムネイルを追加し、履歴から消えた状態のサムネイルを破棄する
+
+        Args:
+            results: render_thumbnailsの戻り値
+            serials: 現在の履歴の通し番号
+        """
+        self.thumbnails.update(results)
+        live = set(serials)
+        for serial in [serial for serial in self.thumbnails if serial not in live]:
+            del self.thumbnails[serial]
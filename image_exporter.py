@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+画像の書き出し
+PNG・JPEG・WebPを速度/サイズのプリセットで書き出し、複数形式を並列にエンコードする
+それ以外の拡張子はPillowが書き出せる形式であればそのまま保存する
+PNGは行単位の帯ごとにエンコードして書き出すため、画像全体の2つ目のコピーを作らない
+"""
+
+from concurrent.futures import Executor, Future
+from typing import BinaryIO, List, Optional
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+# 形式ごとの書き出しプリセット
+EXPORT_PRESETS = {
+    "png": {
+        "fast": {"compress_level": 1},
+        "balanced": {"compress_level": 6},
+        "small": {"compress_level": 9},
+    },
+    "jpeg": {
+        "fast": {"quality": 85},
+        "balanced": {"quality": 90, "optimize": True},
+        "small": {"quality": 80, "optimize": True, "progressive": True},
+    },
+    "webp": {
+        "fast": {"quality": 80, "method": 0},
+        "balanced": {"quality": 85, "method": 4},
+        "small": {"quality": 80, "method": 6},
+    },
+}
+
+# UIに表示するプリセット名
+PRESET_LABELS = {
+    "fast": "速度優先",
+    "balanced": "標準",
+    "small": "サイズ優先",
+}
+
+# 拡張子と形式の対応
+_EXTENSION_FORMATS = {
+    ".png": "png",
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+    ".webp": "webp",
+}
+
+# PNGの色タイプ
+_PNG_COLOR_TYPES = {"L": 0, "RGB": 2, "RGBA": 6}
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def detect_format(file_path: str) -> str:
+    """
+    拡張子から書き出し形式を判定する
+
+    Args:
+        file_path: 書き出し先のパス
+
+    Returns:
+        "png"・"jpeg"・"webp"のいずれか（それ以外はPillowの形式名を小文字にしたもの。例: "bmp"）
+
+    Raises:
+        ValueError: 拡張子がないか、書き出せない形式の場合
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in _EXTENSION_FORMATS:
+        return _EXTENSION_FORMATS[extension]
+    pillow_format = Image.registered_extensions().get(extension)
+    if pillow_format is None or pillow_format not in Image.SAVE:
+        raise ValueError(f"書き出せない拡張子です: {extension or '(拡張子なし)'}")
+    return pillow_format.lower()
+
+
+def _write_png_chunk(file: BinaryIO, chunk_type: bytes, data: bytes) -> None:
+    """
+    PNGのチャンクを1つ書き出す
+    """
+    file.write(struct.pack(">I", len(data)))
+    file.write(chunk_type)
+    file.write(data)
+    file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+
+def write_png_streaming(image: Image.Image, file: BinaryIO, compress_level: int = 6,
+                        rows_per_band: int = 64) -> None:
+    """
+    画像を行の帯ごとにフィルタ・圧縮してPNGとして書き出す
+    メモリ上に持つのは帯1つ分のデータだけで、モード変換も帯ごとに行う
+
+    Args:
+        image: 書き出す画像
+        file: 書き込み先のバイナリファイル
+        compress_level: zlibの圧縮レベル (0〜9)
+        rows_per_band: 1度に処理する行数
+    """
+    if image.mode in _PNG_COLOR_TYPES:
+        out_mode = image.mode
+    else:
+        out_mode = "RGBA" if "A" in image.getbands() else "RGB"
+    channels = len(out_mode)
+    width, height = image.size
+    row_bytes = width * channels
+
+    file.write(_PNG_SIGNATURE)
+    _write_png_chunk(file, b"IHDR", struct.pack(">IIBBBBB", width, height, 8,
+                                                _PNG_COLOR_TYPES[out_mode], 0, 0, 0))
+
+    compressor = zlib.compressobj(compress_level)
+    previous_row = np.zeros(row_bytes, dtype=np.uint8)
+    for top in range(0, height, rows_per_band):
+        bottom = min(height, top + rows_per_band)
+        band = image.crop((0, top, width, bottom))
+        if band.mode != out_mode:
+            band = band.convert(out_mode)
+        rows = np.asarray(band, dtype=np.uint8).reshape(bottom - top, row_bytes)
+
+        # Upフィルタ（直前の行との差分）を帯全体にまとめて適用
+        prior = np.empty_like(rows)
+        prior[0] = previous_row
+        prior[1:] = rows[:-1]
+        filtered = np.empty((bottom - top, row_bytes + 1), dtype=np.uint8)
+        filtered[:, 0] = 2
+        np.subtract(rows, prior, out=filtered[:, 1:])
+        previous_row = rows[-1].copy()
+
+        compressed = compressor.compress(filtered.tobytes())
+        if compressed:
+            _write_png_chunk(file, b"IDAT", compressed)
+
+    _write_png_chunk(file, b"IDAT", compressor.flush())
+    _write_png_chunk(file, b"IEND", b"")
+
+
+def encode_image(image: Image.Image, file: BinaryIO, image_format: str = "png",
+                 preset: str = "balanced") -> None:
+    """
+    画像を指定した形式とプリセットでファイルオブジェクトに書き込む
+
+    Args:
+        image: 書き出す画像
+        file: 書き込み先のバイナリファイル（BytesIOも可）
+        image_format: "png"・"jpeg"・"webp"、またはdetect_formatが返したPillowの形式名
+        preset: "fast"・"balanced"・"small"のいずれか（プリセットのない形式では使わない）
+    """
+    if image_format not in EXPORT_PRESETS:
+        # プリセットのない形式はPillowの既定の設定で保存する
+        image.save(file, format=image_format.upper())
+        return
+    options = EXPORT_PRESETS[image_format][preset]
+    if image_format == "png":
+        write_png_streaming(image, file, **options)
+    else:
+        # JPEGとWebPは透過を扱わないためRGBで書き出す
+        source = image if image.mode == "RGB" else image.convert("RGB")
+        source.save(file, format=image_format.upper(), **options)
+
+
+def export_image(image: Image.Image, file_path: str, image_format: Optional[str] = None,
+                 preset: str = "balanced") -> str:
+    """
+    画像を指定した形式とプリセットで書き出す
+    一時ファイルに書き出してから置き換えるため、失敗しても既存のファイルは壊れない
+
+    Args:
+        image: 書き出す画像
+        file_path: 書き出し先のパス
+        image_format: 書き出し形式（Noneの場合は拡張子から判定）
+        preset: "fast"・"balanced"・"small"のいずれか
+
+    Returns:
+        書き出したパス
+    """
+    image_format = image_format or detect_format(file_path)
+
+    tmp_path = file_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as file:
+            encode_image(image, file, image_format, preset)
+        os.replace(tmp_path, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return file_path
+
+
+def export_many(image: Image.Image, file_paths: List[str], executor: Executor,
+                preset: str = "balanced") -> List[Future]:
+    """
+    複数の形式で並列に書き出す
+    各エンコーダは同じ画像を読み取るだけなので画像のコピーは作らない
+    （書き出しが終わるまで呼び出し側は画像を変更しないこと）
+
+    Args:
+        image: 書き出す画像
+        file_paths: 書き出し先のパスのリスト（形式は拡張子から判定）
+        executor: エンコードを実行するExecutor
+        preset: "fast"・"balanced"・"small"のいずれか
+
+    Returns:
+        書き出し先ごとのFutureのリスト
+    """
+    return [executor.submit(export_image, image, file_path, None, preset) for file_path in file_paths]
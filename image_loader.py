@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+画像の段階的な読み込み
+縮小デコードでプレビューをすぐに表示し、フル解像度のデコードと
+キャンバス用のモード変換はバックグラウンドで行う
+"""
+
+from typing import Optional, Tuple
+
+from PIL import Image
+
+
+def read_image_size(file_path: str) -> Tuple[int, int]:
+    """
+    画像をデコードせずにヘッダからサイズだけを取得する
+
+    Args:
+        file_path: 画像のパス
+
+    Returns:
+        (幅, 高さ)のタプル
+    """
+    with Image.open(file_path) as image:
+        return image.size
+
+
+def normalize_mode(image: Image.Image) -> Image.Image:
+    """
+    キャンバスで扱えるRGBモードに変換する
+    透過部分は白背景に合成する
+
+    Args:
+        image: 変換する画像
+
+    Returns:
+        RGBモードの画像
+    """
+    if image.mode == "RGB":
+        return image
+
+    if image.mode == "P" and "transparency" in image.info:
+        image = image.convert("RGBA")
+
+    if image.mode in ("RGBA", "LA", "PA"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+
+    return image.convert("RGB")
+
+
+def open_preview(file_path: str, target_size: Tuple[int, int], scale: int = 4) -> Optional[Image.Image]:
+    """
+    縮小デコードが可能な形式（JPEGのdraft、JPEG 2000のreduce）の場合に
+    低解像度のプレビューを作成する
+
+    Args:
+        file_path: 画像のパス
+        target_size: 最終的に表示するサイズ
+        scale: プレビューの縮小率の目安
+
+    Returns:
+        target_sizeに拡大したプレビュー（縮小デコードできない形式の場合はNone）
+    """
+    with Image.open(file_path) as image:
+        requested = (max(1, image.width // scale), max(1, image.height // scale))
+        if image.format == "JPEG":
+            # DCTのスケーリングで縮小しながらデコードする
+            image.draft("RGB", requested)
+        elif image.format == "JPEG2000":
+            image.reduce = max(0, scale.bit_length() - 1)
+        else:
+            return None
+        image.load()
+        preview = normalize_mode(image)
+        if preview is image:
+            preview = image.copy()
+
+    # 表示用に拡大するだけなので最も軽い補間を使う
+    return preview.resize(target_size, Image.NEAREST)
+
+
+def load_full(file_path: str, size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """
+    画像をフル解像度でデコードし、キャンバス用に変換する
+    （バックグラウンドスレッドで実行する想定）
+
+    Args:
+        file_path: 画像のパス
+        size: リサイズ後のサイズ（Noneの場合はリサイズしない）
+
+    Returns:
+        RGBモードの画像
+    """
+    with Image.open(file_path) as image:
+        image.load()
+        loaded = normalize_mode(image)
+        if loaded is image:
+            loaded = image.copy()
+
+    if size is not None and loaded.size != size:
+        loaded = loaded.resize(size)
+    return loaded
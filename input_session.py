@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+実際の入力セッションの記録と再生
+PaintAppのイベントハンドラに届いた入力を時刻付きで圧縮ファイルに記録し、
+PaintAppまたはHeadlessPaintに再生してイベントごとのレイテンシと最終画像のハッシュを報告する
+
+再生:
+    python input_session.py session.jsonl.gz            # ヘッドレスで最速再生
+    python input_session.py session.jsonl.gz --realtime # 記録時のタイミングで再生
+    python input_session.py session.jsonl.gz --gui      # PaintAppに再生
+"""
+
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import time
+
+SESSION_VERSION = 1
+
+# 起動直後から記録する環境変数（値は記録先のパス、"1"の場合は既定のパス）
+RECORD_ENV_VAR = "SIMPLE_PAINT_RECORD"
+
+# 座標を伴うイベント
+POINTER_EVENTS = ("start_draw", "draw", "stop_draw")
+
+
+def default_output_path() -> str:
+    """
+    既定の記録先のパス（カレントディレクトリに日時付きで作成）
+    """
+    return os.path.abspath(time.strftime("session-%Y%m%d-%H%M%S.jsonl.gz"))
+
+
+def image_hash(image) -> str:
+    """
+    描画データのハッシュ（サイズとピクセル値から計算）
+
+    Args:
+        image: PIL Image
+
+    Returns:
+        SHA-256の16進文字列
+    """
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode("ascii"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class SessionRecorder:
+    """
+    入力イベントの記録
+    1行1イベントのJSON（[経過ミリ秒, 種類, 引数...]）をgzip圧縮して書き出す
+    """
+    def __init__(self, output_path: str, app):
+        """
+        記録を開始する
+
+        Args:
+            output_path: 記録先のパス
+            app: 記録対象のPaintApp（開始時の設定をヘッダに記録する）
+        """
+        self.output_path = output_path
+        self.event_count = 0
+        self._file = gzip.open(output_path, "wt", encoding="utf-8", compresslevel=6)
+        self._start = time.perf_counter()
+
+        header = {
+            "version": SESSION_VERSION,
+            "canvas": [app.canvas_width, app.canvas_height],
+            "tool": app.tool,
+            "color": app.current_color,
+            "brush_size": app.stroke_width,  # 描画データのピクセル単位
+            "brush": app.brush_type,
+            "velocity_width": app.velocity_width,
+            "velocity_opacity": app.velocity_opacity,
+            "simplify": app.simplify_strokes,
+            "initial_hash": image_hash(app.drawing_data),
+        }
+        self._file.write(json.dumps(header, separators=(",", ":")) + "\n")
+
+    def record(self, kind: str, *args) -> None:
+        """
+        イベントを1件記録する
+
+        Args:
+            kind: イベントの種類（start_draw, draw, stop_draw, tool, color, size, brush, velocity, simplify,
+                  undo, redo, jump, copy, cut, paste, commit）
+            *args: イベントの引数（座標とイベントの時刻、ツール名など）
+        """
+        elapsed_ms = round((time.perf_counter() - self._start) * 1000, 1)
+        self._file.write(json.dumps([elapsed_ms, kind, *args], separators=(",", ":")) + "\n")
+        self.event_count += 1
+
+    def close(self) -> None:
+        """
+        記録を終了してファイルを閉じる
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_session(input_path: str) -> Tuple[dict, List[list]]:
+    """
+    記録したセッションを読み込む
+
+    Args:
+        input_path: 記録ファイルのパス
+
+    Returns:
+        (ヘッダ, イベントのリスト)のタプル
+    """
+    with gzip.open(input_path, "rt", encoding="utf-8") as file:
+        header = json.loads(file.readline())
+        if header.get("version") != SESSION_VERSION:
+            raise ValueError(f"未対応の記録ファイルです: {input_path}")
+        events = [json.loads(line) for line in file if line.strip()]
+    return header, events
+
+
+def _dispatch(target, kind: str, args: list) -> None:
+    """
+    イベントを対象のハンドラに渡す
+    """
+    if kind in POINTER_EVENTS:
+        # ブラシの速度は記録時のイベントの時刻から求める（時刻のない古い記録では再生時の時刻）
+        getattr(target, kind)(SimpleNamespace(x=args[0], y=args[1], time=args[2] if len(args) > 2 else None))
+    elif kind == "tool":
+        target.change_tool(args[0])
+    elif kind == "color":
+        target.set_color(args[0])
+    elif kind == "size":
+        target.change_brush_size(args[0])
+    elif kind == "brush":
+        target.set_brush(args[0])
+    elif kind == "velocity":
+        target.set_velocity_dynamics(args[0], args[1])
+    elif kind == "simplify":
+        target.set_simplify_strokes(args[0])
+    elif kind == "undo":
+        target.undo()
+    elif kind == "redo":
+        target.redo()
+    elif kind == "jump":
+        target.jump_to_history(args[0])
+    elif kind == "copy":
+        target.copy_selection()
+    elif kind == "cut":
+        target.cut_selection()
+    elif kind == "paste":
+        target.paste_clipboard()
+    elif kind == "commit":
+        target.release_selection()
+    else:
+        raise ValueError(f"未知のイベントです: {kind}")
+
+
+def _percentile(sorted_values: List[float], ratio: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+def replay_session(target, header: dict, events: List[list], realtime: bool = False,
+                   after_event: Optional[Callable[[], None]] = None) -> dict:
+    """
+    記録したイベントを再生する
+
+    Args:
+        target: PaintAppまたはHeadlessPaint
+        header: セッションのヘッダ
+        events: イベントのリスト
+        realtime: 記録時のタイミングで再生する場合はTrue（Falseの場合は最速）
+        after_event: イベントごとに呼ぶ処理（GUIの描画更新など、レイテンシに含める）
+
+    Returns:
+        イベントの種類ごとのレイテンシ（ミリ秒）と最終画像のハッシュ
+    """
+    # 記録開始時と同じキャンバスから再生しているか（異なる場合ハッシュは比較できない）
+    initial_hash_matches = header.get("initial_hash") == image_hash(target.drawing_data)
+
+    target.change_tool(header["tool"])
+    target.set_color(header["color"])
+    target.change_brush_size(header["brush_size"])
+    target.set_brush(header.get("brush", "line"))
+    target.set_velocity_dynamics(header.get("velocity_width", False), header.get("velocity_opacity", False))
+    target.set_simplify_strokes(header.get("simplify", True))
+
+    latencies: Dict[str, List[float]] = {}
+    start = time.perf_counter()
+    for event in events:
+        elapsed_ms, kind, args = event[0], event[1], event[2:]
+        if realtime:
+            delay = elapsed_ms / 1000 - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        event_start = time.perf_counter()
+        _dispatch(target, kind, args)
+        if after_event is not None:
+            after_event()
+        latencies.setdefault(kind, []).append((time.perf_counter() - event_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    per_event = {}
+    for kind, values in latencies.items():
+        values.sort()
+        per_event[kind] = {
+            "count": len(values),
+            "mean_ms": sum(values) / len(values),
+            "p50_ms": _percentile(values, 0.5),
+            "p95_ms": _percentile(values, 0.95),
+            "max_ms": values[-1],
+        }
+
+    return {
+        "events": len(events),
+        "seconds": elapsed,
+        "per_event": per_event,
+        "image_hash": image_hash(target.drawing_data),
+        "initial_hash_matches": initial_hash_matches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="記録した入力セッションの再生")
+    parser.add_argument("session", help="記録ファイルのパス")
+    parser.add_argument("--realtime", action="store_true", help="記録時のタイミングで再生する")
+    parser.add_argument("--gui", action="store_true", help="PaintAppに再生する（ディスプレイが必要）")
+    parser.add_argument("--expect-hash", help="最終画像のハッシュがこの値と一致するか確認する")
+    args = parser.parse_args()
+
+    header, events = load_session(args.session)
+    width, height = header["canvas"]
+
+    if args.gui:
+        import tkinter as tk
+        from paint_app import PaintApp
+        root = tk.Tk()
+        app = PaintApp(root)
+        if (width, height) != (app.canvas_width, app.canvas_height):
+            import canvas_ops
+            from PIL import ImageDraw
+            app.drawing_data = canvas_ops.resize_canvas_image(app.drawing_data, width, height)
+            app.drawing_data_draw = ImageDraw.Draw(app.drawing_data)
+            app.set_canvas_size(width, height)
+            app.update_canvas_from_image()
+        report = replay_session(app, header, events, args.realtime, after_event=root.update)
+        root.destroy()
+    else:
+        from headless_paint import HeadlessPaint
+        report = replay_session(HeadlessPaint(width, height), header, events, args.realtime)
+
+    print(f"{report['events']}イベント / {report['seconds']:.3f}秒")
+    for kind, stats in sorted(report["per_event"].items()):
+        print(f"  {kind:<10} {stats['count']:>6}件  平均 {stats['mean_ms']:.3f}ms  "
+              f"p50 {stats['p50_ms']:.3f}ms  p95 {stats['p95_ms']:.3f}ms  最大 {stats['max_ms']:.3f}ms")
+    print(f"最終画像のハッシュ: {report['image_hash']}")
+    if not report["initial_hash_matches"]:
+        print("警告: 記録開始時のキャンバスと再生開始時のキャンバスが異なります")
+
+    if args.expect_hash and args.expect_hash != report["image_hash"]:
+        print("最終画像のハッシュが一致しません")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
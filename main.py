@@ -5,10 +5,24 @@
 シンプルなペイントソフトのメインエントリーポイント
 """
 
+import argparse
+import os
 import tkinter as tk
-from paint_app import PaintApp
+from tkinter import messagebox
+from document_tabs import DocumentTabs
+from autosave_journal import DEFAULT_JOURNAL_PATH, find_recovery_journals
+from sampling_profiler import PROFILE_ENV_VAR
+from input_session import RECORD_ENV_VAR
+from supersample import MAX_SCALE, scale_for_dpi
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simple Paint - シンプルペイント")
+    parser.add_argument("--collab", metavar="HOST:PORT",
+                        help="共同編集サーバーに接続する (例: 127.0.0.1:8765)")
+    parser.add_argument("--scale", default="auto", choices=["auto"] + [str(n) for n in range(1, MAX_SCALE + 1)],
+                        help="描画データの表示に対する倍率（autoは画面の解像度から決める）")
+    args = parser.parse_args()
+    
     root = tk.Tk()
     root.title("Simple Paint - シンプルペイント")
     root.configure(bg="#f0f0f0")  # 背景色の設定
@@ -16,5 +30,48 @@ if __name__ == "__main__":
     # ウィンドウアイコンを設定（iconphotoを使用）
     # アプリケーションアイコンが必要な場合は追加実装が必要
     
-    app = PaintApp(root)
+    # 高解像度の画面では描画データを整数倍の解像度で持ち、縮小して表示する
+    if args.scale == "auto":
+        render_scale = scale_for_dpi(root.winfo_fpixels("1i"))
+    else:
+        render_scale = int(args.scale)
+    
+    # ドキュメントはタブで開き、ワーカーと予測モデルを共有する
+    tabs = DocumentTabs(root, render_scale=render_scale)
+    
+    # 前回異常終了していた場合は自動保存ジャーナルからの復旧を確認（タブごとにジャーナルがある）
+    journals = find_recovery_journals(DEFAULT_JOURNAL_PATH)
+    recover = False
+    if journals:
+        recover = messagebox.askyesno(
+            "復旧",
+            f"前回の終了時に保存されていない描画が{len(journals)}件見つかりました。\n復旧しますか？"
+        )
+    if recover:
+        for number, _ in journals:
+            tabs.new_document(number, recover=True)
+        tabs.notebook.select(0)
+    else:
+        # 復旧しない場合、次回の起動で再び確認されないよう2番目以降のジャーナルは削除する（1番目は上書きされる）
+        for number, path in journals:
+            if number != 1:
+                os.remove(path)
+        tabs.new_document(1)
+    app = tabs.current
+    
+    # 環境変数が設定されていれば起動直後からプロファイルを取得（"1"の場合は既定の出力先）
+    profile_path = os.environ.get(PROFILE_ENV_VAR)
+    if profile_path:
+        app.start_profiling(None if profile_path == "1" else profile_path)
+    
+    # 環境変数が設定されていれば起動直後から入力セッションを記録
+    record_path = os.environ.get(RECORD_ENV_VAR)
+    if record_path:
+        app.start_recording(None if record_path == "1" else record_path)
+    
+    # 共同編集モード
+    if args.collab:
+        host, _, port = args.collab.rpartition(":")
+        app.connect_collaboration(host or "127.0.0.1", int(port))
+    
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ユーザーの描き方に合わせて学習するストローク予測
+直前の数点の移動量から次の移動量を求める線形モデルを、描き終えたストロークごとに
+逐次最小二乗法（RLS）で更新する。学習はバックグラウンドスレッドで行い、状態はユーザーごとにローカルに保存する
+"""
+
+from typing import List, Optional, Sequence, Tuple
+import getpass
+import math
+import os
+import queue
+import threading
+
+import numpy as np
+
+# 学習した状態の保存先のディレクトリ
+STATE_DIR = os.path.join(os.path.expanduser("~"), ".simple_py_paint")
+
+# 状態のファイル形式のバージョン
+STATE_VERSION = 1
+
+# 学習スレッドへの停止要求
+_STOP = object()
+
+
+def default_state_path() -> str:
+    """
+    現在のユーザーの学習した状態の保存先
+    """
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = "default"
+    return os.path.join(STATE_DIR, f"predictor-{user}.npz")
+
+
+def _displacements(points: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """
+    点の列を隣り合う点の移動量の配列にする（重複した点は除く）
+    """
+    array = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    steps = np.diff(array, axis=0)
+    return steps[np.any(steps != 0, axis=1)]
+
+
+def _baseline_step(history: np.ndarray, smoothing_factor: float = 0.8, prediction_steps: int = 10) -> np.ndarray:
+    """
+    シンプル予測モデル（StrokePredictor._predict_with_simple_model）の1点目の移動量
+    学習したモデルと予測誤差を比べるために使う
+    """
+    accel = (history[-1] - history[0]) * smoothing_factor if len(history) >= 2 else 0.0
+    return history.mean(axis=0) + accel / prediction_steps
+
+
+class AdaptiveModel:
+    """
+    直前の移動量から次の移動量を予測する線形モデル（RLSで逐次学習する）
+    バイアス項を持たないため、移動量の大きさ（描画データの倍率）によらず同じ重みを使える
+    """
+    def __init__(self, history: int = 4, forgetting: float = 0.995, initial_covariance: float = 10.0,
+                 state_path: Optional[str] = None, min_samples: int = 200):
+        """
+        Args:
+            history: 特徴に使う直前の移動量の数
+            forgetting: 忘却係数（小さいほど最近のストロークを重視する）
+            initial_covariance: 共分散行列の初期値（大きいほど最初の学習が速い）
+            state_path: 学習した状態の保存先（Noneの場合は保存しない）
+            min_samples: 予測に使い始めるまでに学習する移動量の数
+        """
+        self.history = history
+        self.forgetting = forgetting
+        self.initial_covariance = initial_covariance
+        self.state_path = state_path
+        self.min_samples = min_samples
+
+        size = history * 2
+        # 初期値は直前の移動量をそのまま続けるモデル
+        self.weights = np.zeros((2, size))
+        self.weights[0, size - 2] = 1.0
+        self.weights[1, size - 1] = 1.0
+        self.covariance = np.eye(size) * initial_covariance
+        self.sample_count = 0
+        # 学習したストロークでの1点先の予測誤差の指数移動平均（学習したモデルとシンプル予測モデル）
+        self.model_error: Optional[float] = None
+        self.baseline_error: Optional[float] = None
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        if state_path:
+            self.load(state_path)
+
+    @property
+    def ready(self) -> bool:
+        """
+        十分に学習し、シンプル予測モデルより誤差が小さくなっているかどうか
+        """
+        return (self.sample_count >= self.min_samples and self.model_error is not None
+                and self.model_error < self.baseline_error)
+
+    def predict(self, points: Sequence[Tuple[float, float]], steps: int) -> List[Tuple[int, int]]:
+        """
+        次の点を予測する（学習中でも呼び出し元のスレッドでそのまま呼べる）
+
+        Args:
+            points: 直近のストロークの点
+            steps: 予測する点の数
+
+        Returns:
+            予測した点のリスト（点が足りない場合は空）
+        """
+        history = _displacements(points)
+        if len(history) < self.history:
+            return []
+        # 学習スレッドは配列を置き換えるため、参照を1回だけ読む
+        # 要素数が少ないため、NumPyの小さな演算を繰り返すよりPythonのリストで計算する方が速い
+        weights_x, weights_y = self.weights.tolist()
+        window = history[-self.history:].reshape(-1).tolist()
+        # 発散しないよう、1回の移動量を直近の最大の移動量の2倍までに制限する
+        limit = 2.0 * max(math.hypot(window[i], window[i + 1]) for i in range(0, len(window), 2))
+
+        x, y = float(points[-1][0]), float(points[-1][1])
+        predicted = []
+        for _ in range(steps):
+            dx = sum(weight * value for weight, value in zip(weights_x, window))
+            dy = sum(weight * value for weight, value in zip(weights_y, window))
+            length = math.hypot(dx, dy)
+            if length > limit:
+                dx, dy = dx * limit / length, dy * limit / length
+            x, y = x + dx, y + dy
+            predicted.append((round(x), round(y)))
+            window = window[2:] + [dx, dy]
+        return predicted
+
+    def learn(self, points: Sequence[Tuple[float, float]]) -> None:
+        """
+        描き終えたストロークから学習する（呼び出し元のスレッドで学習する）
+
+        Args:
+            points: ストロークの点
+        """
+        history = _displacements(points)
+        if len(history) <= self.history:
+            return
+        weights = self.weights.copy()
+        covariance = self.covariance
+        model_error, baseline_error = self.model_error, self.baseline_error
+        for index in range(self.history, len(history)):
+            features = history[index - self.history:index].reshape(-1)
+            target = history[index]
+
+            # 更新前の重みでの予測誤差を、シンプル予測モデルの誤差と比べるために記録する
+            error = target - weights @ features
+            baseline = target - _baseline_step(history[index - self.history:index])
+            model_error = self._average(model_error, float(np.hypot(error[0], error[1])))
+            baseline_error = self._average(baseline_error, float(np.hypot(baseline[0], baseline[1])))
+
+            projected = covariance @ features
+            gain = projected / (self.forgetting + features @ projected)
+            weights += np.outer(error, gain)
+            covariance = (covariance - np.outer(gain, projected)) / self.forgetting
+        # 丸め誤差で対称性が崩れないようにする
+        covariance = (covariance + covariance.T) / 2
+
+        # 予測側が途中の状態を読まないよう、配列ごと置き換える
+        self.covariance = covariance
+        self.weights = weights
+        self.model_error, self.baseline_error = model_error, baseline_error
+        self.sample_count += len(history) - self.history
+
+    def submit(self, points: Sequence[Tuple[float, float]]) -> None:
+        """
+        ストロークを学習スレッドに渡す（学習と保存はバックグラウンドで行う）
+
+        Args:
+            points: ストロークの点
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._learn_loop, name="predictor-learn", daemon=True)
+            self._thread.start()
+        self._queue.put(list(points))
+
+    def flush(self) -> None:
+        """
+        学習スレッドに渡したストロークを全て学習し終えるまで待つ
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """
+        学習スレッドを停止する
+        """
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def save(self, path: str) -> None:
+        """
+        学習した状態を保存する（書き込み途中の状態を読まないよう一時ファイルから置き換える）
+
+        Args:
+            path: 保存先のパス
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez(file, version=STATE_VERSION, history=self.history, weights=self.weights,
+                     covariance=self.covariance, sample_count=self.sample_count,
+                     errors=np.array([np.nan if error is None else error
+                                      for error in (self.model_error, self.baseline_error)]))
+        os.replace(temporary_path, path)
+
+    def load(self, path: str) -> bool:
+        """
+        保存した状態を読み込む（形式が異なる場合は読み込まない）
+
+        Args:
+            path: 保存先のパス
+
+        Returns:
+            読み込めたかどうか
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as state:
+                if int(state["version"]) != STATE_VERSION or int(state["history"]) != self.history:
+                    return False
+                self.weights = state["weights"]
+                self.covariance = state["covariance"]
+                self.sample_count = int(state["sample_count"])
+                errors = state["errors"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"予測モデルの状態の読み込みエラー: {e}")
+            return False
+        self.model_error = None if np.isnan(errors[0]) else float(errors[0])
+        self.baseline_error = None if np.isnan(errors[1]) else float(errors[1])
+        return True
+
+    def _average(self, average: Optional[float], value: float) -> float:
+        """
+        誤差の指数移動平均
+        """
+        return value if average is None else 0.99 * average + 0.01 * value
+
+    def _learn_loop(self) -> None:
+        """
+        学習スレッドの処理（キューが空になるたびに状態を保存する）
+        """
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self.learn(item)
+                if self.state_path and self._queue.empty():
+                    self.save(self.state_path)
+            except (OSError, ValueError, np.linalg.LinAlgError) as e:
+                print(f"予測モデルの学習エラー: {e}")
+            finally:
+                self._queue.task_done()
+
+
+# プロセス内で共有する現在のユーザーのモデル（タブで開いた全てのドキュメントで共有する）
+_shared_model: Optional[AdaptiveModel] = None
+
+
+def shared_model() -> AdaptiveModel:
+    """
+    現在のユーザーの学習した状態を読み込んだモデル（最初の呼び出しで作成する）
+    """
+    global _shared_model
+    if _shared_model is None:
+        _shared_model = AdaptiveModel(state_path=default_state_path())
+    return _shared_model
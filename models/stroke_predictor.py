@@ -18,12 +18,16 @@ try:
 except ImportError:
     SKETCH_RNN_AVAILABLE = False
 
+# 読み込んだsketch-rnnモデル（モデルのパスごとに一度だけ読み込み、全てのStrokePredictorで共有する）
+# 予測中のRNNの状態は呼び出し側で保持するため、ドキュメントごとの予測器で同じモデルを使える
+_shared_models = {}
+
 class StrokePredictor:
     """
     ストロークの予測を行うクラス
     """
     def __init__(self, points_to_consider: int = 5, prediction_steps: int = 10, smoothing_factor: float = 0.8, 
-                 use_sketch_rnn: bool = False, model_path: str = None):
+                 use_sketch_rnn: bool = False, model_path: str = None, adaptive_model=None):
         """
         ストローク予測機能の初期化
         
@@ -33,12 +37,15 @@ class StrokePredictor:
             smoothing_factor: 予測の滑らかさを調整する係数 (0.0〜1.0)
             use_sketch_rnn: sketch-rnnモデルを使用するかどうか
             model_path: sketch-rnnモデルのパス（Noneの場合はデフォルトモデルを使用）
+            adaptive_model: ユーザーの描き方から学習するモデル（models.adaptive_predictor.AdaptiveModel）
+                            十分に学習してシンプル予測モデルより誤差が小さくなったら代わりに使う
         """
         self.points_to_consider = points_to_consider
         self.prediction_steps = prediction_steps
         self.smoothing_factor = smoothing_factor
         self.stroke_history: List[Tuple[int, int]] = []
         self.predicted_points: List[Tuple[int, int]] = []
+        self.adaptive_model = adaptive_model
         
         # sketch-rnn関連の設定
         self.use_sketch_rnn = use_sketch_rnn and SKETCH_RNN_AVAILABLE
@@ -68,6 +75,13 @@ class StrokePredictor:
             if self.model_path is None:
                 self.model_path = "https://storage.googleapis.com/quickdraw-models/sketchRNN/large_models/cat.gen.h5"
             
+            # 読み込み済みのモデルがあれば共有する
+            shared_model = _shared_models.get(self.model_path)
+            if shared_model is not None:
+                self.sketch_rnn_model = shared_model
+                self.model_loaded = True
+                return True
+            
             # モデルの設定
             model_dir = os.path.dirname(self.model_path)
             model_name = os.path.basename(self.model_path).split('.')[0]
@@ -82,6 +96,7 @@ class StrokePredictor:
             
             # モデルを読み込む
             self.sketch_rnn_model.load_model(self.model_path)
+            _shared_models[self.model_path] = self.sketch_rnn_model
             self.model_loaded = True
             print(f"sketch-rnnモデルの読み込み成功: {self.model_path}")
             return True
@@ -146,6 +161,11 @@ class StrokePredictor:
         # sketch-rnnモデルが有効な場合はそれを使用
         if self.use_sketch_rnn and self.model_loaded:
             return self._predict_with_sketch_rnn()
+        elif self.adaptive_model is not None and self.adaptive_model.ready:
+            # 学習したモデルを使用（重複した点を除いても足りるよう多めに渡す）
+            recent_points = self.stroke_history[-(self.adaptive_model.history * 2 + 1):]
+            self.predicted_points = self.adaptive_model.predict(recent_points, self.prediction_steps)
+            return self.predicted_points or self._predict_with_simple_model()
         else:
             # 従来の予測手法を使用
             return self._predict_with_simple_model()
@@ -275,6 +295,16 @@ class StrokePredictor:
         self.predicted_points = predicted
         return predicted
 
+    def learn_stroke(self, points: List[Tuple[int, int]]) -> None:
+        """
+        描き終えたストロークを学習するモデルに渡す（学習はバックグラウンドで行い、すぐに戻る）
+        
+        Args:
+            points: ストロークの点
+        """
+        if self.adaptive_model is not None:
+            self.adaptive_model.submit(points)
+            
     def clear(self) -> None:
         """
         ストローク履歴と予測をクリア
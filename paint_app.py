@@ -8,34 +8,78 @@
 import tkinter as tk
 from tkinter import colorchooser, filedialog, messagebox
 import os
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageDraw
 
 # ストローク予測のインポート
 from models.stroke_predictor import StrokePredictor
+from models import adaptive_predictor
+from history_store import HistoryStore
+from stroke_simplifier import StrokeSimplifier
+import history_thumbnails
+from autosave_journal import AutosaveJournal, replay_journal
+from collab import CollabClient
+from sampling_profiler import SamplingProfiler, default_output_path, handler_tag
+from input_session import SessionRecorder, default_output_path as default_session_path
+from timelapse import TimelapseRecorder, default_output_path as default_timelapse_path
+import brush_engine
+import canvas_ops
+import supersample
+import selection_ops
+import region_labels
+import vector_layer
+import image_loader
+import image_exporter
+import timelapse
+
+# ベクターのストロークを扱うツール（ベクターストロークが有効な場合のみ）
+VECTOR_TOOLS = ("object_eraser", "stroke_select")
 
 class PaintApp:
-    def __init__(self, root):
+    def __init__(self, root, render_scale=1, io_executor=None, history_budget_bytes=128 * 1024 * 1024):
         """
         ペイントアプリケーションの初期化
         
         Args:
-            root: tkinterのルートウィンドウ
+            root: tkinterのルートウィンドウ（タブで開く場合はタブのフレーム）
+            render_scale: 描画データの表示に対する倍率（2以上の場合は高解像度で描画して縮小表示する）
+            io_executor: 共有するI/O処理用のワーカー（Noneの場合はこのドキュメント専用に作成する）
+            history_budget_bytes: このドキュメントのメモリ上の履歴の上限
         """
         self.root = root
         
-        # キャンバスのサイズ
-        self.canvas_width = 800
-        self.canvas_height = 600
+        # 描画データの倍率と、縮小表示用のタイル（倍率が1の場合は使わない）
+        # 座標・サイズ・操作はすべて描画データのピクセル単位で扱い、キャンバスの項目だけを表示の座標にする
+        self.render_scale = render_scale
+        self.view_tiles = None
+        self.tile_photos = {}  # タイルごとの表示用の画像（書き換える時は同じ画像に貼り直す）
+        self.tile_refresh_id = None
+        
+        # キャンバスのサイズ（描画データのピクセル単位）
+        self.canvas_width = 800 * render_scale
+        self.canvas_height = 600 * render_scale
         
         # 線の色とサイズの初期値
         self.current_color = "#000000"  # 黒
         self.brush_size = 3
+        self.brush_type = "line"  # ペンのブラシ（線/ハード/ソフト）
         self.tool = "pen"  # 初期ツールはペン
         
+        # 書き出しの設定（速度優先/標準/サイズ優先）
+        self.export_preset = "balanced"
+        
+        # 入力セッションの記録（start_recordingで開始、UIの設定時から参照される）
+        self.session_recorder = None
+        
+        # タイムラプス用の描画操作の記録（start_timelapseで開始）
+        self.timelapse_recorder = None
+        self.exporting_timelapse = False
+        
         # ストローク予測の設定
         self.stroke_prediction_enabled = False
         self.sketch_rnn_enabled = False
-        self.stroke_predictor = StrokePredictor(use_sketch_rnn=self.sketch_rnn_enabled)
+        self.stroke_predictor = StrokePredictor(use_sketch_rnn=self.sketch_rnn_enabled,
+                                                adaptive_model=adaptive_predictor.shared_model())
         self.prediction_ids = []  # キャンバス上の予測線のID
         
         # UIの設定
@@ -49,10 +93,79 @@ class PaintApp:
         self.prev_x = None
         self.prev_y = None
         
+        # 描画中のストロークの点（自動保存ジャーナルに記録する）
+        self.stroke_points = []
+        
+        # マウスの点の間引き（確定した点だけを描画と予測に渡し、確定までは仮の線だけを動かす）
+        self.stroke_simplifier = StrokeSimplifier()
+        self.stroke_tail_id = None
+        
+        # スタンプ方式のブラシで描画中のストロークと、ダブのマスクのキャッシュ
+        # ダブの合成はアイドル時にまとめて行う（モーションイベントごとには合成しない）
+        self.brush_stroke = None
+        self.brush_flush_id = None
+        self.dab_cache = brush_engine.DabCache()
+        
+        # ドラッグ中の図形の始点とプレビュー（ドラッグ中は1つの項目の座標だけを更新する）
+        self.shape_start = None
+        self.shape_preview_id = None
+        
+        # 選択範囲（矩形選択・投げ縄）
+        self.selection = None
+        self.selection_points = []  # ドラッグ中の選択範囲の軌跡
+        self.selection_drag = None  # 移動中のドラッグの直前の位置
+        self.clipboard = None
+        
+        # 持ち上げて移動中・貼り付け中のピクセル（確定するまで描画データには書き込まない）
+        self.floating_clip = None
+        self.floating_regions = []  # 確定時に履歴へ記録する(矩形, 変更前, 変更後)のリスト
+        self.floating_operation = None  # 確定時に自動保存ジャーナルへ記録する操作
+        self.floating_photo = None
+        self.region_tiles = None  # 通常の解像度で部分的に表示し直す範囲のタイル
+        self.region_photos = {}  # タイルごとの(表示用の画像, キャンバスの項目)（書き換える時は同じ画像に貼り直す）
+        
+        # 塗りつぶし用の連結領域ラベル（チェックボックスで有効にした場合のみ）
+        self.region_labels = None
+        self.fill_highlight_id = None  # マウス位置の塗りつぶし領域の強調表示
+        self.fill_highlight_label = None
+        self.fill_highlight_photo = None
+        
+        # ベクターのストローク（チェックボックスで有効にした場合のみ、ペンのストロークをオブジェクトとして保持する）
+        self.vector_layer = None
+        self.vector_selection = []  # ストローク選択ツールで選択中のストローク
+        self.vector_hover = None  # マウス位置のストロークの強調表示
+        self.vector_drag_start = None  # ストローク選択ツールのドラッグの始点
+        self.vector_erase_regions = []  # オブジェクト消しゴムのドラッグ中に描き直した(矩形, 変更前, 変更後)
+        
+        # クラッシュ復旧用の自動保存ジャーナル（start_autosaveで開始）
+        self.journal = None
+        
+        # 共同編集クライアント（connect_collaborationで接続）
+        self.collab_client = None
+        
+        # サンプリングプロファイラ（start_profilingで開始）
+        self.profiler = None
+        self.profile_output_path = None
+        
+        # 画像の読み込みなど重いI/O処理用のワーカー（タブで開いた場合は全てのドキュメントで共有する）
+        self.owns_io_executor = io_executor is None
+        self.io_executor = io_executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="paint-io")
+        self.loading_image = False  # バックグラウンドで画像を読み込み中かどうか
+        self.exporting = False  # バックグラウンドで画像を書き出し中かどうか
+        self.load_generation = 0
+        
         # 操作履歴の管理（アンドゥ/リドゥ用）
-        self.history = []
-        self.history_index = -1
-        self.max_history = 20  # 履歴の最大数
+        # 件数ではなくメモリ使用量で管理し、古い履歴は圧縮して一時ファイルへ退避する
+        self.history_budget_bytes = history_budget_bytes  # メモリ上の履歴の上限
+        self.history = HistoryStore(max_bytes=self.history_budget_bytes)
+        
+        # 履歴パネル（サムネイルはワーカーで作成し、履歴の通し番号ごとにキャッシュする）
+        self.history_panel = None
+        self.history_canvas = None
+        self.history_thumbnails = history_thumbnails.ThumbnailCache()
+        self.history_photos = {}  # 通し番号ごとの表示用の画像
+        self.history_thumbnail_job = None
+        self.history_panel_state = None  # 最後に表示した(通し番号, 現在位置)
         
         # 初期状態を履歴に保存
         self.save_state()
@@ -75,7 +188,8 @@ class PaintApp:
         canvas_frame = tk.Frame(self.root)
         canvas_frame.pack(expand=tk.YES, fill=tk.BOTH, padx=10, pady=10)
         
-        self.canvas = tk.Canvas(canvas_frame, width=self.canvas_width, height=self.canvas_height, 
+        self.canvas = tk.Canvas(canvas_frame, width=self.canvas_width // self.render_scale,
+                                height=self.canvas_height // self.render_scale,
                                 bg="white", relief=tk.SUNKEN, bd=2)
         self.canvas.pack(expand=tk.YES, fill=tk.BOTH)
         
@@ -88,6 +202,10 @@ class PaintApp:
         self.canvas.bind("<Motion>", self.show_brush_preview)
         self.canvas.bind("<Leave>", self.hide_brush_preview)
         
+        # 選択したストロークを削除するキー（ストローク選択ツールでクリックした時にキャンバスにフォーカスを移す）
+        self.canvas.bind("<Delete>", lambda event: self.delete_selected_strokes())
+        self.canvas.bind("<BackSpace>", lambda event: self.delete_selected_strokes())
+        
         # ブラシプレビュー用の変数
         self.brush_preview_id = None
         
@@ -116,6 +234,45 @@ class PaintApp:
                               command=lambda: self.change_tool("fill"))
         self.fill_button.pack(side=tk.LEFT, padx=2)
         
+        # 図形ツール（直線・四角形・楕円）
+        self.line_button = tk.Button(tools_frame, text="直線", 
+                              bg="#e0e0e0", relief=tk.RAISED,
+                              command=lambda: self.change_tool("line"))
+        self.line_button.pack(side=tk.LEFT, padx=2)
+        
+        self.rectangle_button = tk.Button(tools_frame, text="四角形", 
+                                   bg="#e0e0e0", relief=tk.RAISED,
+                                   command=lambda: self.change_tool("rectangle"))
+        self.rectangle_button.pack(side=tk.LEFT, padx=2)
+        
+        self.ellipse_button = tk.Button(tools_frame, text="楕円", 
+                                 bg="#e0e0e0", relief=tk.RAISED,
+                                 command=lambda: self.change_tool("ellipse"))
+        self.ellipse_button.pack(side=tk.LEFT, padx=2)
+        
+        # 矩形選択ツール
+        self.select_button = tk.Button(tools_frame, text="矩形選択", 
+                                bg="#e0e0e0", relief=tk.RAISED,
+                                command=lambda: self.change_tool("select"))
+        self.select_button.pack(side=tk.LEFT, padx=2)
+        
+        # 投げ縄選択ツール
+        self.lasso_button = tk.Button(tools_frame, text="投げ縄", 
+                               bg="#e0e0e0", relief=tk.RAISED,
+                               command=lambda: self.change_tool("lasso"))
+        self.lasso_button.pack(side=tk.LEFT, padx=2)
+        
+        # オブジェクト消しゴムとストローク選択ツール（ベクターストロークが有効な場合のみ）
+        self.object_eraser_button = tk.Button(tools_frame, text="オブジェクト消去",
+                                              bg="#e0e0e0", relief=tk.RAISED, state=tk.DISABLED,
+                                              command=lambda: self.change_tool("object_eraser"))
+        self.object_eraser_button.pack(side=tk.LEFT, padx=2)
+        
+        self.stroke_select_button = tk.Button(tools_frame, text="ストローク選択",
+                                              bg="#e0e0e0", relief=tk.RAISED, state=tk.DISABLED,
+                                              command=lambda: self.change_tool("stroke_select"))
+        self.stroke_select_button.pack(side=tk.LEFT, padx=2)
+        
         # 色を選択するフレーム
         color_frame = tk.Frame(top_frame, bg="#f0f0f0")
         color_frame.pack(side=tk.LEFT, padx=10)
@@ -139,6 +296,27 @@ class PaintApp:
         self.size_slider.set(self.brush_size)
         self.size_slider.pack(side=tk.LEFT, padx=5)
         
+        # ブラシの種類の選択
+        self.brush_type_var = tk.StringVar(value=brush_engine.BRUSH_LABELS[self.brush_type])
+        brush_type_menu = tk.OptionMenu(brush_frame, self.brush_type_var,
+                                        *brush_engine.BRUSH_LABELS.values(),
+                                        command=self.change_brush)
+        brush_type_menu.config(bg="#e0e0e0")
+        brush_type_menu.pack(side=tk.LEFT, padx=2)
+        
+        # ポインタの速度でダブの太さ・濃さを変える（ハード/ソフトのブラシのみ）
+        self.velocity_width_var = tk.BooleanVar()
+        tk.Checkbutton(brush_frame, text="速度→太さ", bg="#f0f0f0", variable=self.velocity_width_var,
+                       command=self.change_velocity_dynamics).pack(side=tk.LEFT)
+        self.velocity_opacity_var = tk.BooleanVar()
+        tk.Checkbutton(brush_frame, text="速度→濃さ", bg="#f0f0f0", variable=self.velocity_opacity_var,
+                       command=self.change_velocity_dynamics).pack(side=tk.LEFT)
+        
+        # ペン・消しゴムのマウスの点を間引く（ほぼ静止中の点や直線の途中の点を描画しない）
+        self.simplify_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(brush_frame, text="点の間引き", bg="#f0f0f0", variable=self.simplify_var,
+                       command=lambda: self.set_simplify_strokes(self.simplify_strokes)).pack(side=tk.LEFT)
+        
         # ストローク予測フレーム
         prediction_frame = tk.Frame(top_frame, bg="#f0f0f0")
         prediction_frame.pack(side=tk.LEFT, padx=10)
@@ -171,6 +349,24 @@ class PaintApp:
         load_button = tk.Button(file_frame, text="読み込み", bg="#e0e0e0", command=self.load_image)
         load_button.pack(side=tk.LEFT, padx=2)
         
+        # 複数形式の一括書き出しボタン
+        export_button = tk.Button(file_frame, text="一括書き出し", bg="#e0e0e0", command=self.export_images)
+        export_button.pack(side=tk.LEFT, padx=2)
+        
+        # 書き出しプリセットの選択
+        self.export_preset_var = tk.StringVar(value=image_exporter.PRESET_LABELS[self.export_preset])
+        export_preset_menu = tk.OptionMenu(file_frame, self.export_preset_var,
+                                           *image_exporter.PRESET_LABELS.values(),
+                                           command=self.change_export_preset)
+        export_preset_menu.config(bg="#e0e0e0")
+        export_preset_menu.pack(side=tk.LEFT, padx=2)
+        
+        # 高解像度モードでは表示の解像度に縮小して書き出すこともできる
+        self.export_view_size_var = tk.BooleanVar()
+        if self.render_scale > 1:
+            tk.Checkbutton(file_frame, text="表示サイズで書き出し", bg="#f0f0f0",
+                           variable=self.export_view_size_var).pack(side=tk.LEFT, padx=5)
+        
         # キャンバス操作フレーム
         canvas_ops_frame = tk.Frame(bottom_frame, bg="#f0f0f0")
         canvas_ops_frame.pack(side=tk.LEFT, padx=10)
@@ -179,6 +375,48 @@ class PaintApp:
         clear_button = tk.Button(canvas_ops_frame, text="クリア", bg="#e0e0e0", command=self.clear_canvas)
         clear_button.pack(side=tk.LEFT, padx=2)
         
+        # インデックスカラー（1ピクセル1バイト）モードのチェックボックス
+        self.indexed_var = tk.BooleanVar()
+        self.indexed_checkbox = tk.Checkbutton(canvas_ops_frame, text="インデックスカラー", bg="#f0f0f0",
+                                               variable=self.indexed_var,
+                                               command=self.toggle_indexed_mode)
+        self.indexed_checkbox.pack(side=tk.LEFT, padx=5)
+        
+        # 連結領域ラベルによる塗りつぶしの高速化と塗りつぶし領域の強調表示
+        self.region_labels_var = tk.BooleanVar()
+        self.region_labels_checkbox = tk.Checkbutton(canvas_ops_frame, text="塗りつぶし高速化", bg="#f0f0f0",
+                                                     variable=self.region_labels_var,
+                                                     command=self.toggle_region_labels)
+        self.region_labels_checkbox.pack(side=tk.LEFT, padx=5)
+        
+        # ペンのストロークをオブジェクトとして保持する（オブジェクト消しゴム・ストローク選択用）
+        self.vector_var = tk.BooleanVar()
+        self.vector_checkbox = tk.Checkbutton(canvas_ops_frame, text="ベクターストローク", bg="#f0f0f0",
+                                              variable=self.vector_var,
+                                              command=self.toggle_vector_mode)
+        self.vector_checkbox.pack(side=tk.LEFT, padx=5)
+        
+        # 選択範囲の編集フレーム
+        edit_frame = tk.Frame(bottom_frame, bg="#f0f0f0")
+        edit_frame.pack(side=tk.LEFT, padx=10)
+        
+        copy_button = tk.Button(edit_frame, text="コピー", bg="#e0e0e0", command=self.copy_selection)
+        copy_button.pack(side=tk.LEFT, padx=2)
+        
+        cut_button = tk.Button(edit_frame, text="切り取り", bg="#e0e0e0", command=self.cut_selection)
+        cut_button.pack(side=tk.LEFT, padx=2)
+        
+        paste_button = tk.Button(edit_frame, text="貼り付け", bg="#e0e0e0", command=self.paste_clipboard)
+        paste_button.pack(side=tk.LEFT, padx=2)
+        
+        # 選択範囲のキーボードショートカット（Escで確定して選択を解除）
+        # タブで開いた場合はDocumentTabsが選択中のドキュメントに振り分ける
+        if self.root is self.root.winfo_toplevel():
+            self.root.bind("<Control-c>", lambda event: self.copy_selection())
+            self.root.bind("<Control-x>", lambda event: self.cut_selection())
+            self.root.bind("<Control-v>", lambda event: self.paste_clipboard())
+            self.root.bind("<Escape>", lambda event: self.release_selection())
+        
         # キャンバスサイズ変更フレーム
         canvas_size_frame = tk.Frame(bottom_frame, bg="#f0f0f0")
         canvas_size_frame.pack(side=tk.LEFT, padx=10)
@@ -213,6 +451,38 @@ class PaintApp:
         redo_button = tk.Button(history_frame, text="やり直し", bg="#e0e0e0", command=self.redo)
         redo_button.pack(side=tk.LEFT, padx=2)
         
+        # 履歴パネルを開くボタン
+        history_button = tk.Button(history_frame, text="履歴", bg="#e0e0e0", command=self.open_history_panel)
+        history_button.pack(side=tk.LEFT, padx=2)
+        
+        # プロファイル取得フレーム
+        profile_frame = tk.Frame(bottom_frame, bg="#f0f0f0")
+        profile_frame.pack(side=tk.LEFT, padx=10)
+        
+        # プロファイル取得チェックボックス
+        self.profile_var = tk.BooleanVar()
+        self.profile_checkbox = tk.Checkbutton(profile_frame, text="プロファイル", bg="#f0f0f0",
+                                               variable=self.profile_var,
+                                               command=self.toggle_profiling)
+        self.profile_checkbox.pack(side=tk.LEFT, padx=5)
+        
+        # 入力セッション記録チェックボックス
+        self.record_var = tk.BooleanVar()
+        self.record_checkbox = tk.Checkbutton(profile_frame, text="操作を記録", bg="#f0f0f0",
+                                              variable=self.record_var,
+                                              command=self.toggle_recording)
+        self.record_checkbox.pack(side=tk.LEFT, padx=5)
+        
+        # タイムラプス記録チェックボックスと書き出しボタン
+        self.timelapse_var = tk.BooleanVar()
+        self.timelapse_checkbox = tk.Checkbutton(profile_frame, text="タイムラプス記録", bg="#f0f0f0",
+                                                 variable=self.timelapse_var,
+                                                 command=self.toggle_timelapse)
+        self.timelapse_checkbox.pack(side=tk.LEFT, padx=5)
+        timelapse_button = tk.Button(profile_frame, text="タイムラプス書き出し", bg="#e0e0e0",
+                                     command=self.export_timelapse)
+        timelapse_button.pack(side=tk.LEFT, padx=2)
+        
     def toggle_prediction(self):
         """
         ストローク予測機能の有効/無効を切り替える
@@ -239,7 +509,8 @@ class PaintApp:
         self.clear_predictions()
         
         # ストローク予測機能の設定を更新
-        self.stroke_predictor = StrokePredictor(use_sketch_rnn=self.sketch_rnn_enabled)
+        self.stroke_predictor = StrokePredictor(use_sketch_rnn=self.sketch_rnn_enabled,
+                                                adaptive_model=adaptive_predictor.shared_model())
         
         # sketch-rnnの実際の設定状態をUIに反映
         if self.stroke_predictor.use_sketch_rnn:
@@ -291,7 +562,7 @@ class PaintApp:
             
             # 予測線をキャンバスに追加して、IDを保存
             line_id = self.canvas.create_line(
-                x1, y1, x2, y2,
+                *self.to_view(x1, y1, x2, y2),
                 width=max(1, self.brush_size // 2),
                 fill=prediction_color,
                 dash=dash_pattern,
@@ -300,6 +571,7 @@ class PaintApp:
             )
             self.prediction_ids.append(line_id)
             
+    @handler_tag("start_draw")
     def start_draw(self, event):
         """
         描画開始時の処理
@@ -307,27 +579,55 @@ class PaintApp:
         Args:
             event: マウスイベント
         """
+        event_x, event_y = self.event_point(event)
+        if self.session_recorder:
+            self.session_recorder.record("start_draw", event_x, event_y, getattr(event, "time", None))
+            
         # 描画中はプレビューを非表示にする
         if self.brush_preview_id:
             self.canvas.delete(self.brush_preview_id)
             self.brush_preview_id = None
+        self.hide_fill_highlight()
             
         # 予測を消去
         self.clear_predictions()
         
+        # 画像の読み込み中は描画しない（読み込み完了時に上書きされるため）
+        # 書き出し中も描画データを共有しているため描画しない
+        if self.loading_image or self.exporting:
+            return
+        
+        if self.tool in selection_ops.SELECTION_TOOLS:
+            self.start_selection(event_x, event_y)
+            return
+        if self.tool in VECTOR_TOOLS:
+            self.start_vector_tool(event_x, event_y)
+            return
+        
+        # 移動中・貼り付け中の選択範囲があれば確定してから描画する
+        self.commit_selection()
+        
         if self.tool == "fill":
-            self.flood_fill(event.x, event.y)
+            self.flood_fill(event_x, event_y)
+        elif self.tool in canvas_ops.SHAPES:
+            self.start_shape(event_x, event_y)
         else:
             # キャンバス境界内に座標を制限
-            x = max(0, min(event.x, self.canvas_width - 1))
-            y = max(0, min(event.y, self.canvas_height - 1))
+            x = max(0, min(event_x, self.canvas_width - 1))
+            y = max(0, min(event_y, self.canvas_height - 1))
             self.prev_x = x
             self.prev_y = y
+            self.stroke_points = [(x, y)]
+            if self.tool == "pen" and self.brush_type != "line":
+                self.start_brush_stroke(x, y, getattr(event, "time", None))
+            if self.simplify_strokes:
+                self.stroke_simplifier.start(x, y, getattr(event, "time", None))
             
             # ストローク予測のためにポイントを記録
             if self.stroke_prediction_enabled and self.tool == "pen":
                 self.stroke_predictor.add_point(x, y)
         
+    @handler_tag("draw")
     def draw(self, event):
         """
         描画中の処理
@@ -335,52 +635,135 @@ class PaintApp:
         Args:
             event: マウスイベント
         """
+        event_x, event_y = self.event_point(event)
+        if self.session_recorder:
+            self.session_recorder.record("draw", event_x, event_y, getattr(event, "time", None))
+            
+        if self.tool in selection_ops.SELECTION_TOOLS:
+            self.update_selection(event_x, event_y)
+            return
+        if self.tool in VECTOR_TOOLS:
+            self.update_vector_tool(event_x, event_y)
+            return
+        if self.tool in canvas_ops.SHAPES:
+            self.update_shape(event_x, event_y)
+            return
+            
         if self.prev_x and self.prev_y:
             # キャンバス境界内に座標を制限
-            x = max(0, min(event.x, self.canvas_width - 1))
-            y = max(0, min(event.y, self.canvas_height - 1))
-            
-            # キャンバスに描画
-            if self.tool == "pen":
-                self.canvas.create_line(
-                    self.prev_x, self.prev_y, x, y,
-                    width=self.brush_size,
-                    fill=self.current_color,
-                    capstyle=tk.ROUND,
-                    smooth=tk.TRUE
-                )
-                # 描画データにも保存
-                self.drawing_data_draw.line(
-                    (self.prev_x, self.prev_y, x, y),
-                    fill=self.current_color,
-                    width=self.brush_size
-                )
-                
-                # ストローク予測のために点を記録
-                if self.stroke_prediction_enabled:
-                    self.stroke_predictor.add_point(x, y)
-                    
-            elif self.tool == "eraser":
-                self.canvas.create_line(
-                    self.prev_x, self.prev_y, x, y,
-                    width=self.brush_size,
-                    fill="white",
-                    capstyle=tk.ROUND,
-                    smooth=tk.TRUE
-                )
-                # 描画データにも保存
-                self.drawing_data_draw.line(
-                    (self.prev_x, self.prev_y, x, y),
-                    fill="white",
-                    width=self.brush_size
-                )
+            x = max(0, min(event_x, self.canvas_width - 1))
+            y = max(0, min(event_y, self.canvas_height - 1))
+            time_ms = getattr(event, "time", None)
+            
+            if self.stroke_simplifier.anchor is None:
+                self.draw_stroke_point(x, y, time_ms)
+                return
+            # 間引き中は確定した点だけを描画し、マウス位置までは仮の線の座標だけを更新する
+            point = self.stroke_simplifier.add(x, y, time_ms)
+            if point is not None:
+                self.draw_stroke_point(*point)
+            self.update_stroke_tail(x, y)
+            
+    def draw_stroke_point(self, x, y, time_ms=None):
+        """
+        ストロークの確定した点までを描画する
+        
+        Args:
+            x, y: 座標（キャンバス境界内）
+            time_ms: イベントの時刻（ミリ秒）
+        """
+        # キャンバスに描画
+        if self.brush_stroke is not None:
+            self.continue_brush_stroke(x, y, time_ms)
+            
+            if self.stroke_prediction_enabled:
+                self.stroke_predictor.add_point(x, y)
                 
-                # 消しゴムで描画した場合、境界線を再描画
-                self.draw_canvas_border()
+        elif self.tool == "pen":
+            self.draw_line_segment(self.prev_x, self.prev_y, x, y, self.current_color, self.stroke_width)
             
-            self.prev_x = x
-            self.prev_y = y
+            # ストローク予測のために点を記録
+            if self.stroke_prediction_enabled:
+                self.stroke_predictor.add_point(x, y)
+                
+        elif self.tool == "eraser":
+            self.draw_line_segment(self.prev_x, self.prev_y, x, y, "white", self.stroke_width)
+        
+        # 共同編集中は線分ごとに送信する（送信側でまとめて圧縮される）
+        # スタンプ方式のブラシはストロークの終了時に操作として送信する
+        if self.collab_client and self.tool in ("pen", "eraser") and self.brush_stroke is None:
+            self.collab_client.send({
+                "op": "stroke",
+                "color": self.current_color if self.tool == "pen" else "white",
+                "width": self.stroke_width,
+                "points": [(self.prev_x, self.prev_y), (x, y)],
+            })
+        
+        self.stroke_points.append((x, y))
+        self.prev_x = x
+        self.prev_y = y
+        
+    def update_stroke_tail(self, x, y):
+        """
+        最後に確定した点からマウス位置までの仮の線を更新する（項目は1つだけで座標を書き換える）
+        
+        Args:
+            x, y: マウス位置
+        """
+        if self.stroke_tail_id is None:
+            if self.tool == "eraser":
+                color, width = "white", self.brush_size
+            elif self.brush_stroke is not None:
+                color, width = self.current_color, max(1, round(self.brush_stroke.last_diameter / self.render_scale))
+            else:
+                color, width = self.current_color, self.brush_size
+            self.stroke_tail_id = self.canvas.create_line(
+                *self.to_view(self.prev_x, self.prev_y, x, y),
+                width=width,
+                fill=color,
+                capstyle=tk.ROUND
+            )
+        else:
+            self.canvas.coords(self.stroke_tail_id, *self.to_view(self.prev_x, self.prev_y, x, y))
             
+    def draw_line_segment(self, x1, y1, x2, y2, color, width):
+        """
+        線分をキャンバスと描画データの両方に描画する
+        高解像度モードではキャンバスに線を追加せず、書き換えたタイルの縮小をアイドル時にまとめて行う
+        
+        Args:
+            x1, y1: 始点
+            x2, y2: 終点
+            color: 線の色
+            width: 線の太さ
+        """
+        if self.view_tiles is None:
+            self.canvas.create_line(
+                x1, y1, x2, y2,
+                width=width,
+                fill=color,
+                capstyle=tk.ROUND,
+                smooth=tk.TRUE
+            )
+        # 描画データにも保存（インデックスカラーではパレット番号で描画）
+        # パレットが一杯の場合は描画データがRGBに置き換わるため、インクを先に求めてから描画先を参照する
+        ink = self.canvas_ink(color)
+        self.drawing_data_draw.line(
+            (x1, y1, x2, y2),
+            fill=ink,
+            width=width
+        )
+        if self.region_labels or self.view_tiles is not None or self.vector_layer is not None:
+            box = (min(x1, x2) - width, min(y1, y2) - width, max(x1, x2) + width + 1, max(y1, y2) + width + 1)
+            self.invalidate_region_labels(box)
+            if self.view_tiles is not None:
+                self.view_tiles.mark(box)
+                self.schedule_view_refresh()
+            # ペンの線はストロークの終了時にオブジェクトとして登録し、消しゴムの線は下のストロークを確定する
+            if self.tool != "pen":
+                self.flatten_vector_strokes(box)
+        
+    @handler_tag("stop_draw")
     def stop_draw(self, event):
         """
         描画終了時の処理
@@ -388,13 +771,58 @@ class PaintApp:
         Args:
             event: マウスイベント
         """
+        event_x, event_y = self.event_point(event)
+        if self.session_recorder:
+            self.session_recorder.record("stop_draw", event_x, event_y, getattr(event, "time", None))
+            
+        # 間引きで保留していた最後の点を確定して仮の線を消す
+        if self.stroke_simplifier.anchor is not None:
+            point = self.stroke_simplifier.finish()
+            if point is not None and self.prev_x is not None:
+                self.draw_stroke_point(*point)
+            if self.stroke_tail_id is not None:
+                self.canvas.delete(self.stroke_tail_id)
+                self.stroke_tail_id = None
+            
         self.prev_x = None
         self.prev_y = None
         
+        if self.tool in selection_ops.SELECTION_TOOLS:
+            self.finish_selection()
+            return
+        if self.tool in VECTOR_TOOLS:
+            self.finish_vector_tool(event_x, event_y)
+            return
+        if self.tool in canvas_ops.SHAPES:
+            self.finish_shape(event_x, event_y)
+            return
+        
+        # 消しゴムの線は境界線の項目より上に描かれるため、ストロークの終了時に一度だけ境界線を前面に出す
+        if self.tool == "eraser":
+            self.canvas.tag_raise("canvas_border")
+        
+        # 描き終えたストロークを予測モデルの学習に渡す（学習と保存はバックグラウンドで行う）
+        if self.stroke_prediction_enabled and self.tool == "pen" and len(self.stroke_points) > 1:
+            self.stroke_predictor.learn_stroke(self.stroke_points)
+            
         # 描画が終わったら状態を保存
-        if self.tool != "fill":  # 塗りつぶしは別で処理
+        if self.brush_stroke is not None:
+            self.finish_brush_stroke()
+            self.stroke_points = []
+        elif self.tool != "fill":  # 塗りつぶしは別で処理
             self.save_state()
             
+            if len(self.stroke_points) > 1:
+                if self.vector_layer is not None and self.tool == "pen":
+                    self.vector_layer.add(self.stroke_points, self.current_color, self.stroke_width)
+                self.record_operation({
+                    "op": "stroke",
+                    "color": self.current_color if self.tool == "pen" else "white",
+                    "width": self.stroke_width,
+                    "points": self.stroke_points,
+                })
+            self.stroke_points = []
+            
         # ストローク予測が有効な場合、予測を表示
         if self.stroke_prediction_enabled and self.tool == "pen":
             self.show_predictions()
@@ -402,6 +830,7 @@ class PaintApp:
         # 描画終了後、再度プレビューを表示する
         self.show_brush_preview(event)
         
+    @handler_tag("change_tool")
     def change_tool(self, tool):
         """
         描画ツールを変更する
@@ -409,6 +838,14 @@ class PaintApp:
         Args:
             tool: 選択するツール
         """
+        if self.session_recorder:
+            self.session_recorder.record("tool", tool)
+            
+        # 選択ツール以外に切り替えたら、移動中・貼り付け中の選択範囲を確定する
+        if tool not in selection_ops.SELECTION_TOOLS:
+            self.commit_selection()
+        self.hide_fill_highlight()
+            
         self.tool = tool
         
         # 予測をクリア
@@ -418,15 +855,40 @@ class PaintApp:
         self.pen_button.config(relief=tk.SUNKEN if tool == "pen" else tk.RAISED)
         self.eraser_button.config(relief=tk.SUNKEN if tool == "eraser" else tk.RAISED)
         self.fill_button.config(relief=tk.SUNKEN if tool == "fill" else tk.RAISED)
-        
+        self.line_button.config(relief=tk.SUNKEN if tool == "line" else tk.RAISED)
+        self.rectangle_button.config(relief=tk.SUNKEN if tool == "rectangle" else tk.RAISED)
+        self.ellipse_button.config(relief=tk.SUNKEN if tool == "ellipse" else tk.RAISED)
+        self.select_button.config(relief=tk.SUNKEN if tool == "select" else tk.RAISED)
+        self.lasso_button.config(relief=tk.SUNKEN if tool == "lasso" else tk.RAISED)
+        self.object_eraser_button.config(relief=tk.SUNKEN if tool == "object_eraser" else tk.RAISED)
+        self.stroke_select_button.config(relief=tk.SUNKEN if tool == "stroke_select" else tk.RAISED)
+        
+        # ストローク選択ツール以外に切り替えたら、ストロークの選択と強調表示を解除する
+        if tool != "stroke_select":
+            self.vector_selection = []
+        self.redraw_vector_highlights()
+        
+    @handler_tag("choose_color")
     def choose_color(self):
         """
         色選択ダイアログを表示して色を選択する
         """
         color = colorchooser.askcolor(initialcolor=self.current_color)[1]
         if color:
-            self.current_color = color
-            self.color_display.config(bg=color)
+            self.set_color(color)
+            
+    def set_color(self, color):
+        """
+        描画色を設定する
+        
+        Args:
+            color: #RRGGBBの形式の色
+        """
+        if self.session_recorder:
+            self.session_recorder.record("color", color)
+            
+        self.current_color = color
+        self.color_display.config(bg=color)
             
     def change_brush_size(self, size):
         """
@@ -437,144 +899,1076 @@ class PaintApp:
         """
         self.brush_size = int(size)
         
-    def flood_fill(self, x, y):
+        if self.session_recorder:
+            self.session_recorder.record("size", self.stroke_width)
+        
+    def change_brush(self, label):
         """
-        指定された位置から塗りつぶしを行う
+        ブラシの種類を変更する（メニューから呼ばれる）
         
         Args:
-            x: X座標
-            y: Y座標
+            label: 選択されたブラシの表示名
         """
-        # 座標が画像範囲内かチェック
-        x = max(0, min(x, self.canvas_width - 1))
-        y = max(0, min(y, self.canvas_height - 1))
+        for brush_type, brush_label in brush_engine.BRUSH_LABELS.items():
+            if brush_label == label:
+                self.set_brush(brush_type)
+                
+    def set_brush(self, brush_type):
+        """
+        ペンのブラシを設定する
+        
+        Args:
+            brush_type: "line"・"hard"・"soft"のいずれか
+        """
+        if self.session_recorder:
+            self.session_recorder.record("brush", brush_type)
+            
+        self.brush_type = brush_type
+        self.brush_type_var.set(brush_engine.BRUSH_LABELS[brush_type])
         
-        # 現在の色をRGBタプルに変換
-        fill_color = self.hex_to_rgb(self.current_color)
+    def change_velocity_dynamics(self):
+        """
+        速度で太さ・濃さを変えるチェックボックスが切り替えられた時の処理
+        """
+        self.set_velocity_dynamics(self.velocity_width, self.velocity_opacity)
         
-        # クリックした位置の色を取得
-        target_color = self.drawing_data.getpixel((x, y))
+    def set_velocity_dynamics(self, velocity_width, velocity_opacity):
+        """
+        ポインタの速度でダブの太さ・濃さを変えるかどうかを設定する（次のストロークから有効）
         
-        # 塗りつぶす色と同じ場合は何もしない
-        if target_color == fill_color:
-            return
+        Args:
+            velocity_width: 速いほど細くする場合はTrue
+            velocity_opacity: 速いほど薄くする場合はTrue
+        """
+        if self.session_recorder:
+            self.session_recorder.record("velocity", velocity_width, velocity_opacity)
             
-        # PILのImageDrawを使って塗りつぶし
-        try:
-            from PIL import ImageDraw
-            # PIL 10.0.0以降ではfloodfill関数を使用
-            ImageDraw.floodfill(self.drawing_data, (x, y), fill_color)
+        self.velocity_width_var.set(velocity_width)
+        self.velocity_opacity_var.set(velocity_opacity)
+        
+    def set_simplify_strokes(self, simplify):
+        """
+        ペン・消しゴムのマウスの点を間引くかどうかを設定する（次のストロークから有効）
+        
+        Args:
+            simplify: 間引く場合はTrue
+        """
+        if self.session_recorder:
+            self.session_recorder.record("simplify", simplify)
             
-            # キャンバスを更新
-            self.update_canvas_from_image()
-            self.save_state()  # 状態を保存
+        self.simplify_var.set(simplify)
+        
+    @property
+    def simplify_strokes(self):
+        return self.simplify_var.get()
+        
+    @property
+    def velocity_width(self):
+        return self.velocity_width_var.get()
+        
+    @property
+    def velocity_opacity(self):
+        return self.velocity_opacity_var.get()
+        
+    def start_brush_stroke(self, x, y, time_ms):
+        """
+        スタンプ方式のブラシのストロークを開始する
+        
+        Args:
+            x, y: 始点
+            time_ms: イベントの時刻（ミリ秒）
+        """
+        ink = self.canvas_ink(self.current_color)
+        self.brush_stroke = brush_engine.BrushStroke(
+            self.drawing_data.size, self.current_color, self.stroke_width, self.brush_type == "soft",
+            cache=self.dab_cache, ink=ink if self.drawing_data.mode == "P" else None,
+            velocity_width=self.velocity_width, velocity_opacity=self.velocity_opacity)
+        self.brush_stroke.add_point(x, y, time_ms)
+        self.schedule_brush_flush()
+        
+    def continue_brush_stroke(self, x, y, time_ms):
+        """
+        ストロークに点を追加する
+        キャンバスには仮の線だけを描き、ダブの合成はアイドル時にまとめて行う
+        （高解像度モードでは仮の線を描かず、合成したタイルを縮小して表示する）
+        
+        Args:
+            x, y: 座標
+            time_ms: イベントの時刻（ミリ秒）
+        """
+        self.brush_stroke.add_point(x, y, time_ms)
+        if self.view_tiles is None:
+            self.canvas.create_line(
+                self.prev_x, self.prev_y, x, y,
+                width=max(1, round(self.brush_stroke.last_diameter)),
+                fill=self.current_color,
+                capstyle=tk.ROUND,
+                tags="brush_stroke"
+            )
+        self.schedule_brush_flush()
+        
+    def schedule_brush_flush(self):
+        """
+        溜まったダブの合成をアイドル時に予約する（予約済みなら何もしない）
+        """
+        if self.brush_flush_id is None:
+            self.brush_flush_id = self.root.after_idle(self.flush_brush)
             
-        except Exception as e:
-            # フォールバック: 独自の塗りつぶしアルゴリズム
-            self.custom_flood_fill(x, y, target_color, fill_color)
+    @handler_tag("flush_brush")
+    def flush_brush(self):
+        """
+        溜まったダブを描画データにまとめて合成する
+        """
+        self.brush_flush_id = None
+        if self.brush_stroke is not None:
+            box = self.brush_stroke.flush(self.drawing_data)
+            if box and self.view_tiles is not None:
+                self.view_tiles.mark(box)
+                self.refresh_view_tiles()
             
-    def hex_to_rgb(self, hex_color):
+    def finish_brush_stroke(self):
         """
-        16進数カラーコードをRGBタプルに変換
+        ストロークを確定し、仮の線を合成結果の表示に置き換える
+        """
+        if self.brush_flush_id is not None:
+            self.root.after_cancel(self.brush_flush_id)
+            self.brush_flush_id = None
+        stroke = self.brush_stroke
+        self.brush_stroke = None
+        stroke.flush(self.drawing_data)
+        self.canvas.delete("brush_stroke")
+        if stroke.bounds:
+            self.show_region(stroke.bounds)
+        self.save_state()
+        self.record_operation(stroke.to_operation(self.current_color))
+        
+    def start_shape(self, x, y):
+        """
+        図形の描画を開始し、ラバーバンドのプレビューを作成する
         
         Args:
-            hex_color: #RRGGBBの形式の色
+            x: X座標
+            y: Y座標
+        """
+        x = max(0, min(x, self.canvas_width - 1))
+        y = max(0, min(y, self.canvas_height - 1))
+        self.shape_start = (x, y)
+        
+        view = self.to_view(x, y, x, y)
+        if self.tool == "line":
+            self.shape_preview_id = self.canvas.create_line(
+                *view, fill=self.current_color, width=self.brush_size, dash=(4, 2))
+        elif self.tool == "rectangle":
+            self.shape_preview_id = self.canvas.create_rectangle(
+                *view, outline=self.current_color, width=self.brush_size, dash=(4, 2))
+        else:
+            self.shape_preview_id = self.canvas.create_oval(
+                *view, outline=self.current_color, width=self.brush_size, dash=(4, 2))
             
-        Returns:
-            (R, G, B)のタプル
+    def update_shape(self, x, y):
+        """
+        ドラッグ中の図形のプレビューを更新する（項目は作り直さず座標だけを変える）
+        
+        Args:
+            x: X座標
+            y: Y座標
+        """
+        if self.shape_start is None:
+            return
+        x = max(0, min(x, self.canvas_width - 1))
+        y = max(0, min(y, self.canvas_height - 1))
+        self.canvas.coords(self.shape_preview_id, *self.to_view(*self.shape_start, x, y))
+        
+    def finish_shape(self, x, y):
+        """
+        図形を描画データに一度だけ描画し、外接矩形だけを表示し直して履歴に記録する
+        
+        Args:
+            x: X座標
+            y: Y座標
         """
-        hex_color = hex_color.lstrip('#')
-        return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+        if self.shape_start is None:
+            return
+        self.canvas.delete(self.shape_preview_id)
+        self.shape_preview_id = None
+        start = self.shape_start
+        self.shape_start = None
         
-    def custom_flood_fill(self, x, y, target_color, fill_color):
+        end = (max(0, min(x, self.canvas_width - 1)), max(0, min(y, self.canvas_height - 1)))
+        if end == start:
+            return
+        points = [start, end]
+        box = canvas_ops.shape_bounds(points, self.stroke_width, (self.canvas_width, self.canvas_height))
+        
+        # パレットが一杯でRGBに切り替わる場合があるため、インクを先に用意してから変更前を取り出す
+        ink = self.canvas_ink(self.current_color)
+        before = self.drawing_data.crop(box)
+        canvas_ops.draw_shape(self.drawing_data_draw, self.tool, points, ink, self.stroke_width)
+        self.history.push_patch(self.drawing_data, [(box, before, self.drawing_data.crop(box))])
+        self.show_region(box)
+        
+        self.record_operation({
+            "op": "shape",
+            "shape": self.tool,
+            "color": self.current_color,
+            "width": self.stroke_width,
+            "points": points,
+        })
+        
+    def start_selection(self, x, y):
         """
-        カスタム塗りつぶしアルゴリズム（フォールバック用）
+        選択範囲の作成を開始する（選択範囲の内側を押した場合は移動を開始する）
         
         Args:
-            x, y: 開始座標
-            target_color: 置き換え対象の色
-            fill_color: 塗りつぶす色
+            x: X座標
+            y: Y座標
         """
-        if target_color == fill_color:
+        x = max(0, min(x, self.canvas_width - 1))
+        y = max(0, min(y, self.canvas_height - 1))
+        
+        if self.floating_clip and self.floating_clip.contains(x, y):
+            self.selection_drag = (x, y)
+            return
+        if self.selection and self.selection.contains(x, y):
+            self.lift_selection()
+            self.selection_drag = (x, y)
             return
             
-        # スタックベースの塗りつぶしアルゴリズム
-        stack = [(x, y)]
-        pixels = self.drawing_data.load()
+        self.commit_selection()
+        self.selection_points = [(x, y)]
+        
+    def update_selection(self, x, y):
+        """
+        ドラッグ中の選択範囲の枠、または移動中のピクセルの位置を更新する
+        
+        Args:
+            x: X座標
+            y: Y座標
+        """
+        x = max(0, min(x, self.canvas_width - 1))
+        y = max(0, min(y, self.canvas_height - 1))
         
-        while stack:
-            current_x, current_y = stack.pop()
+        if self.selection_drag:
+            dx = x - self.selection_drag[0]
+            dy = y - self.selection_drag[1]
+            if dx or dy:
+                # 表示中の画像と枠を動かすだけで、描画データには確定するまで触れない
+                self.floating_clip.x += dx
+                self.floating_clip.y += dy
+                self.canvas.move("selection", *self.to_view(dx, dy))
+                self.selection_drag = (x, y)
+        elif self.selection_points:
+            if self.tool == "select":
+                x0, y0 = self.selection_points[0]
+                self.selection_points[1:] = [(x, y)]
+                self.canvas.delete("selection")
+                self.canvas.create_rectangle(*self.to_view(x0, y0, x, y), outline="#0078D7", dash=(4, 4),
+                                             tags="selection")
+            else:
+                # 投げ縄は線分を追加していく（軌跡全体は描き直さない）
+                px, py = self.selection_points[-1]
+                self.selection_points.append((x, y))
+                self.canvas.create_line(*self.to_view(px, py, x, y), fill="#0078D7", dash=(4, 4), tags="selection")
+                
+    def finish_selection(self):
+        """
+        ドラッグを終えて選択範囲を確定する（移動の場合は移動を終える）
+        """
+        if self.selection_drag:
+            self.selection_drag = None
+            return
             
-            if (current_x < 0 or current_x >= self.canvas_width or 
-                current_y < 0 or current_y >= self.canvas_height):
-                continue
+        points = self.selection_points
+        self.selection_points = []
+        if len(points) < 2:
+            return
+            
+        size = (self.canvas_width, self.canvas_height)
+        if self.tool == "select":
+            (x0, y0), (x1, y1) = points[0], points[-1]
+            self.selection = selection_ops.Selection.rectangle(x0, y0, x1, y1, size)
+        else:
+            self.selection = selection_ops.Selection.lasso(points, size)
+        self.draw_selection_outline()
+        
+    def draw_selection_outline(self):
+        """
+        選択範囲の枠と、移動中・貼り付け中のピクセルを表示する
+        """
+        from PIL import ImageTk
+        self.canvas.delete("selection")
+        if self.floating_clip:
+            clip = self.floating_clip
+            self.floating_photo = ImageTk.PhotoImage(
+                supersample.downsample(clip.to_display_image(), self.render_scale))
+            self.canvas.create_image(*self.to_view(clip.x, clip.y), image=self.floating_photo, anchor=tk.NW,
+                                     tags="selection")
+            x0, y0, x1, y1 = clip.box
+            self.canvas.create_rectangle(*self.to_view(x0, y0, x1 - 1, y1 - 1), outline="#0078D7", dash=(4, 4),
+                                         tags="selection")
+        elif self.selection:
+            if self.selection.polygon:
+                self.canvas.create_polygon(*self.to_view(*[value for point in self.selection.polygon for value in point]),
+                                           outline="#0078D7", fill="", dash=(4, 4), tags="selection")
+            else:
+                x0, y0, x1, y1 = self.selection.box
+                self.canvas.create_rectangle(*self.to_view(x0, y0, x1 - 1, y1 - 1), outline="#0078D7", dash=(4, 4),
+                                             tags="selection")
                 
-            if pixels[current_x, current_y] != target_color:
-                continue
+    def show_region(self, box, keep_vector_strokes=False):
+        """
+        描画データの一部だけをキャンバスに表示し直す（全体の画像は作り直さない）
+        高解像度モードでは矩形に掛かるタイルだけを縮小し直す
+        
+        Args:
+            box: 表示し直す矩形 (x0, y0, x1, y1)
+            keep_vector_strokes: ベクターのストロークの消去で描き直した場合はTrue（矩形のストロークを確定しない）
+        """
+        from PIL import ImageTk
+        if self.view_tiles is not None:
+            self.view_tiles.mark(box)
+            self.refresh_view_tiles()
+        else:
+            # 矩形に掛かるタイルの画像に貼り直し、それまでに描いた線の項目より前に出す
+            if self.region_tiles is None or self.region_tiles.size != self.drawing_data.size:
+                self.region_tiles = supersample.TileGrid(self.drawing_data.size, 1)
+            self.region_tiles.mark(box)
+            for tile in self.region_tiles.take_dirty():
+                image = self.region_tiles.render(self.drawing_data, tile)
+                photo, item = self.region_photos.get(tile, (None, None))
+                if photo is not None and (photo.width(), photo.height()) == image.size:
+                    photo.paste(image)
+                    self.canvas.tag_raise(item)
+                    continue
+                photo = ImageTk.PhotoImage(image)
+                item = self.canvas.create_image(*self.region_tiles.view_origin(tile), image=photo, anchor=tk.NW)
+                self.region_photos[tile] = (photo, item)
+        self.invalidate_region_labels(box)
+        if not keep_vector_strokes:
+            self.flatten_vector_strokes(box)
+        self.canvas.tag_raise("canvas_border")
+        self.canvas.tag_raise("selection")
+        
+    def lift_selection(self):
+        """
+        選択範囲のピクセルを持ち上げて移動できるようにする（元の場所は白で消去する）
+        """
+        box = self.selection.box
+        before = self.drawing_data.crop(box)
+        self.drawing_data, self.floating_clip = selection_ops.lift_region(self.drawing_data, self.selection)
+        self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+        self.floating_regions = [(box, before, self.drawing_data.crop(box))]
+        self.floating_operation = {"op": "move", **self.selection.to_operation()}
+        self.selection = None
+        
+        self.show_region(box)
+        self.draw_selection_outline()
+        
+    @handler_tag("commit_selection")
+    def commit_selection(self):
+        """
+        移動中・貼り付け中のピクセルを描画データに確定し、選択を解除する
+        履歴には変更した矩形だけを記録する
+        """
+        clip = self.floating_clip
+        if clip and not self.exporting:
+            self.floating_clip = None
+            regions = self.floating_regions
+            box = selection_ops.clip_box(clip.box, (self.canvas_width, self.canvas_height))
+            if box:
+                before = self.drawing_data.crop(box)
+                self.drawing_data, _ = selection_ops.paste_clip(self.drawing_data, clip)
+                self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+                regions = regions + [(box, before, self.drawing_data.crop(box))]
+                self.show_region(box)
                 
-            pixels[current_x, current_y] = fill_color
-            
-            # 隣接する4方向のピクセルをスタックに追加
-            stack.append((current_x + 1, current_y))
-            stack.append((current_x - 1, current_y))
-            stack.append((current_x, current_y + 1))
-            stack.append((current_x, current_y - 1))
+            if regions:
+                self.history.push_patch(self.drawing_data, regions)
+                operation = dict(self.floating_operation, x=clip.x, y=clip.y)
+                # 貼り付けたピクセルは操作から再生するジャーナル・共同編集・タイムラプスのどれにも必要
+                if operation["op"] == "paste" and (self.journal or self.collab_client or self.timelapse_recorder):
+                    operation["png"] = clip.to_png()
+                self.record_operation(operation)
+            self.floating_regions = []
+            self.floating_operation = None
+        elif clip:
+            # 書き出し中は描画データを共有しているため確定しない
+            return
             
-        # キャンバスを更新
-        self.update_canvas_from_image()
-        self.save_state()  # 状態を保存
+        self.selection = None
+        self.selection_drag = None
+        self.canvas.delete("selection")
         
-    def update_canvas_from_image(self):
+    @handler_tag("release_selection")
+    def release_selection(self):
         """
-        PIL Imageデータからキャンバスを更新
+        Escキーで移動中・貼り付け中のピクセルを確定し、選択を解除する
+        （commit_selectionは他の処理からも呼ばれるため、操作の記録はキー入力の場合だけ行う）
         """
-        try:
-            from PIL import ImageTk
-            # 現在のキャンバスをクリア
-            self.canvas.delete("all")
+        if self.session_recorder:
+            self.session_recorder.record("commit")
+        self.commit_selection()
+        
+    @handler_tag("copy_selection")
+    def copy_selection(self):
+        """
+        選択範囲（移動中・貼り付け中の場合はそのピクセル）をクリップボードにコピーする
+        """
+        if self.session_recorder:
+            self.session_recorder.record("copy")
             
-            # PIL ImageをTkinter用に変換して表示
-            self.photo = ImageTk.PhotoImage(self.drawing_data)
-            self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW)
+        if self.floating_clip:
+            self.clipboard = self.floating_clip
+        elif self.selection:
+            self.clipboard = selection_ops.copy_region(self.drawing_data, self.selection)
             
-            # 予測をクリア
-            self.prediction_ids = []
+    @handler_tag("cut_selection")
+    def cut_selection(self):
+        """
+        選択範囲をクリップボードにコピーして白で消去する
+        """
+        if self.session_recorder:
+            self.session_recorder.record("cut")
             
-            # キャンバスの境界を描画
-            self.draw_canvas_border()
+        if self.loading_image or self.exporting:
+            return
             
-        except Exception as e:
-            print(f"キャンバス更新エラー: {e}")
+        if self.floating_clip:
+            # 持ち上げた時点で元の場所は消去済みのため、貼り付けずに捨てる
+            self.clipboard = self.floating_clip
+            self.floating_clip = None
+            if self.floating_regions:
+                self.history.push_patch(self.drawing_data, self.floating_regions)
+                self.record_operation(dict(self.floating_operation, op="cut"))
+            self.floating_regions = []
+            self.floating_operation = None
+        elif self.selection:
+            box = self.selection.box
+            before = self.drawing_data.crop(box)
+            self.clipboard = selection_ops.copy_region(self.drawing_data, self.selection)
+            self.drawing_data = selection_ops.erase_region(self.drawing_data, self.selection)
+            self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+            self.history.push_patch(self.drawing_data, [(box, before, self.drawing_data.crop(box))])
+            self.record_operation({"op": "cut", **self.selection.to_operation()})
+            self.show_region(box)
+        else:
+            return
             
-    def draw_canvas_border(self):
-        """
-        キャンバスの境界線を描画する
-        """
-        # キャンバスの境界を可視化する（破線の長方形を描画）
-        self.canvas.create_rectangle(
-            0, 0, self.canvas_width - 1, self.canvas_height - 1,
-            outline="#0078D7", dash=(4, 4), width=1, tags="canvas_border"
-        )
+        self.selection = None
+        self.canvas.delete("selection")
         
-    def save_image(self):
+    @handler_tag("paste_clipboard")
+    def paste_clipboard(self):
         """
-        描画した画像を保存する
+        クリップボードのピクセルをコピー元の位置に貼り付ける（確定するまでドラッグで移動できる）
         """
-        file_path = filedialog.asksaveasfilename(
-            defaultextension=".png",
-            filetypes=[("PNG files", "*.png"), ("JPEG files", "*.jpg"), ("All files", "*.*")]
-        )
+        if self.session_recorder:
+            self.session_recorder.record("paste")
+            
+        if not self.clipboard or self.loading_image or self.exporting:
+            return
+            
+        if self.tool not in selection_ops.SELECTION_TOOLS:
+            self.change_tool("select")
+        self.commit_selection()
         
-        if file_path:
-            try:
-                self.drawing_data.save(file_path)
-                messagebox.showinfo("保存成功", f"画像が保存されました: {file_path}")
-            except Exception as e:
-                messagebox.showerror("保存エラー", f"画像の保存中にエラーが発生しました: {e}")
-                
-    def load_image(self):
+        clip = self.clipboard
+        self.floating_clip = selection_ops.Clip(clip.pixels, clip.mask, clip.mode, clip.palette, clip.x, clip.y)
+        self.floating_regions = []
+        self.floating_operation = {"op": "paste"}
+        self.draw_selection_outline()
+        
+    @handler_tag("flood_fill")
+    def flood_fill(self, x, y):
         """
-        画像をロードして表示する
+        指定された位置から塗りつぶしを行う
+        
+        Args:
+            x: X座標
+            y: Y座標
+        """
+        # 座標が画像範囲内かチェック
+        x = max(0, min(x, self.canvas_width - 1))
+        y = max(0, min(y, self.canvas_height - 1))
+        
+        # 現在の色をRGBタプル（インデックスカラーではパレット番号）に変換
+        fill_color = self.canvas_ink(self.hex_to_rgb(self.current_color))
+        
+        # 連結領域ラベルが有効な場合は、既知の領域への代入で塗りつぶして外接矩形だけを更新する
+        if self.region_labels:
+            if self.drawing_data.getpixel((x, y)) == fill_color:
+                return
+            box, mask = self.region_labels.region_at(self.drawing_data, x, y)
+            before = self.drawing_data.crop(box)
+            region_labels.fill_region(self.drawing_data, box, mask, fill_color)
+            self.history.push_patch(self.drawing_data, [(box, before, self.drawing_data.crop(box))])
+            self.show_region(box)
+            self.record_operation({"op": "fill", "x": x, "y": y, "color": self.current_color})
+            return
+        
+        # 塗りつぶす色と同じ場合は何もしない
+        if not canvas_ops.flood_fill(self.drawing_data, x, y, fill_color):
+            return
+            
+        # キャンバスを更新
+        self.update_canvas_from_image()
+        self.save_state()  # 状態を保存
+        self.record_operation({"op": "fill", "x": x, "y": y, "color": self.current_color})
+            
+    def toggle_region_labels(self):
+        """
+        連結領域ラベルによる塗りつぶしの高速化の有効/無効を切り替える
+        ラベルは最初の塗りつぶし（または強調表示）の時に作成し、以降は描画した範囲だけを計算し直す
+        """
+        if self.region_labels_var.get():
+            self.region_labels = region_labels.RegionLabels()
+        else:
+            self.region_labels = None
+            self.hide_fill_highlight()
+            
+    def invalidate_region_labels(self, box=None):
+        """
+        描画で変更された範囲の連結領域ラベルを無効にする
+        
+        Args:
+            box: 変更された矩形（Noneの場合は全体）
+        """
+        if self.region_labels:
+            self.region_labels.invalidate(box)
+            self.hide_fill_highlight()
+            
+    def show_fill_highlight(self, x, y):
+        """
+        マウス位置から塗りつぶされる領域を半透明で強調表示する
+        
+        Args:
+            x: X座標
+            y: Y座標
+        """
+        from PIL import ImageTk
+        label = self.region_labels.label_at(self.drawing_data, x, y)
+        if self.fill_highlight_id and label == self.fill_highlight_label:
+            return
+        self.hide_fill_highlight()
+        
+        box, mask = self.region_labels.region_at(self.drawing_data, x, y)
+        self.fill_highlight_photo = ImageTk.PhotoImage(supersample.downsample(
+            region_labels.highlight_image(mask, self.hex_to_rgb(self.current_color)), self.render_scale))
+        self.fill_highlight_id = self.canvas.create_image(*self.to_view(box[0], box[1]),
+                                                          image=self.fill_highlight_photo, anchor=tk.NW)
+        self.fill_highlight_label = label
+        
+    def hide_fill_highlight(self):
+        """
+        塗りつぶし領域の強調表示を消す
+        """
+        if self.fill_highlight_id:
+            self.canvas.delete(self.fill_highlight_id)
+        self.fill_highlight_id = None
+        self.fill_highlight_label = None
+        self.fill_highlight_photo = None
+        
+    def toggle_vector_mode(self):
+        """
+        ベクターストロークの有効/無効を切り替える
+        有効にした後に描いたペン（線のブラシ）のストロークをオブジェクトとして保持する
+        """
+        if self.vector_var.get():
+            if self.collab_client:
+                self.vector_var.set(False)
+                messagebox.showerror("ベクターストローク", "共同編集中はベクターストロークを使えません")
+                return
+            self.commit_selection()
+            self.vector_layer = vector_layer.VectorLayer(self.drawing_data)
+            state = tk.NORMAL
+        else:
+            # 保持していたストロークは通常のピクセルとしてそのまま残る
+            self.vector_layer = None
+            self.vector_selection = []
+            self.redraw_vector_highlights()
+            if self.tool in VECTOR_TOOLS:
+                self.change_tool("pen")
+            state = tk.DISABLED
+        self.object_eraser_button.config(state=state)
+        self.stroke_select_button.config(state=state)
+        
+    def flatten_vector_strokes(self, box=None):
+        """
+        ストローク以外の描画で書き換えた範囲に掛かるベクターのストロークを通常のピクセルとして確定する
+        
+        Args:
+            box: 書き換えた矩形（Noneの場合は全体）
+        """
+        if self.vector_layer is None:
+            return
+        inks = self.vector_inks() if box is not None else {}
+        flattened = self.vector_layer.flatten(self.drawing_data, inks, box)
+        if flattened and (self.vector_selection or self.vector_hover):
+            strokes = self.vector_layer.strokes
+            self.vector_selection = [stroke for stroke in self.vector_selection if strokes.get(stroke.id) is stroke]
+            self.redraw_vector_highlights()
+            
+    def vector_inks(self):
+        """
+        ベクターのストロークを描き直すためのインクを求める
+        パレットが一杯の場合は描画データがRGBに置き換わるため、描画データを参照する前に呼ぶ
+        
+        Returns:
+            色ごとのインクの辞書
+        """
+        inks = {color: self.canvas_ink(color) for color in self.vector_layer.colors}
+        if self.drawing_data.mode != "P":
+            # 途中でRGBに切り替わった場合は、先に求めたパレット番号を使わない
+            inks = {color: color for color in inks}
+        return inks
+        
+    def start_vector_tool(self, x, y):
+        """
+        オブジェクト消しゴム・ストローク選択ツールの操作を開始する
+        
+        Args:
+            x, y: 座標
+        """
+        if self.vector_layer is None:
+            return
+        self.commit_selection()
+        if self.tool == "object_eraser":
+            self.vector_erase_regions = []
+            self.erase_vector_stroke_at(x, y)
+        else:
+            # 削除キーを受け取れるようにキャンバスにフォーカスを移す
+            self.canvas.focus_set()
+            self.vector_drag_start = (x, y)
+            
+    def update_vector_tool(self, x, y):
+        """
+        ドラッグ中のオブジェクト消しゴム・ストローク選択ツールの処理
+        
+        Args:
+            x, y: 座標
+        """
+        # 読み込み中・書き出し中は描画データを書き換えない（start_vector_toolも呼ばれていない）
+        if self.vector_layer is None or self.loading_image or self.exporting:
+            return
+        if self.tool == "object_eraser":
+            self.erase_vector_stroke_at(x, y)
+        elif self.vector_drag_start is not None:
+            # ラバーバンドは1つの項目の座標だけを更新する
+            view = self.to_view(*self.vector_drag_start, x, y)
+            if self.canvas.find_withtag("vector_rubber_band"):
+                self.canvas.coords("vector_rubber_band", *view)
+            else:
+                self.canvas.create_rectangle(*view, outline="#0078D7", dash=(4, 2), tags="vector_rubber_band")
+                
+    def finish_vector_tool(self, x, y):
+        """
+        オブジェクト消しゴム・ストローク選択ツールの操作を終了する
+        
+        Args:
+            x, y: 座標
+        """
+        if self.vector_layer is None:
+            return
+        if self.tool == "object_eraser":
+            self.record_vector_erase(self.vector_erase_regions)
+            self.vector_erase_regions = []
+            return
+        if self.vector_drag_start is None:
+            return
+        self.canvas.delete("vector_rubber_band")
+        x0, y0 = self.vector_drag_start
+        self.vector_drag_start = None
+        
+        # ほとんど動かさなかった場合はクリックした位置の一番上のストロークを選択する
+        if abs(x - x0) <= 2 * self.render_scale and abs(y - y0) <= 2 * self.render_scale:
+            stroke = self.vector_layer.hit_test(x, y, 4 * self.render_scale)
+            self.vector_selection = [stroke] if stroke else []
+        else:
+            self.vector_selection = self.vector_layer.strokes_in_box(
+                (min(x0, x), min(y0, y), max(x0, x) + 1, max(y0, y) + 1))
+        self.redraw_vector_highlights()
+        
+    def erase_vector_stroke_at(self, x, y):
+        """
+        オブジェクト消しゴムの円に掛かる一番上のストロークを消す
+        
+        Args:
+            x, y: 座標
+        """
+        stroke = self.vector_layer.hit_test(x, y, self.stroke_width / 2)
+        if stroke is not None:
+            self.vector_erase_regions.extend(self.erase_vector_strokes([stroke]))
+            
+    @handler_tag("delete_selected_strokes")
+    def delete_selected_strokes(self):
+        """
+        選択中のストロークを消す
+        """
+        if self.vector_layer is None or not self.vector_selection or self.loading_image or self.exporting:
+            return
+        self.record_vector_erase(self.erase_vector_strokes(self.vector_selection))
+        
+    def erase_vector_strokes(self, strokes):
+        """
+        ストロークを消し、ストロークの外接矩形だけを描き直して表示する
+        
+        Args:
+            strokes: 消すストローク
+            
+        Returns:
+            履歴に記録する(矩形, 変更前, 変更後)のリスト
+        """
+        inks = self.vector_inks()
+        regions = self.vector_layer.erase(strokes, self.drawing_data, inks)
+        for box, _, _ in regions:
+            self.show_region(box, keep_vector_strokes=True)
+        erased = {stroke.id for stroke in strokes}
+        self.vector_selection = [stroke for stroke in self.vector_selection if stroke.id not in erased]
+        self.redraw_vector_highlights()
+        return regions
+        
+    def record_vector_erase(self, regions):
+        """
+        ストロークの消去を履歴に記録する
+        
+        Args:
+            regions: 適用順の(矩形, 変更前, 変更後)のリスト
+        """
+        if not regions:
+            return
+        self.history.push_patch(self.drawing_data, regions)
+        # ストロークの消去は操作として再生できないため状態として記録
+        self.record_state()
+            
+    def show_vector_hover(self, x, y):
+        """
+        マウス位置のストロークを強調表示する（ストロークが変わった場合だけ項目を作り直す）
+        
+        Args:
+            x, y: 座標
+        """
+        tolerance = self.stroke_width / 2 if self.tool == "object_eraser" else 4 * self.render_scale
+        stroke = self.vector_layer.hit_test(x, y, tolerance)
+        if stroke is self.vector_hover:
+            return
+        self.vector_hover = stroke
+        self.canvas.delete("vector_hover")
+        if stroke is not None:
+            self.draw_stroke_highlight(stroke, "#FF8C00", "vector_hover")
+            
+    def redraw_vector_highlights(self):
+        """
+        選択中のストロークとマウス位置のストロークの強調表示を描き直す
+        """
+        self.canvas.delete("vector_selection")
+        self.canvas.delete("vector_hover")
+        self.vector_hover = None
+        for stroke in self.vector_selection:
+            self.draw_stroke_highlight(stroke, "#0078D7", "vector_selection")
+            
+    def draw_stroke_highlight(self, stroke, color, tag):
+        """
+        ストロークの中心線をキャンバスに描く
+        
+        Args:
+            stroke: vector_layer.VectorStroke
+            color: 線の色
+            tag: 項目のタグ
+        """
+        coords = [value for point in stroke.points for value in point]
+        self.canvas.create_line(*self.to_view(*coords), fill=color, width=2, dash=(4, 2), tags=tag)
+        
+    def canvas_ink(self, color):
+        """
+        描画データに描画するためのインクを返す
+        インデックスカラーでパレットが一杯になった場合はRGBモードに切り替える
+        
+        Args:
+            color: 色
+            
+        Returns:
+            RGBモードでは色をそのまま、インデックスカラーではパレット番号
+        """
+        ink = canvas_ops.ink_for(self.drawing_data, color)
+        if ink is None:
+            self.set_drawing_mode("RGB")
+            print(f"パレットが{canvas_ops.INDEXED_MAX_COLORS}色を超えたため、RGBモードに切り替えました")
+            ink = color
+        return ink
+        
+    def toggle_indexed_mode(self):
+        """
+        インデックスカラー（1ピクセル1バイト）モードの有効/無効を切り替える
+        表示と書き出しの時だけRGBに変換するため、描画データと履歴のメモリが約1/3になる
+        """
+        self.commit_selection()
+        if self.indexed_var.get():
+            # サーバーのキャンバスはRGBのため、インデックスカラーでは柔らかいブラシなどの結果が変わってしまう
+            if self.collab_client:
+                self.indexed_var.set(False)
+                messagebox.showerror("インデックスカラー", "共同編集中はインデックスカラーにできません")
+                return
+            if not self.set_drawing_mode("P"):
+                self.indexed_var.set(False)
+                messagebox.showerror(
+                    "インデックスカラー",
+                    f"{canvas_ops.INDEXED_MAX_COLORS}色を超える色が使われているため、インデックスカラーにできません"
+                )
+        else:
+            self.set_drawing_mode("RGB")
+            
+    def set_drawing_mode(self, mode):
+        """
+        描画データのモードを変更する
+        
+        Args:
+            mode: "RGB"または"P"（インデックスカラー）
+            
+        Returns:
+            変更できたかどうか
+        """
+        if self.drawing_data.mode == mode:
+            return True
+        if mode == "P":
+            converted = canvas_ops.to_indexed(self.drawing_data)
+            if converted is None:
+                return False
+        else:
+            converted = self.drawing_data.convert("RGB")
+            
+        previous = self.drawing_data
+        self.drawing_data = converted
+        self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+        self.indexed_var.set(mode == "P")
+        
+        # 描画中のストロークでパレットが一杯になった場合もあるため、RGBへの変換ではストロークを確定しない
+        if self.vector_layer is not None:
+            if mode == "RGB":
+                self.vector_layer.to_rgb(previous.getpalette() if previous.mode == "P" else None)
+            else:
+                self.flatten_vector_strokes()
+        
+        # モードの変更は操作として再生できないためチェックポイントとして記録
+        if self.journal:
+            self.journal.checkpoint(self.drawing_data)
+        return True
+        
+    def hex_to_rgb(self, hex_color):
+        """
+        16進数カラーコードをRGBタプルに変換
+        
+        Args:
+            hex_color: #RRGGBBの形式の色
+            
+        Returns:
+            (R, G, B)のタプル
+        """
+        return canvas_ops.hex_to_rgb(hex_color)
+        
+    @property
+    def stroke_width(self):
+        """
+        描画データに描く線の太さ（ブラシサイズは表示上の太さのため、描画データの倍率を掛ける）
+        """
+        return self.brush_size * self.render_scale
+        
+    def event_point(self, event):
+        """
+        マウスイベントの座標を描画データの座標に変換する
+        
+        Args:
+            event: マウスイベント
+            
+        Returns:
+            (x, y)のタプル
+        """
+        return event.x * self.render_scale, event.y * self.render_scale
+        
+    def to_view(self, *values):
+        """
+        描画データの座標をキャンバスの項目の座標に変換する
+        
+        Args:
+            *values: x, y, ...の並び
+            
+        Returns:
+            表示上の座標のタプル
+        """
+        if self.render_scale == 1:
+            return values
+        return tuple(value / self.render_scale for value in values)
+        
+    def schedule_view_refresh(self):
+        """
+        書き換えたタイルの縮小表示をアイドル時に予約する（予約済みなら何もしない）
+        """
+        if self.tile_refresh_id is None:
+            self.tile_refresh_id = self.root.after_idle(self.refresh_view_tiles)
+            
+    @handler_tag("refresh_view_tiles")
+    def refresh_view_tiles(self):
+        """
+        書き換えたタイルだけを縮小し、タイルごとの表示用の画像に貼り直す
+        """
+        from PIL import ImageTk
+        if self.tile_refresh_id is not None:
+            self.root.after_cancel(self.tile_refresh_id)
+            self.tile_refresh_id = None
+        for tile in self.view_tiles.take_dirty():
+            image = self.view_tiles.render(self.drawing_data, tile)
+            photo = self.tile_photos.get(tile)
+            if photo is not None and (photo.width(), photo.height()) == image.size:
+                photo.paste(image)
+                continue
+            photo = ImageTk.PhotoImage(image)
+            self.tile_photos[tile] = photo
+            item = self.canvas.create_image(*self.view_tiles.view_origin(tile), image=photo, anchor=tk.NW,
+                                            tags="view_tile")
+            # タイルは境界線・選択範囲・予測線などの下に置く
+            self.canvas.tag_lower(item)
+            
+    def update_canvas_from_image(self):
+        """
+        PIL Imageデータからキャンバスを更新
+        """
+        try:
+            from PIL import ImageTk
+            # 現在のキャンバスをクリア
+            self.canvas.delete("all")
+            self.tile_photos = {}
+            
+            if self.render_scale > 1:
+                # 高解像度モードでは全てのタイルを縮小して表示する
+                if self.view_tiles is None or self.view_tiles.size != self.drawing_data.size:
+                    self.view_tiles = supersample.TileGrid(self.drawing_data.size, self.render_scale)
+                self.view_tiles.mark()
+                self.refresh_view_tiles()
+            else:
+                # PIL ImageをTkinter用に変換して表示
+                self.photo = ImageTk.PhotoImage(self.drawing_data)
+                self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW)
+            
+            # 予測と部分的に表示し直した範囲の画像をクリア
+            self.prediction_ids = []
+            self.region_photos = {}
+            self.fill_highlight_id = None
+            self.invalidate_region_labels()
+            self.flatten_vector_strokes()
+            
+            # キャンバスの境界を描画
+            self.draw_canvas_border()
+            
+            # 選択範囲の表示も消えるため描き直す
+            if self.selection or self.floating_clip:
+                self.draw_selection_outline()
+            
+            # 履歴の移動などで描画データのモードが変わった場合にチェックボックスを合わせる
+            self.indexed_var.set(self.drawing_data.mode == "P")
+            
+        except Exception as e:
+            print(f"キャンバス更新エラー: {e}")
+            
+    def draw_canvas_border(self):
+        """
+        キャンバスの境界線を描画する
+        """
+        # キャンバスの境界を可視化する（破線の長方形を描画）
+        self.canvas.create_rectangle(
+            0, 0, self.canvas_width // self.render_scale - 1, self.canvas_height // self.render_scale - 1,
+            outline="#0078D7", dash=(4, 4), width=1, tags="canvas_border"
+        )
+        
+    @handler_tag("save_image")
+    def save_image(self):
+        """
+        描画した画像を保存する（エンコードはバックグラウンドで行う）
+        """
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".png",
+            filetypes=[("PNG files", "*.png"), ("JPEG files", "*.jpg"), ("WebP files", "*.webp"), ("All files", "*.*")]
+        )
+        
+        if file_path:
+            self.start_export([file_path])
+            
+    @handler_tag("export_images")
+    def export_images(self):
+        """
+        PNG・JPEG・WebPの3形式を並列に書き出す
+        """
+        file_path = filedialog.asksaveasfilename(
+            title="一括書き出し（拡張子は形式ごとに付与されます）",
+            filetypes=[("All files", "*.*")]
+        )
+        
+        if file_path:
+            base_path = os.path.splitext(file_path)[0]
+            self.start_export([base_path + extension for extension in (".png", ".jpg", ".webp")])
+            
+    def change_export_preset(self, label):
+        """
+        書き出しプリセットを変更する
+        
+        Args:
+            label: 選択されたプリセットの表示名
+        """
+        for preset, preset_label in image_exporter.PRESET_LABELS.items():
+            if preset_label == label:
+                self.export_preset = preset
+                
+    def start_export(self, file_paths):
+        """
+        描画データの書き出しをバックグラウンドで開始する
+        書き出し中は描画データをコピーせずに共有するため、描画を受け付けない
+        
+        Args:
+            file_paths: 書き出し先のパスのリスト
+        """
+        # 書き出せない拡張子は書き出しを始める前に知らせる
+        try:
+            for file_path in file_paths:
+                image_exporter.detect_format(file_path)
+        except ValueError as e:
+            messagebox.showerror("保存エラー", str(e))
+            return
+            
+        self.commit_selection()
+        self.exporting = True
+        image = self.drawing_data
+        if self.render_scale > 1 and self.export_view_size_var.get():
+            # 表示の解像度に縮小したコピーを書き出す
+            image = supersample.downsample(image, self.render_scale)
+        futures = image_exporter.export_many(image, file_paths, self.io_executor,
+                                             preset=self.export_preset)
+        self.root.after(20, self.finish_export, futures, file_paths)
+        
+    @handler_tag("finish_export")
+    def finish_export(self, futures, file_paths):
+        """
+        バックグラウンドでの書き出しの完了を待って結果を表示する
+        
+        Args:
+            futures: 書き出し処理のFutureのリスト
+            file_paths: 書き出し先のパスのリスト
+        """
+        if not all(future.done() for future in futures):
+            self.root.after(20, self.finish_export, futures, file_paths)
+            return
+            
+        self.exporting = False
+        errors = [f"{path}: {future.exception()}" for path, future in zip(file_paths, futures)
+                  if future.exception() is not None]
+        if errors:
+            messagebox.showerror("保存エラー", "画像の保存中にエラーが発生しました:\n" + "\n".join(errors))
+        else:
+            messagebox.showinfo("保存成功", "画像が保存されました: " + ", ".join(file_paths))
+            
+    @handler_tag("load_image")
+    def load_image(self):
+        """
+        画像をロードして表示する
+        縮小デコードできる形式はプレビューをすぐに表示し、
+        フル解像度のデコードとモード変換はバックグラウンドで行う
         """
         file_path = filedialog.askopenfilename(
             filetypes=[("PNG files", "*.png"), ("JPEG files", "*.jpg"), ("All files", "*.*")]
@@ -585,15 +1979,16 @@ class PaintApp:
                 # キャンバスをクリア
                 self.clear_canvas()
                 
-                # 画像を読み込む
-                loaded_image = Image.open(file_path)
+                # ヘッダだけを読んでサイズを取得（デコードはまだ行わない）
+                image_width, image_height = image_loader.read_image_size(file_path)
+                target_size = None
                 
                 # リサイズが必要な場合はリサイズする
-                if loaded_image.width != self.canvas_width or loaded_image.height != self.canvas_height:
+                if image_width != self.canvas_width or image_height != self.canvas_height:
                     # キャンバスサイズを読み込んだ画像に合わせるかユーザーに確認
                     result = messagebox.askyesnocancel(
                         "サイズ調整",
-                        f"読み込んだ画像のサイズ ({loaded_image.width}x{loaded_image.height}) がキャンバスサイズ ({self.canvas_width}x{self.canvas_height}) と異なります。\n\n" +
+                        f"読み込んだ画像のサイズ ({image_width}x{image_height}) がキャンバスサイズ ({self.canvas_width}x{self.canvas_height}) と異なります。\n\n" +
                         "「はい」: キャンバスサイズを画像に合わせる\n" +
                         "「いいえ」: 画像をキャンバスサイズにリサイズする\n" +
                         "「キャンセル」: 読み込みを中止する"
@@ -602,44 +1997,81 @@ class PaintApp:
                     if result is None:  # キャンセル
                         return
                     elif result:  # はい - キャンバスサイズを画像に合わせる
-                        self.canvas_width = loaded_image.width
-                        self.canvas_height = loaded_image.height
-                        
-                        # エントリーフィールドを更新
-                        self.width_entry.delete(0, tk.END)
-                        self.width_entry.insert(0, str(self.canvas_width))
-                        self.height_entry.delete(0, tk.END)
-                        self.height_entry.insert(0, str(self.canvas_height))
-                        
-                        # キャンバスウィジェットのサイズを更新
-                        self.canvas.config(width=self.canvas_width, height=self.canvas_height)
-                    else:  # いいえ - 画像をリサイズ
-                        loaded_image = loaded_image.resize((self.canvas_width, self.canvas_height))
+                        self.set_canvas_size(image_width, image_height)
+                    else:  # いいえ - 画像をリサイズ（バックグラウンドで行う）
+                        target_size = (self.canvas_width, self.canvas_height)
                 
-                # 描画データを更新
-                self.drawing_data = loaded_image
-                self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+                # 縮小デコードしたプレビューを先に表示
+                preview = image_loader.open_preview(file_path, (self.canvas_width // self.render_scale,
+                                                                self.canvas_height // self.render_scale))
+                if preview is not None:
+                    from PIL import ImageTk
+                    self.photo = ImageTk.PhotoImage(preview)
+                    self.canvas.delete("all")
+                    self.tile_photos = {}
+                    self.region_photos = {}
+                    self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW)
+                    self.draw_canvas_border()
                 
-                # キャンバスに表示
-                from PIL import ImageTk
-                self.photo = ImageTk.PhotoImage(loaded_image)
-                self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW)
-                
-                # 状態を履歴に保存
-                self.save_state()
-                
-                messagebox.showinfo("読み込み成功", f"画像を読み込みました: {file_path}")
+                # フル解像度のデコードをバックグラウンドで開始（読み込み中は描画を受け付けない）
+                self.load_generation += 1
+                self.loading_image = True
+                future = self.io_executor.submit(image_loader.load_full, file_path, target_size)
+                self.root.after(20, self.finish_load_image, future, file_path, self.load_generation)
                 
             except Exception as e:
                 messagebox.showerror("読み込みエラー", f"画像の読み込み中にエラーが発生しました: {e}")
                 
+    @handler_tag("finish_load_image")
+    def finish_load_image(self, future, file_path, generation):
+        """
+        バックグラウンドでの画像読み込みの完了を待ち、描画データに反映する
+        
+        Args:
+            future: 読み込み処理のFuture
+            file_path: 画像のパス
+            generation: 読み込みの世代（新しい読み込みが始まっていれば結果は破棄する）
+        """
+        if generation != self.load_generation:
+            return
+        if not future.done():
+            self.root.after(20, self.finish_load_image, future, file_path, generation)
+            return
+            
+        self.loading_image = False
+        try:
+            loaded_image = future.result()
+        except Exception as e:
+            self.update_canvas_from_image()
+            messagebox.showerror("読み込みエラー", f"画像の読み込み中にエラーが発生しました: {e}")
+            return
+            
+        # 描画データを更新
+        self.drawing_data = loaded_image
+        self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+        
+        # キャンバスに表示
+        self.update_canvas_from_image()
+        
+        # 状態を履歴に保存
+        self.save_state()
+        
+        # 読み込んだ画像は操作から再生できないため状態として記録
+        self.record_state()
+        
+        messagebox.showinfo("読み込み成功", f"画像を読み込みました: {file_path}")
+        
+    @handler_tag("clear_canvas")
     def clear_canvas(self):
         """
         キャンバスをクリアする
         """
-        self.save_state()  # 現在の状態を保存してからクリア
+        self.commit_selection()
         self.canvas.delete("all")
-        self.drawing_data = Image.new("RGB", (self.canvas_width, self.canvas_height), "white")
+        self.tile_photos = {}
+        self.region_photos = {}
+        self.drawing_data = canvas_ops.new_canvas_image(self.canvas_width, self.canvas_height,
+                                                        self.drawing_data.mode)
         self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
         
         # ストローク予測データもクリア
@@ -648,7 +2080,13 @@ class PaintApp:
         
         # キャンバスをクリアした後に境界線を再描画
         self.draw_canvas_border()
+        self.flatten_vector_strokes()
+        
+        # クリアした状態を履歴に保存（以降の部分的な変更はこの状態に適用する）
+        self.save_state()
+        self.record_operation({"op": "clear"})
         
+    @handler_tag("resize_canvas")
     def resize_canvas(self):
         """
         キャンバスのサイズを変更する
@@ -658,41 +2096,25 @@ class PaintApp:
             new_width = int(self.width_entry.get())
             new_height = int(self.height_entry.get())
             
-            # 値の範囲チェック
-            if new_width < 50 or new_width > 2000 or new_height < 50 or new_height > 2000:
-                messagebox.showerror("サイズエラー", "キャンバスサイズは50から2000の範囲で設定してください")
+            # 値の範囲チェック（高解像度モードでは描画データの倍率を掛けた範囲）
+            low, high = 50 * self.render_scale, 2000 * self.render_scale
+            if new_width < low or new_width > high or new_height < low or new_height > high:
+                messagebox.showerror("サイズエラー", f"キャンバスサイズは{low}から{high}の範囲で設定してください")
                 return
                 
             # 現在のサイズと同じ場合は何もしない
             if new_width == self.canvas_width and new_height == self.canvas_height:
                 return
                 
-            # 現在の状態を保存
-            self.save_state()
+            # 移動中の選択範囲を確定する
+            self.commit_selection()
             
-            # 古い描画データを保存
-            old_drawing_data = self.drawing_data.copy()
-            
-            # 新しいサイズを設定
-            self.canvas_width = new_width
-            self.canvas_height = new_height
-            
-            # 新しい描画データを作成
-            self.drawing_data = Image.new("RGB", (self.canvas_width, self.canvas_height), "white")
+            # 新しい描画データを作成し、既存の描画内容を左上からコピー（可能な範囲で）
+            self.drawing_data = canvas_ops.resize_canvas_image(self.drawing_data, new_width, new_height)
             self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
             
-            # 既存の描画内容を新しいキャンバスにコピー（可能な範囲で）
-            paste_width = min(old_drawing_data.width, self.canvas_width)
-            paste_height = min(old_drawing_data.height, self.canvas_height)
-            
-            if paste_width > 0 and paste_height > 0:
-                # 既存の内容を左上から貼り付け
-                crop_box = (0, 0, paste_width, paste_height)
-                cropped_old_data = old_drawing_data.crop(crop_box)
-                self.drawing_data.paste(cropped_old_data, (0, 0))
-            
-            # キャンバスウィジェットのサイズを更新
-            self.canvas.config(width=self.canvas_width, height=self.canvas_height)
+            # 新しいサイズを設定
+            self.set_canvas_size(new_width, new_height)
             
             # ストローク予測データをクリア
             self.stroke_predictor.clear()
@@ -701,6 +2123,10 @@ class PaintApp:
             # キャンバスの表示を更新
             self.update_canvas_from_image()
             
+            # サイズを変更した状態を履歴に保存（以降の部分的な変更はこの状態に適用する）
+            self.save_state()
+            self.record_operation({"op": "resize", "width": new_width, "height": new_height})
+            
             messagebox.showinfo("サイズ変更完了", f"キャンバスサイズを {self.canvas_width}x{self.canvas_height} に変更しました")
             
         except ValueError:
@@ -708,48 +2134,613 @@ class PaintApp:
         except Exception as e:
             messagebox.showerror("サイズ変更エラー", f"キャンバスサイズの変更中にエラーが発生しました: {e}")
         
+    def set_canvas_size(self, width, height):
+        """
+        キャンバスのサイズを設定し、入力欄とキャンバスウィジェットに反映する
+        
+        Args:
+            width: 新しい幅
+            height: 新しい高さ
+        """
+        self.canvas_width = width
+        self.canvas_height = height
+        
+        # エントリーフィールドを更新
+        self.width_entry.delete(0, tk.END)
+        self.width_entry.insert(0, str(self.canvas_width))
+        self.height_entry.delete(0, tk.END)
+        self.height_entry.insert(0, str(self.canvas_height))
+        
+        # キャンバスウィジェットのサイズを更新（表示の大きさ）
+        self.canvas.config(width=self.canvas_width // self.render_scale,
+                           height=self.canvas_height // self.render_scale)
+        
     def save_state(self):
         """
         現在のキャンバスの状態を履歴に保存する
         """
-        # 履歴に新しい状態を追加すると、それより後の履歴は破棄される
-        if self.history_index < len(self.history) - 1:
-            self.history = self.history[:self.history_index + 1]
+        # 履歴ストアがコピーを保持し、予算に応じて古い履歴を圧縮・退避する
+        self.history.push(self.drawing_data)
+        
+    @handler_tag("undo")
+    def undo(self):
+        """
+        1つ前の状態に戻す
+        """
+        if self.session_recorder:
+            self.session_recorder.record("undo")
             
-        # 現在の描画データをコピーして保存
-        current_state = self.drawing_data.copy()
+        self.commit_selection()
         
-        # 履歴の上限を超える場合、最も古い履歴を削除
-        if len(self.history) >= self.max_history:
-            self.history.pop(0)
-            # インデックスを調整（先頭を削除したので1つ減らす）
-            # ただしインデックスは増加させる必要がある（新しい状態を追加するため）
-            # 結果として相殺されてインデックスは変わらない
-        else:
-            self.history_index += 1
+        if self.collab_client:
+            if self.history.can_undo:
+                self.jump_shared_history(self.history.index - 1)
+            return
+        # 部分的な変更の履歴は現在の描画データの矩形だけを書き戻す（書き出し中は共有しているため新しい画像にする）
+        self.show_history_state(self.history.undo(None if self.exporting else self.drawing_data))
+            
+    @handler_tag("redo")
+    def redo(self):
+        """
+        取り消した操作をやり直す
+        """
+        if self.session_recorder:
+            self.session_recorder.record("redo")
             
-        self.history.append(current_state)
+        self.commit_selection()
+        if self.collab_client:
+            if self.history.can_redo:
+                self.jump_shared_history(self.history.index + 1)
+            return
+        self.show_history_state(self.history.redo(None if self.exporting else self.drawing_data))
         
-    def undo(self):
+    @handler_tag("jump_to_history")
+    def jump_to_history(self, index):
         """
-        1つ前の状態に戻す
+        指定位置の履歴の状態に直接移動する（間の状態は表示しない）
+        
+        Args:
+            index: 履歴の位置
+        """
+        if self.session_recorder:
+            self.session_recorder.record("jump", index)
+            
+        self.commit_selection()
+        if self.collab_client:
+            self.jump_shared_history(index)
+            return
+        self.show_history_state(self.history.jump(index, None if self.exporting else self.drawing_data))
+        
+    def jump_shared_history(self, index):
+        """
+        共同編集中に履歴を移動する
+        描画データ全体は置き換えず、移動で変わるピクセルだけを貼り付け操作として適用・送信する
+        （履歴にない他の人の描画は、変わるピクセルと重ならない限り残る）
+        
+        Args:
+            index: 履歴の位置
         """
-        if self.history_index > 0:
-            self.history_index -= 1
-            self.drawing_data = self.history[self.history_index].copy()
+        if not 0 <= index < len(self.history) or index == self.history.index:
+            return
+        source = self.history.get(self.history.index)
+        target = self.history.jump(index)
+        
+        # 他の人の操作と同じくサーバーでの順序で適用されるため、描画中の他の人のストロークを消さない
+        if source.size != target.size:
+            source = canvas_ops.resize_canvas_image(source, target.width, target.height)
+            self.drawing_data = canvas_ops.resize_canvas_image(self.drawing_data, target.width, target.height)
             self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+            self.set_canvas_size(target.width, target.height)
             self.update_canvas_from_image()
+            self.record_operation({"op": "resize", "width": target.width, "height": target.height})
+        clip = selection_ops.difference_clip(source, target)
+        if clip is None:
+            return
+        # 書き出し中は描画データを共有しているため新しい画像に貼り付ける
+        image = self.drawing_data.copy() if self.exporting else self.drawing_data
+        self.drawing_data, box = selection_ops.paste_clip(image, clip)
+        self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+        if box:
+            self.show_region(box)
+        self.record_operation({"op": "paste", "x": clip.x, "y": clip.y, "png": clip.to_png()})
+        
+    def show_history_state(self, state):
+        """
+        履歴から取り出した状態を描画データにして一度だけ表示し直す
+        
+        Args:
+            state: 履歴の状態の画像（移動できなかった場合はNone）
+        """
+        if state is None:
+            return
+        self.drawing_data = state
+        self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+        self.update_canvas_from_image()
+        
+        # 履歴の移動は操作として再生できないため状態として記録
+        self.record_state()
             
-    def redo(self):
+    def open_history_panel(self):
         """
-        取り消した操作をやり直す
+        履歴パネルを開く（開いている間は履歴の変化を定期的に確認して表示を更新する）
+        """
+        if self.history_panel is not None:
+            self.history_panel.lift()
+            return
+        self.history_panel = tk.Toplevel(self.root)
+        self.history_panel.title("履歴")
+        self.history_panel.protocol("WM_DELETE_WINDOW", self.close_history_panel)
+        
+        width = history_thumbnails.THUMBNAIL_SIZE[0] + 60
+        scrollbar = tk.Scrollbar(self.history_panel, orient=tk.VERTICAL)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.history_canvas = tk.Canvas(self.history_panel, width=width, height=480, bg="white",
+                                        yscrollcommand=scrollbar.set)
+        self.history_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=tk.YES)
+        scrollbar.config(command=self.history_canvas.yview)
+        self.history_canvas.bind("<Button-1>", self.on_history_click)
+        
+        self.history_panel_state = None
+        self.poll_history_panel()
+        
+    def close_history_panel(self):
+        """
+        履歴パネルを閉じる（作成済みのサムネイルのキャッシュは残す）
+        """
+        if self.history_panel is not None:
+            self.history_panel.destroy()
+        self.history_panel = None
+        self.history_canvas = None
+        self.history_photos = {}
+        
+    @handler_tag("poll_history_panel")
+    def poll_history_panel(self):
         """
-        if self.history_index < len(self.history) - 1:
-            self.history_index += 1
-            self.drawing_data = self.history[self.history_index].copy()
+        履歴の変化を確認し、足りないサムネイルの作成をワーカーに依頼して表示を更新する
+        """
+        if self.history_panel is None:
+            return
+        serials = self.history.serials
+        redraw = (serials, self.history.index) != self.history_panel_state
+        
+        job = self.history_thumbnail_job
+        if job is not None and job.done():
+            self.history_thumbnail_job = None
+            try:
+                self.history_thumbnails.update(job.result(), serials)
+                redraw = True
+            except Exception as e:
+                print(f"サムネイルの作成に失敗しました: {e}")
+                
+        if self.history_thumbnail_job is None:
+            missing = self.history_thumbnails.missing(serials)
+            if missing:
+                # 履歴ストアへの参照だけをここで取り出し、状態の組み立てと縮小はワーカーで行う
+                snapshots = self.history.snapshot(serials.index(missing[0]))
+                self.history_thumbnail_job = self.io_executor.submit(
+                    history_thumbnails.render_thumbnails, snapshots, missing)
+                
+        if redraw:
+            self.redraw_history_panel(serials)
+        self.root.after(100, self.poll_history_panel)
+        
+    def redraw_history_panel(self, serials):
+        """
+        履歴パネルのサムネイルと現在位置の枠を描き直す
+        
+        Args:
+            serials: 履歴の通し番号
+        """
+        from PIL import ImageTk
+        self.history_panel_state = (serials, self.history.index)
+        canvas = self.history_canvas
+        canvas.delete("all")
+        row_height = history_thumbnails.THUMBNAIL_SIZE[1] + 8
+        for index, serial in enumerate(serials):
+            top = index * row_height + 4
+            if index == self.history.index:
+                canvas.create_rectangle(2, top - 3, int(canvas["width"]) - 2, top + row_height - 5,
+                                        outline="#0078D7", width=2)
+            photo = self.history_photos.get(serial)
+            thumbnail = self.history_thumbnails.get(serial)
+            if photo is None and thumbnail is not None:
+                photo = ImageTk.PhotoImage(thumbnail)
+                self.history_photos[serial] = photo
+            if photo is not None:
+                canvas.create_image(8, top, image=photo, anchor=tk.NW)
+            canvas.create_text(history_thumbnails.THUMBNAIL_SIZE[0] + 14, top, text=str(index), anchor=tk.NW)
+        canvas.config(scrollregion=(0, 0, 0, len(serials) * row_height + 4))
+        
+        # 履歴から消えた状態の表示用の画像を破棄する
+        live = set(serials)
+        self.history_photos = {serial: photo for serial, photo in self.history_photos.items() if serial in live}
+        
+    def on_history_click(self, event):
+        """
+        履歴パネルでクリックしたサムネイルの状態に移動する
+        
+        Args:
+            event: マウスイベント
+        """
+        row_height = history_thumbnails.THUMBNAIL_SIZE[1] + 8
+        index = int(self.history_canvas.canvasy(event.y) // row_height)
+        if 0 <= index < len(self.history):
+            self.jump_to_history(index)
+            
+    def start_autosave(self, journal_path, recover=False):
+        """
+        自動保存ジャーナルを開始する
+        
+        Args:
+            journal_path: ジャーナルのパス
+            recover: 既存のジャーナルから復旧する場合はTrue
+        """
+        recovered = False
+        if recover:
+            image = replay_journal(journal_path)
+            if image is not None:
+                self.drawing_data = image
+                self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+                self.set_canvas_size(image.width, image.height)
+                self.update_canvas_from_image()
+                self.save_state()
+                recovered = True
+                print(f"ジャーナルから復旧しました: {journal_path}")
+            else:
+                messagebox.showerror("復旧エラー", "ジャーナルから復旧できませんでした")
+        
+        self.journal = AutosaveJournal(journal_path)
+        self.journal.start(self.drawing_data, recovered=recovered)
+        
+    def record_operation(self, operation):
+        """
+        描画操作を自動保存ジャーナルに記録する
+        
+        Args:
+            operation: canvas_ops.apply_operationで再生できる操作
+        """
+        # ストロークは描画中に線分ごとに送信済み
+        if self.collab_client and operation["op"] != "stroke":
+            self.collab_client.send(operation)
+        if self.timelapse_recorder:
+            self.timelapse_recorder.record(operation)
+            
+        if not self.journal:
+            return
+        self.journal.record(operation)
+        
+        # 一定数の操作ごとにチェックポイントを書いてジャーナルを圧縮
+        if self.journal.checkpoint_due:
+            self.journal.checkpoint(self.drawing_data)
+            
+    def record_state(self):
+        """
+        操作として再生できない変化（アンドゥ・読み込みなど）の後の状態を記録する
+        自動保存ジャーナルにはチェックポイント、共同編集にはキャンバス全体を送る
+        （共同編集中の履歴の移動はjump_shared_historyで操作として送るため、全体を送るのは読み込みだけ）
+        """
+        if self.collab_client:
+            self.collab_client.send_snapshot(self.drawing_data)
+        if self.journal:
+            self.journal.checkpoint(self.drawing_data)
+        if self.timelapse_recorder:
+            self.timelapse_recorder.record_state(self.drawing_data)
+            
+    def connect_collaboration(self, host, port):
+        """
+        共同編集サーバーに接続し、サーバー上のキャンバスから編集を始める
+        （接続前の履歴には戻れないように履歴を破棄する）
+        
+        Args:
+            host: サーバーのアドレス
+            port: サーバーのポート
+        """
+        # サーバーのキャンバスと操作は表示の解像度のため、高解像度モードでは共有できない
+        if self.render_scale > 1:
+            messagebox.showerror("接続エラー", "高解像度モードでは共同編集に接続できません")
+            return
+        # ストロークの消去は操作として送信できないため、ベクターストロークとは併用できない
+        if self.vector_layer is not None:
+            messagebox.showerror("接続エラー", "ベクターストロークが有効な間は共同編集に接続できません")
+            return
+            
+        client = CollabClient(host, port)
+        try:
+            snapshot = client.connect()
+        except OSError as e:
+            messagebox.showerror("接続エラー", f"共同編集サーバーに接続できませんでした: {e}")
+            return
+            
+        self.collab_client = client
+        self.drawing_data = snapshot
+        self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+        self.set_canvas_size(snapshot.width, snapshot.height)
+        self.update_canvas_from_image()
+        self.history.clear()
+        self.save_state()
+        
+        self.root.after(30, self.poll_collaboration)
+        print(f"共同編集サーバーに接続しました: {host}:{port}")
+        
+    @handler_tag("poll_collaboration")
+    def poll_collaboration(self):
+        """
+        他のクライアントの操作を定期的に取り出して反映する
+        """
+        if not self.collab_client:
+            return
+        for operation in self.collab_client.receive_operations():
+            self.apply_remote_operation(operation)
+        self.root.after(30, self.poll_collaboration)
+        
+    def apply_remote_operation(self, operation):
+        """
+        他のクライアントの操作を通常の描画処理で反映する
+        （自分のアンドゥ履歴には追加しない）
+        
+        Args:
+            operation: canvas_ops.apply_operationで再生できる操作
+        """
+        kind = operation["op"]
+        if kind == "stroke":
+            points = operation["points"]
+            for i in range(1, len(points)):
+                x1, y1 = points[i - 1]
+                x2, y2 = points[i]
+                self.draw_line_segment(x1, y1, x2, y2, operation["color"], operation["width"])
+            if operation["color"] == "white":
+                self.canvas.tag_raise("canvas_border")
+        elif kind == "shape":
+            points = [tuple(point) for point in operation["points"]]
+            box = canvas_ops.shape_bounds(points, operation["width"], (self.canvas_width, self.canvas_height))
+            ink = self.canvas_ink(operation["color"])
+            canvas_ops.draw_shape(self.drawing_data_draw, operation["shape"], points, ink, operation["width"])
+            if box:
+                self.show_region(box)
+        elif kind == "brush":
+            ink = self.canvas_ink(operation["color"])
+            box = brush_engine.replay_brush(self.drawing_data, operation,
+                                            ink if self.drawing_data.mode == "P" else None)
+            if box:
+                self.show_region(box)
+        elif kind == "fill":
+            fill_color = self.canvas_ink(self.hex_to_rgb(operation["color"]))
+            if canvas_ops.flood_fill(self.drawing_data, operation["x"], operation["y"], fill_color):
+                self.update_canvas_from_image()
+        elif kind == "resize":
+            self.drawing_data = canvas_ops.resize_canvas_image(
+                self.drawing_data, operation["width"], operation["height"])
+            self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+            self.set_canvas_size(operation["width"], operation["height"])
+            self.update_canvas_from_image()
+        elif kind == "clear":
+            self.drawing_data = canvas_ops.new_canvas_image(self.canvas_width, self.canvas_height,
+                                                            self.drawing_data.mode)
             self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
             self.update_canvas_from_image()
+        elif kind in selection_ops.SELECTION_OPERATIONS:
+            self.drawing_data = canvas_ops.apply_operation(self.drawing_data, operation)
+            self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+            self.update_canvas_from_image()
+        elif kind == "snapshot":
+            # 他の人が読み込んだ画像のキャンバス全体
+            self.drawing_data = operation["image"]
+            self.drawing_data_draw = ImageDraw.Draw(self.drawing_data)
+            self.set_canvas_size(self.drawing_data.width, self.drawing_data.height)
+            self.update_canvas_from_image()
+            if self.journal:
+                self.journal.checkpoint(self.drawing_data)
+            if self.timelapse_recorder:
+                self.timelapse_recorder.record_state(self.drawing_data)
+            return
+            
+        # 自動保存ジャーナルとタイムラプスにも記録（サーバーには送り返さない）
+        if self.journal:
+            self.journal.record(operation)
+        if self.timelapse_recorder:
+            self.timelapse_recorder.record(operation)
+            
+    def toggle_profiling(self):
+        """
+        プロファイル取得の開始/停止を切り替える
+        """
+        if self.profile_var.get():
+            self.start_profiling()
+        else:
+            output_path = self.stop_profiling()
+            if output_path:
+                messagebox.showinfo("プロファイル", f"プロファイルを書き出しました: {output_path}")
+                
+    def start_profiling(self, output_path=None):
+        """
+        サンプリングプロファイラを開始する
+        
+        Args:
+            output_path: collapsed形式の出力先（Noneの場合は既定のパス）
+        """
+        if self.profiler:
+            return
+        self.profile_output_path = output_path or default_output_path()
+        self.profiler = SamplingProfiler()
+        self.profiler.start()
+        self.profile_var.set(True)
+        print(f"プロファイルを開始しました: {self.profile_output_path}")
+        
+    def stop_profiling(self):
+        """
+        サンプリングプロファイラを停止して結果を書き出す
+        
+        Returns:
+            出力先のパス（プロファイラが動いていない場合はNone）
+        """
+        if not self.profiler:
+            return None
+        self.profiler.stop()
+        output_path = self.profile_output_path
+        self.profiler.write_collapsed(output_path)
+        print(f"プロファイルを書き出しました: {output_path} ({self.profiler.sample_count}サンプル)")
+        self.profiler = None
+        self.profile_var.set(False)
+        return output_path
+        
+    def toggle_recording(self):
+        """
+        入力セッションの記録の開始/停止を切り替える
+        """
+        if self.record_var.get():
+            self.start_recording()
+        else:
+            output_path = self.stop_recording()
+            if output_path:
+                messagebox.showinfo("操作の記録", f"操作の記録を書き出しました: {output_path}")
+                
+    def start_recording(self, output_path=None):
+        """
+        入力セッションの記録を開始する
+        （クリア・サイズ変更・読み込み・選択範囲の編集は記録されないため、再生の比較には使えない）
+        
+        Args:
+            output_path: 記録先のパス（Noneの場合は既定のパス）
+        """
+        if self.session_recorder:
+            return
+        self.session_recorder = SessionRecorder(output_path or default_session_path(), self)
+        self.record_var.set(True)
+        print(f"操作の記録を開始しました: {self.session_recorder.output_path}")
+        
+    def stop_recording(self):
+        """
+        入力セッションの記録を終了する
+        
+        Returns:
+            記録先のパス（記録していない場合はNone）
+        """
+        if not self.session_recorder:
+            return None
+        recorder = self.session_recorder
+        self.session_recorder = None
+        recorder.close()
+        self.record_var.set(False)
+        print(f"操作の記録を書き出しました: {recorder.output_path} ({recorder.event_count}イベント)")
+        return recorder.output_path
+        
+    def toggle_timelapse(self):
+        """
+        タイムラプス用の記録の開始/停止を切り替える
+        """
+        if self.timelapse_var.get():
+            self.start_timelapse()
+        else:
+            self.stop_timelapse()
             
+    def start_timelapse(self, output_path=None):
+        """
+        タイムラプス用に描画操作の記録を開始する
+        
+        Args:
+            output_path: 記録先のパス（Noneの場合は既定のパス）
+        """
+        if self.timelapse_recorder:
+            return
+        self.commit_selection()
+        self.timelapse_recorder = TimelapseRecorder(output_path or default_timelapse_path(), self.drawing_data)
+        self.timelapse_var.set(True)
+        print(f"タイムラプスの記録を開始しました: {self.timelapse_recorder.output_path}")
+        
+    def stop_timelapse(self):
+        """
+        タイムラプス用の記録を終了する
+        
+        Returns:
+            記録先のパス（記録していない場合はNone）
+        """
+        if not self.timelapse_recorder:
+            return None
+        recorder = self.timelapse_recorder
+        self.timelapse_recorder = None
+        recorder.close()
+        self.timelapse_var.set(False)
+        print(f"タイムラプスの記録を終了しました: {recorder.output_path} ({recorder.operation_count}操作)")
+        return recorder.output_path
+        
+    def export_timelapse(self):
+        """
+        タイムラプスをバックグラウンドで書き出す（記録中ならその記録、そうでなければ記録ファイルを選択）
+        """
+        if self.exporting_timelapse:
+            return
+        if self.timelapse_recorder:
+            self.timelapse_recorder.flush()
+            recording_path = self.timelapse_recorder.output_path
+        else:
+            recording_path = filedialog.askopenfilename(
+                filetypes=[("タイムラプスの記録", "*.jsonl"), ("すべてのファイル", "*.*")])
+            if not recording_path:
+                return
+        output_path = filedialog.asksaveasfilename(
+            defaultextension=".gif",
+            filetypes=[("GIFアニメーション", "*.gif"), ("WebPアニメーション", "*.webp"), ("連番PNG", "*.png")]
+        )
+        if not output_path:
+            return
+        
+        # フレームはワーカーで1枚ずつ生成・エンコードする（描画データは共有しない）
+        # 長い記録でも300フレーム程度になるよう、1フレームに複数の操作をまとめる
+        self.exporting_timelapse = True
+        future = self.io_executor.submit(timelapse.export_timelapse, recording_path, output_path,
+                                         max_frames=300)
+        self.root.after(20, self.finish_timelapse_export, future, output_path)
+        
+    def finish_timelapse_export(self, future, output_path):
+        """
+        タイムラプスの書き出しの完了を待つ
+        
+        Args:
+            future: 書き出し処理のFuture
+            output_path: 書き出し先のパス
+        """
+        if not future.done():
+            self.root.after(20, self.finish_timelapse_export, future, output_path)
+            return
+        self.exporting_timelapse = False
+        try:
+            frame_count = future.result()
+        except Exception as e:
+            messagebox.showerror("書き出しエラー", f"タイムラプスの書き出し中にエラーが発生しました: {e}")
+            return
+        messagebox.showinfo("書き出し成功", f"タイムラプスを書き出しました: {output_path} ({frame_count}フレーム)")
+        
+    def on_close(self):
+        """
+        ウィンドウを閉じる時の処理（正常終了なのでジャーナルは削除する）
+        """
+        self.close()
+        self.root.destroy()
+        
+    def close(self):
+        """
+        ドキュメントを閉じる時の後始末（ウィジェットは破棄しない）
+        """
+        # 読み込み中の画像は破棄する
+        self.load_generation += 1
+        self.close_history_panel()
+        if self.collab_client:
+            self.collab_client.close()
+            self.collab_client = None
+        self.stop_profiling()
+        self.stop_recording()
+        self.stop_timelapse()
+        if self.journal:
+            self.journal.close(discard=True)
+            self.journal = None
+        self.history.close()
+        # 学習待ちのストロークを学習して保存し終えるまで待つ（モデルは全てのドキュメントで共有）
+        if self.stroke_predictor.adaptive_model is not None:
+            self.stroke_predictor.adaptive_model.flush()
+        if self.owns_io_executor:
+            self.io_executor.shutdown(wait=False)
+        
+    @handler_tag("show_brush_preview")
     def show_brush_preview(self, event):
         """
         マウス位置にブラシサイズのプレビューを表示
@@ -757,14 +2748,23 @@ class PaintApp:
         Args:
             event: マウスイベント
         """
-        # ツールが「塗りつぶし」の場合はプレビューを表示しない
+        event_x, event_y = self.event_point(event)
+        
+        # ツールが「塗りつぶし」の場合はプレビューを表示しない（連結領域ラベルが有効なら塗りつぶす領域を強調表示）
         if self.tool == "fill":
             self.hide_brush_preview(None)
+            if self.region_labels and not (self.loading_image or self.exporting):
+                self.show_fill_highlight(max(0, min(event_x, self.canvas_width - 1)),
+                                         max(0, min(event_y, self.canvas_height - 1)))
             return
             
-        # キャンバス境界内に座標を制限
-        x = max(0, min(event.x, self.canvas_width - 1))
-        y = max(0, min(event.y, self.canvas_height - 1))
+        # ベクターのストロークを扱うツールではマウス位置のストロークを強調表示する
+        if self.tool in VECTOR_TOOLS and self.vector_layer is not None and not (self.loading_image or self.exporting):
+            self.show_vector_hover(event_x, event_y)
+            
+        # キャンバス境界内に座標を制限（プレビューは表示上の座標で描く）
+        x = max(0, min(event.x, self.canvas_width // self.render_scale - 1))
+        y = max(0, min(event.y, self.canvas_height // self.render_scale - 1))
         
         # 以前のプレビューを削除
         if self.brush_preview_id:
@@ -781,7 +2781,7 @@ class PaintApp:
                 x + self.brush_size//2, y + self.brush_size//2,
                 outline=preview_color, width=1
             )
-        elif self.tool == "eraser":
+        elif self.tool in ("eraser", "object_eraser"):
             # 塗りつぶしなしの輪郭のみの円（消しゴムツールの場合）
             self.brush_preview_id = self.canvas.create_oval(
                 x - self.brush_size//2, y - self.brush_size//2,
@@ -794,8 +2794,12 @@ class PaintApp:
         ブラシプレビューを非表示にする
         
         Args:
-            event: マウスイベント
+            event: マウスイベント（キャンバスから出た場合は塗りつぶし領域とストロークの強調表示も消す）
         """
         if self.brush_preview_id:
             self.canvas.delete(self.brush_preview_id)
-            self.brush_preview_id = None
\ No newline at end of file
+            self.brush_preview_id = None
+        if event is not None:
+            self.hide_fill_highlight()
+            self.canvas.delete("vector_hover")
+            self.vector_hover = None
\ No newline at end of file
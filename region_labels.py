@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+塗りつぶし用の連結領域ラベル
+同じ色で4近傍につながったピクセルに同じラベルを付けておき、
+塗りつぶしをラベルが一致するピクセルへの代入にする（繰り返し塗りつぶす塗り絵で速い）
+
+ラベルはタイルごとに計算し、描画で変更されたタイルだけを計算し直す
+タイルをまたぐ連結はタイルの境界のピクセルだけから結合する
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import selection_ops
+
+Box = Tuple[int, int, int, int]
+
+
+def _color_keys(image: Image.Image) -> np.ndarray:
+    """
+    ピクセルの色を比較用の整数にした配列（RGBは24ビット、インデックスカラーはパレット番号）
+    """
+    pixels = np.asarray(image)
+    if pixels.ndim == 2:
+        return pixels.astype(np.uint32)
+    pixels = pixels.astype(np.uint32)
+    return (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+
+
+def _components(count: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    辺(a[i], b[i])でつながった要素の代表を求める（ベクトル化したunion-find）
+
+    Args:
+        count: 要素の数
+        a, b: 辺の両端
+
+    Returns:
+        各要素の代表（連結成分で最小の番号）
+    """
+    parent = np.arange(count, dtype=np.int64)
+    if a.size == 0:
+        return parent
+    while True:
+        # 辺の両端の代表を小さい方につなぐ
+        root_a = parent[a]
+        root_b = parent[b]
+        if np.array_equal(root_a, root_b):
+            return parent
+        low = np.minimum(root_a, root_b)
+        np.minimum.at(parent, root_a, low)
+        np.minimum.at(parent, root_b, low)
+        # 代表までの経路を縮める
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+
+def label_components(keys: np.ndarray) -> Tuple[np.ndarray, int]:
+    """
+    同じ値で4近傍につながったピクセルにラベルを付ける
+    行ごとの同じ値の連続（ラン）を単位にし、上下に接するランを結合する
+
+    Args:
+        keys: 色の配列 (高さ, 幅)
+
+    Returns:
+        (0から始まる連番のラベルの配列, ラベルの数)のタプル
+    """
+    height, width = keys.shape
+    starts = np.ones((height, width), dtype=bool)
+    starts[:, 1:] = keys[:, 1:] != keys[:, :-1]
+    runs = np.cumsum(starts.ravel()).reshape(height, width) - 1
+    run_count = int(runs[-1, -1]) + 1
+
+    same = keys[1:] == keys[:-1]
+    pairs = np.unique(runs[1:][same].astype(np.int64) * run_count + runs[:-1][same])
+    roots = _components(run_count, pairs // run_count, pairs % run_count)
+
+    _, labels = np.unique(roots[runs], return_inverse=True)
+    labels = labels.reshape(height, width).astype(np.int32)
+    return labels, int(labels.max()) + 1
+
+
+class RegionLabels:
+    """
+    描画データの連結領域ラベル
+    """
+    def __init__(self, tile_size: int = 64):
+        """
+        Args:
+            tile_size: ラベルを計算し直す単位のタイルの大きさ
+        """
+        self.tile_size = tile_size
+        self.image: Optional[Image.Image] = None
+        self.labels: Optional[np.ndarray] = None
+
+        self._keys: Optional[np.ndarray] = None
+        self._local: Optional[np.ndarray] = None
+        self._counts: Optional[np.ndarray] = None
+        self._dirty: Optional[np.ndarray] = None
+        self._cached_region: Optional[Tuple[int, Box, np.ndarray]] = None
+
+    def invalidate(self, box: Optional[Box] = None) -> None:
+        """
+        描画で変更された範囲のラベルを無効にする
+
+        Args:
+            box: 変更された矩形 (x0, y0, x1, y1)（Noneの場合は全体）
+        """
+        if self._dirty is None:
+            return
+        if box is None:
+            self._dirty[:] = True
+        else:
+            height, width = self._keys.shape
+            x0, y0 = max(box[0], 0), max(box[1], 0)
+            x1, y1 = min(box[2], width), min(box[3], height)
+            if x0 >= x1 or y0 >= y1:
+                return
+            size = self.tile_size
+            self._dirty[y0 // size:(y1 - 1) // size + 1, x0 // size:(x1 - 1) // size + 1] = True
+        self.labels = None
+        self._cached_region = None
+
+    def label_at(self, image: Image.Image, x: int, y: int) -> int:
+        """
+        指定位置の領域のラベル
+
+        Args:
+            image: 描画データ
+            x, y: 座標
+
+        Returns:
+            ラベル（同じ領域なら同じ値）
+        """
+        self._update(image)
+        return int(self.labels[y, x])
+
+    def region_at(self, image: Image.Image, x: int, y: int) -> Tuple[Box, np.ndarray]:
+        """
+        指定位置から塗りつぶされる領域
+
+        Args:
+            image: 描画データ
+            x, y: 座標
+
+        Returns:
+            (領域の外接矩形, 外接矩形内で領域に含まれるピクセルのマスク)のタプル
+        """
+        label = self.label_at(image, x, y)
+        if self._cached_region is not None and self._cached_region[0] == label:
+            return self._cached_region[1], self._cached_region[2]
+
+        mask = self.labels == label
+        rows = np.flatnonzero(mask.any(axis=1))
+        columns = np.flatnonzero(mask.any(axis=0))
+        box = (int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1)
+        region_mask = mask[box[1]:box[3], box[0]:box[2]]
+        self._cached_region = (label, box, region_mask)
+        return box, region_mask
+
+    def _update(self, image: Image.Image) -> None:
+        """
+        無効になったタイルのラベルを計算し直し、タイルをまたぐ連結を結合する
+        """
+        if (image is not self.image or self._keys is None
+                or self._keys.shape != (image.height, image.width)):
+            # 描画データが置き換わった場合（クリア・サイズ変更など）は全体を計算し直す
+            self.image = image
+            size = self.tile_size
+            tiles = (-(-image.height // size), -(-image.width // size))
+            self._keys = np.zeros((image.height, image.width), dtype=np.uint32)
+            self._local = np.zeros((image.height, image.width), dtype=np.int32)
+            self._counts = np.zeros(tiles, dtype=np.int64)
+            self._dirty = np.ones(tiles, dtype=bool)
+            self.labels = None
+            self._cached_region = None
+        if self.labels is not None:
+            return
+
+        size = self.tile_size
+        for tile_y, tile_x in zip(*np.nonzero(self._dirty)):
+            x0, y0 = tile_x * size, tile_y * size
+            x1, y1 = min(x0 + size, image.width), min(y0 + size, image.height)
+            keys = _color_keys(image.crop((x0, y0, x1, y1)))
+            self._keys[y0:y1, x0:x1] = keys
+            self._local[y0:y1, x0:x1], self._counts[tile_y, tile_x] = label_components(keys)
+        self._dirty[:] = False
+
+        # タイルごとのラベルを通し番号にする
+        offsets = np.concatenate([[0], np.cumsum(self._counts.ravel())[:-1]]).reshape(self._counts.shape)
+        height, width = self._keys.shape
+        provisional = self._local + offsets.repeat(size, axis=0).repeat(size, axis=1)[:height, :width]
+
+        # タイルの境界で隣り合う同じ色のピクセルを結合する
+        a_parts, b_parts = [], []
+        for x in range(size, width, size):
+            same = self._keys[:, x - 1] == self._keys[:, x]
+            a_parts.append(provisional[same, x - 1])
+            b_parts.append(provisional[same, x])
+        for y in range(size, height, size):
+            same = self._keys[y - 1] == self._keys[y]
+            a_parts.append(provisional[y - 1, same])
+            b_parts.append(provisional[y, same])
+        a = np.concatenate(a_parts) if a_parts else np.zeros(0, dtype=np.int64)
+        b = np.concatenate(b_parts) if b_parts else np.zeros(0, dtype=np.int64)
+
+        roots = _components(int(self._counts.sum()), a.astype(np.int64), b.astype(np.int64))
+        self.labels = roots[provisional]
+
+
+def fill_region(image: Image.Image, box: Box, mask: np.ndarray, ink) -> None:
+    """
+    region_atで求めた領域を塗りつぶす（外接矩形だけを読み書きする）
+
+    Args:
+        image: 描画データ
+        box: 領域の外接矩形
+        mask: 外接矩形内で領域に含まれるピクセルのマスク
+        ink: 塗りつぶす色（インデックスカラーではパレット番号）
+    """
+    region = selection_ops.read_region(image, box)
+    region[mask] = ink
+    selection_ops.write_region(image, box, region)
+
+
+def highlight_image(mask: np.ndarray, color: Tuple[int, int, int], alpha: int = 96) -> Image.Image:
+    """
+    領域を強調表示するための半透明のRGBA画像
+
+    Args:
+        mask: 外接矩形内で領域に含まれるピクセルのマスク
+        color: 強調表示の色
+        alpha: 領域内の不透明度 (0〜255)
+
+    Returns:
+        外接矩形の大きさのRGBA画像（領域外は透明）
+    """
+    overlay = np.zeros(mask.shape + (4,), dtype=np.uint8)
+    overlay[..., :3] = color
+    overlay[..., 3] = mask * alpha
+    return Image.frombytes("RGBA", (mask.shape[1], mask.shape[0]), overlay.tobytes())
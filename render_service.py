@@ -0,0 +1,460 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ストロークのバッチをラスタライズするローカルHTTPサービス
+PaintAppと同じ描画処理（canvas_ops）を使うため、デスクトップ版とピクセル単位で一致する
+
+エンドポイント:
+    POST   /render                         新しいキャンバスに操作を適用して画像を返す
+    POST   /documents/<id>/operations      ワーカーに常駐するドキュメントに操作を追加して画像を返す
+    DELETE /documents/<id>                 常駐するドキュメントを破棄する
+
+リクエストの本文（JSON）:
+    {"width": 800, "height": 600, "operations": [...], "format": "png", "preset": "fast"}
+    operationsの形式はcanvas_ops.apply_operationを参照
+
+サービスの起動と負荷試験:
+    python render_service.py serve --port 8766 --workers 4
+    python render_service.py bench --url http://127.0.0.1:8766 --requests 500 --concurrency 8
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+import argparse
+import base64
+import io
+import json
+import multiprocessing
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+
+from PIL import Image
+
+import canvas_ops
+import image_exporter
+
+DEFAULT_PORT = 8766
+
+# リクエスト本文の上限
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+# キャンバスサイズの上限（PaintAppのサイズ変更と同じ範囲）
+MIN_CANVAS_SIZE = 50
+MAX_CANVAS_SIZE = 2000
+
+# ワーカープロセスごとに常駐させるドキュメントの合計の上限（超えた場合は最近使われていないものから破棄）
+MAX_DOCUMENT_BYTES = 256 * 1024 * 1024
+
+_CONTENT_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+# ワーカープロセスに常駐するドキュメント（ドキュメントID → 画像、最近使われた順）
+_documents: "OrderedDict[str, Image.Image]" = OrderedDict()
+
+
+def _check_size(width: int, height: int, minimum: int = MIN_CANVAS_SIZE) -> None:
+    """
+    キャンバスサイズが上限の範囲内か確かめる
+
+    Raises:
+        ValueError: 範囲外の場合
+    """
+    if not (minimum <= width <= MAX_CANVAS_SIZE and minimum <= height <= MAX_CANVAS_SIZE):
+        raise ValueError(f"キャンバスサイズは{MIN_CANVAS_SIZE}から{MAX_CANVAS_SIZE}の範囲で指定してください")
+
+
+def validate_operations(operations: List[dict]) -> None:
+    """
+    ワーカーで確保するメモリがキャンバスサイズの上限を超える操作を拒否する
+    （ワーカーがメモリ不足で停止すると、同じワーカーに常駐するドキュメントが全て失われるため）
+
+    Args:
+        operations: 描画操作のリスト
+
+    Raises:
+        ValueError: 操作の形式が不正な場合や大きすぎる場合
+    """
+    if not isinstance(operations, list):
+        raise ValueError("operationsはリストで指定してください")
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise ValueError("操作はオブジェクトで指定してください")
+        kind = operation.get("op")
+        if kind == "resize":
+            _check_size(int(operation["width"]), int(operation["height"]))
+        elif kind in ("stroke", "shape") and int(operation["width"]) > MAX_CANVAS_SIZE:
+            raise ValueError(f"線の太さは{MAX_CANVAS_SIZE}以下で指定してください")
+        elif kind == "brush" and any(float(point[2]) > MAX_CANVAS_SIZE for point in operation["points"]):
+            raise ValueError(f"ブラシの直径は{MAX_CANVAS_SIZE}以下で指定してください")
+        elif kind == "paste":
+            # ヘッダーだけを読んで、展開する前に貼り付ける画像のサイズを確かめる
+            try:
+                with Image.open(io.BytesIO(base64.b64decode(operation["png"]))) as clip:
+                    _check_size(*clip.size, minimum=1)
+            except OSError as e:
+                raise ValueError(f"貼り付ける画像を読み込めません: {e}")
+
+
+def _store_document(document_id: str, image: Image.Image) -> None:
+    """
+    ドキュメントを常駐させ、上限を超えた分を最近使われていないものから破棄する
+    """
+    _documents[document_id] = image
+    _documents.move_to_end(document_id)
+    total = sum(document.width * document.height * len(document.getbands()) for document in _documents.values())
+    while total > MAX_DOCUMENT_BYTES and len(_documents) > 1:
+        _, evicted = _documents.popitem(last=False)
+        total -= evicted.width * evicted.height * len(evicted.getbands())
+
+
+def _warm_up() -> int:
+    """
+    ワーカープロセスの起動とモジュールの読み込みを済ませておく
+    """
+    return len(_documents)
+
+
+def _render_in_worker(document_id: Optional[str], width: int, height: int, operations: List[dict],
+                      image_format: str, preset: str) -> bytes:
+    """
+    ワーカープロセスで操作を適用してエンコードする
+
+    Args:
+        document_id: 常駐するドキュメントのID（Noneの場合は毎回新しいキャンバス）
+        width: 新しいキャンバスの幅
+        height: 新しいキャンバスの高さ
+        operations: 描画操作のリスト
+        image_format: 出力形式
+        preset: 書き出しプリセット
+
+    Returns:
+        エンコードした画像
+    """
+    image = _documents.get(document_id) if document_id is not None else None
+    if image is None:
+        image = Image.new("RGB", (width, height), "white")
+    else:
+        # 操作の途中でエラーになった場合に常駐するドキュメントが中途半端に変わらないよう、コピーに適用する
+        image = image.copy()
+
+    for operation in operations:
+        image = canvas_ops.apply_operation(image, operation)
+
+    # 全ての操作を適用できた場合だけ常駐させる
+    if document_id is not None:
+        _store_document(document_id, image)
+
+    buffer = io.BytesIO()
+    image_exporter.encode_image(image, buffer, image_format, preset)
+    return buffer.getvalue()
+
+
+def _discard_in_worker(document_id: str) -> bool:
+    """
+    ワーカープロセスに常駐するドキュメントを破棄する
+    """
+    return _documents.pop(document_id, None) is not None
+
+
+class RenderPool:
+    """
+    ドキュメントを常駐させるワーカープロセスのプール
+    同じドキュメントIDは常に同じワーカーで処理する
+    """
+    def __init__(self, workers: int = 4):
+        """
+        ワーカープロセスを起動する
+
+        Args:
+            workers: ワーカープロセスの数
+        """
+        self._context = multiprocessing.get_context("spawn")
+        self.workers = [ProcessPoolExecutor(max_workers=1, mp_context=self._context) for _ in range(workers)]
+        self._next = 0
+        self._lock = threading.Lock()
+        for worker in self.workers:
+            worker.submit(_warm_up).result()
+
+    def _index_for(self, document_id: Optional[str]) -> int:
+        """
+        ドキュメントIDに対応するワーカーの番号を選ぶ（IDがなければ順番に割り当てる）
+        """
+        if document_id is None:
+            with self._lock:
+                self._next = (self._next + 1) % len(self.workers)
+                return self._next
+        return zlib.crc32(document_id.encode("utf-8")) % len(self.workers)
+
+    def _call(self, document_id: Optional[str], function, *args):
+        """
+        ドキュメントIDに対応するワーカーで関数を実行する
+        ワーカーが停止していた場合は新しいワーカーに置き換えてから例外を送出する
+        （停止したワーカーに常駐していたドキュメントは失われる）
+        """
+        index = self._index_for(document_id)
+        worker = self.workers[index]
+        try:
+            return worker.submit(function, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                if self.workers[index] is worker:
+                    worker.shutdown(wait=False)
+                    self.workers[index] = ProcessPoolExecutor(max_workers=1, mp_context=self._context)
+            raise
+
+    def render(self, document_id: Optional[str], width: int, height: int, operations: List[dict],
+               image_format: str = "png", preset: str = "fast") -> bytes:
+        """
+        操作を適用した画像をエンコードして返す
+        """
+        return self._call(document_id, _render_in_worker, document_id, width, height, operations,
+                          image_format, preset)
+
+    def discard(self, document_id: str) -> bool:
+        """
+        常駐するドキュメントを破棄する
+        """
+        return self._call(document_id, _discard_in_worker, document_id)
+
+    def shutdown(self) -> None:
+        for worker in self.workers:
+            worker.shutdown()
+
+
+class _RenderRequestHandler(BaseHTTPRequestHandler):
+    """
+    レンダリングサービスのHTTPリクエストを処理する
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # アクセスログは負荷試験の妨げになるため出力しない
+        pass
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        if parts == ["render"]:
+            document_id = None
+        elif len(parts) == 3 and parts[0] == "documents" and parts[2] == "operations":
+            document_id = parts[1]
+        else:
+            self._send_error(404, "見つかりません")
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_BODY_BYTES:
+                self._send_error(413, "リクエストが大きすぎます")
+                return
+            request = json.loads(self.rfile.read(length))
+            width = int(request.get("width", 800))
+            height = int(request.get("height", 600))
+            operations = request.get("operations", [])
+            image_format = request.get("format", "png")
+            preset = request.get("preset", "fast")
+            _check_size(width, height)
+            validate_operations(operations)
+            if image_format not in image_exporter.EXPORT_PRESETS:
+                raise ValueError(f"未対応の形式です: {image_format}")
+            if preset not in image_exporter.PRESET_LABELS:
+                raise ValueError(f"未知のプリセットです: {preset}")
+        except (ValueError, TypeError, KeyError, IndexError) as e:
+            self._send_error(400, str(e))
+            return
+
+        try:
+            body = self.server.pool.render(document_id, width, height, operations, image_format, preset)
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_error(400, f"操作を適用できません: {e}")
+            return
+        except BrokenProcessPool:
+            self._send_error(500, "ワーカーが停止したため再起動しました（このワーカーのドキュメントは失われました）")
+            return
+        except Exception as e:
+            self._send_error(500, f"レンダリングエラー: {e}")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", _CONTENT_TYPES[image_format])
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_DELETE(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "documents":
+            self._send_error(404, "見つかりません")
+            return
+        try:
+            deleted = self.server.pool.discard(parts[1])
+        except BrokenProcessPool:
+            # 停止したワーカーのドキュメントは既に失われている
+            deleted = False
+        if deleted:
+            self._send_json(200, {"deleted": parts[1]})
+        else:
+            self._send_error(404, "ドキュメントがありません")
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send_json(status, {"error": message})
+
+
+class RenderServer(ThreadingHTTPServer):
+    """
+    レンダリングサービスのHTTPサーバー
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, workers: int = 4):
+        """
+        サーバーの初期化
+
+        Args:
+            host: 待ち受けるアドレス
+            port: 待ち受けるポート（0の場合は空いているポート）
+            workers: ワーカープロセスの数
+        """
+        self.pool = RenderPool(workers)
+        super().__init__((host, port), _RenderRequestHandler)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start_background(self) -> threading.Thread:
+        """
+        別スレッドでサーバーを起動する（テストや負荷試験用）
+        """
+        thread = threading.Thread(target=self.serve_forever, name="render-service", daemon=True)
+        thread.start()
+        return thread
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown()
+
+
+def render_request(url: str, operations: List[dict], document_id: Optional[str] = None,
+                   width: int = 800, height: int = 600, image_format: str = "png",
+                   preset: str = "fast", timeout: float = 30.0) -> bytes:
+    """
+    レンダリングサービスに操作のバッチを送って画像を受け取る
+
+    Args:
+        url: サービスのURL（例: http://127.0.0.1:8766）
+        operations: 描画操作のリスト
+        document_id: 常駐するドキュメントのID（Noneの場合は毎回新しいキャンバス）
+        width: キャンバスの幅
+        height: キャンバスの高さ
+        image_format: 出力形式
+        preset: 書き出しプリセット
+        timeout: タイムアウト（秒）
+
+    Returns:
+        エンコードされた画像
+    """
+    path = "/render" if document_id is None else f"/documents/{document_id}/operations"
+    body = json.dumps({"width": width, "height": height, "operations": operations,
+                       "format": image_format, "preset": preset}).encode("utf-8")
+    request = urllib.request.Request(url.rstrip("/") + path, data=body, method="POST",
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def run_load_test(url: str, requests: int = 200, concurrency: int = 8, strokes_per_request: int = 20) -> dict:
+    """
+    ランダムなストロークのバッチを並列に送って負荷試験を行う
+
+    Args:
+        url: サービスのURL
+        requests: リクエスト数
+        concurrency: 同時に送るリクエスト数
+        strokes_per_request: 1リクエストあたりのストローク数
+
+    Returns:
+        スループットとレイテンシの集計
+    """
+    import random
+
+    def one_request(index):
+        rng = random.Random(index)
+        operations = []
+        for _ in range(strokes_per_request):
+            points = [(rng.randrange(800), rng.randrange(600)) for _ in range(rng.randint(2, 40))]
+            operations.append({"op": "stroke", "color": "#%06x" % rng.randrange(0x1000000),
+                               "width": rng.randint(1, 20), "points": points})
+        start = time.perf_counter()
+        render_request(url, operations, document_id=f"bench-{index % concurrency}")
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(one_request, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "seconds": elapsed,
+        "requests_per_second": requests / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simple Paint レンダリングサービス")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="サービスを起動する")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="待ち受けるポート")
+    serve_parser.add_argument("--workers", type=int, default=4, help="ワーカープロセスの数")
+
+    bench_parser = subparsers.add_parser("bench", help="負荷試験を行う")
+    bench_parser.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}", help="サービスのURL")
+    bench_parser.add_argument("--requests", type=int, default=200, help="リクエスト数")
+    bench_parser.add_argument("--concurrency", type=int, default=8, help="同時リクエスト数")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = RenderServer(args.host, args.port, args.workers)
+        print(f"レンダリングサービスを起動しました: http://{args.host}:{server.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        try:
+            result = run_load_test(args.url, args.requests, args.concurrency)
+        except urllib.error.URLError as e:
+            print(f"サービスに接続できません: {e}")
+            return
+        print(f"{result['requests']}件 / {result['seconds']:.2f}秒 "
+              f"({result['requests_per_second']:.1f} req/s), "
+              f"p50 {result['p50_ms']:.1f}ms, p95 {result['p95_ms']:.1f}ms, 最大 {result['max_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
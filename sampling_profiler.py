@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+アプリに組み込むサンプリングプロファイラ
+一定間隔で全スレッドのスタックを取得し、フレームグラフ用のcollapsed形式で書き出す
+メインスレッドのスタックには処理中のイベントハンドラ名（draw, flood_fillなど）を付ける
+"""
+
+from collections import Counter
+from typing import Dict, Optional
+import functools
+import os
+import sys
+import threading
+import time
+
+# プロファイラを有効にする環境変数（値は出力先のパス、"1"の場合は既定のパス）
+PROFILE_ENV_VAR = "SIMPLE_PAINT_PROFILE"
+
+# 実行中のプロファイラ（無効な場合はNone）
+_active_profiler: Optional["SamplingProfiler"] = None
+
+
+def default_output_path() -> str:
+    """
+    既定の出力先のパス（カレントディレクトリに日時付きで作成）
+    """
+    return os.path.abspath(time.strftime("profile-%Y%m%d-%H%M%S.collapsed"))
+
+
+def handler_tag(name: str):
+    """
+    イベントハンドラに名前を付けるデコレータ
+    プロファイラが動いていない間は呼び出しをそのまま通すだけなので負荷はほとんどない
+
+    Args:
+        name: サンプルに付けるハンドラ名
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active_profiler
+            if profiler is None:
+                return func(*args, **kwargs)
+            thread_id = threading.get_ident()
+            previous = profiler.tags.get(thread_id)
+            profiler.tags[thread_id] = name
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if previous is None:
+                    profiler.tags.pop(thread_id, None)
+                else:
+                    profiler.tags[thread_id] = previous
+        return wrapper
+    return decorator
+
+
+class SamplingProfiler:
+    """
+    サンプリングプロファイラ
+    """
+    def __init__(self, interval: float = 0.005, include_lines: bool = False):
+        """
+        プロファイラの初期化
+
+        Args:
+            interval: サンプリング間隔（秒）
+            include_lines: フレーム名に行番号を含めるかどうか
+        """
+        self.interval = interval
+        self.include_lines = include_lines
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.tags: Dict[int, str] = {}
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        """
+        サンプリングを開始する
+        """
+        global _active_profiler
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        _active_profiler = self
+
+    def stop(self) -> None:
+        """
+        サンプリングを停止する
+        """
+        global _active_profiler
+        if self._thread is None:
+            return
+        if _active_profiler is self:
+            _active_profiler = None
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.tags.clear()
+
+    def write_collapsed(self, output_path: str) -> int:
+        """
+        collapsed形式（"スタック;...;フレーム 回数"の行）で書き出す
+        flamegraph.plやspeedscopeでフレームグラフにできる
+
+        Args:
+            output_path: 出力先のパス
+
+        Returns:
+            書き出したスタックの種類の数
+        """
+        with open(output_path, "w", encoding="utf-8") as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+        return len(self.samples)
+
+    def _frame_name(self, frame) -> str:
+        """
+        フレームの表示名
+        """
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        if self.include_lines:
+            return f"{code.co_name} ({filename}:{frame.f_lineno})"
+        return f"{code.co_name} ({filename})"
+
+    def _sample_loop(self) -> None:
+        """
+        サンプリングスレッドの処理
+        """
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame))
+                    frame = frame.f_back
+                stack.reverse()
+
+                # スタックの根元にスレッド名とハンドラ名を付ける
+                root = [thread_names.get(thread_id, str(thread_id)).replace(" ", "_")]
+                tag = self.tags.get(thread_id)
+                if tag:
+                    root.append(f"[{tag}]")
+                self.samples[";".join(root + stack)] += 1
+            self.sample_count += 1
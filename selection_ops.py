@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+選択範囲（矩形・投げ縄）とコピー・切り取り・貼り付け・移動
+描画データ全体ではなく選択範囲を切り出したNumPy配列だけを読み書きする
+"""
+
+from typing import List, Optional, Sequence, Tuple
+import base64
+import io
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import canvas_ops
+
+# 選択範囲を扱うツール
+SELECTION_TOOLS = ("select", "lasso")
+
+# 選択範囲を扱う操作（canvas_ops.apply_operationから呼ばれる）
+SELECTION_OPERATIONS = ("cut", "move", "paste")
+
+WHITE = (255, 255, 255)
+
+Box = Tuple[int, int, int, int]
+
+
+class Selection:
+    """
+    選択範囲
+    外接矩形と、投げ縄の場合は矩形内で選択されているピクセルのマスクを持つ
+    """
+    def __init__(self, box: Box, polygon: Optional[Sequence[Tuple[int, int]]] = None):
+        """
+        Args:
+            box: 外接矩形 (x0, y0, x1, y1)（x1, y1は含まない）
+            polygon: 投げ縄の頂点（キャンバス座標、矩形選択の場合はNone）
+        """
+        self.box = tuple(box)
+        self.polygon = [tuple(point) for point in polygon] if polygon else None
+        self.mask = _polygon_mask(self.polygon, self.box) if self.polygon else None
+
+    @classmethod
+    def rectangle(cls, x0: int, y0: int, x1: int, y1: int, size: Tuple[int, int]) -> Optional["Selection"]:
+        """
+        2点を対角とする矩形選択を作成する（キャンバス外は切り詰める）
+
+        Args:
+            x0, y0: ドラッグの始点
+            x1, y1: ドラッグの終点
+            size: キャンバスのサイズ
+
+        Returns:
+            選択範囲（面積がない場合はNone）
+        """
+        box = clip_box((min(x0, x1), min(y0, y1), max(x0, x1) + 1, max(y0, y1) + 1), size)
+        return cls(box) if box else None
+
+    @classmethod
+    def lasso(cls, points: Sequence[Tuple[int, int]], size: Tuple[int, int]) -> Optional["Selection"]:
+        """
+        投げ縄の軌跡で囲まれた範囲の選択を作成する
+
+        Args:
+            points: 投げ縄の軌跡
+            size: キャンバスのサイズ
+
+        Returns:
+            選択範囲（3点未満または面積がない場合はNone）
+        """
+        if len(points) < 3:
+            return None
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        box = clip_box((min(xs), min(ys), max(xs) + 1, max(ys) + 1), size)
+        if not box:
+            return None
+        selection = cls(box, points)
+        return selection if selection.mask.any() else None
+
+    @classmethod
+    def from_operation(cls, operation: dict) -> "Selection":
+        """
+        操作に記録された選択範囲を復元する
+        """
+        return cls(operation["box"], operation.get("polygon"))
+
+    def to_operation(self) -> dict:
+        """
+        操作に記録するための辞書
+        """
+        return {"box": list(self.box), "polygon": [list(point) for point in self.polygon] if self.polygon else None}
+
+    def contains(self, x: int, y: int) -> bool:
+        """
+        指定の座標が選択範囲に含まれるかどうか
+        """
+        x0, y0, x1, y1 = self.box
+        if not (x0 <= x < x1 and y0 <= y < y1):
+            return False
+        return self.mask is None or bool(self.mask[y - y0, x - x0])
+
+
+class Clip:
+    """
+    コピー・切り取りしたピクセル（移動中の選択範囲もこの形で持つ）
+    """
+    def __init__(self, pixels: np.ndarray, mask: Optional[np.ndarray], mode: str,
+                 palette: Optional[List[int]], x: int, y: int):
+        """
+        Args:
+            pixels: ピクセルの配列（RGBは(高さ, 幅, 3)、インデックスカラーは(高さ, 幅)）
+            mask: 貼り付けるピクセルのマスク（矩形の場合はNone）
+            mode: "RGB"または"P"
+            palette: インデックスカラーの場合のパレット
+            x, y: 左上の位置
+        """
+        self.pixels = pixels
+        self.mask = mask
+        self.mode = mode
+        self.palette = palette
+        self.x = x
+        self.y = y
+
+    @property
+    def width(self) -> int:
+        return self.pixels.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.pixels.shape[0]
+
+    @property
+    def box(self) -> Box:
+        return (self.x, self.y, self.x + self.width, self.y + self.height)
+
+    def contains(self, x: int, y: int) -> bool:
+        """
+        指定の座標がクリップの不透明な部分に含まれるかどうか
+        """
+        if not (self.x <= x < self.x + self.width and self.y <= y < self.y + self.height):
+            return False
+        return self.mask is None or bool(self.mask[y - self.y, x - self.x])
+
+    def rgb_pixels(self) -> np.ndarray:
+        """
+        RGBのピクセル配列（インデックスカラーの場合はパレットを引く）
+        """
+        if self.mode == "RGB":
+            return self.pixels
+        palette = np.zeros((256, 3), dtype=np.uint8)
+        colors = np.asarray(self.palette, dtype=np.uint8).reshape(-1, 3)
+        palette[:len(colors)] = colors
+        return palette[self.pixels]
+
+    def to_display_image(self) -> Image.Image:
+        """
+        表示用のRGBA画像（選択範囲外は透明）
+        """
+        alpha = np.full(self.pixels.shape[:2], 255, dtype=np.uint8) if self.mask is None \
+            else self.mask.astype(np.uint8) * 255
+        rgba = np.dstack([self.rgb_pixels(), alpha])
+        return Image.frombytes("RGBA", (self.width, self.height), rgba.tobytes())
+
+    def to_png(self) -> str:
+        """
+        操作に記録するためのPNG（RGBA、Base64文字列）
+        """
+        buffer = io.BytesIO()
+        self.to_display_image().save(buffer, "PNG", compress_level=1)
+        return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    @classmethod
+    def from_png(cls, data: str, x: int, y: int) -> "Clip":
+        """
+        to_pngで記録したPNGからクリップを復元する
+        """
+        with Image.open(io.BytesIO(base64.b64decode(data))) as image:
+            rgba = np.array(image.convert("RGBA"))
+        mask = rgba[..., 3] > 0
+        return cls(np.ascontiguousarray(rgba[..., :3]), None if mask.all() else mask, "RGB", None, x, y)
+
+
+def clip_box(box: Box, size: Tuple[int, int]) -> Optional[Box]:
+    """
+    矩形をキャンバス内に切り詰める（面積がなくなる場合はNone）
+    """
+    x0, y0 = max(box[0], 0), max(box[1], 0)
+    x1, y1 = min(box[2], size[0]), min(box[3], size[1])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0, x1, y1)
+
+
+def _polygon_mask(polygon: Sequence[Tuple[int, int]], box: Box) -> np.ndarray:
+    """
+    多角形の内側を表す外接矩形サイズのマスク
+    """
+    x0, y0, x1, y1 = box
+    mask_image = Image.new("L", (x1 - x0, y1 - y0), 0)
+    ImageDraw.Draw(mask_image).polygon([(x - x0, y - y0) for x, y in polygon], fill=255, outline=255)
+    return np.asarray(mask_image) > 0
+
+
+def read_region(image: Image.Image, box: Box) -> np.ndarray:
+    """
+    矩形範囲のピクセルを書き込み可能な配列として取り出す（範囲外はコピーしない）
+    """
+    return np.array(image.crop(box))
+
+
+def write_region(image: Image.Image, box: Box, region: np.ndarray) -> None:
+    """
+    read_regionで取り出した配列を描画データに書き戻す
+    """
+    x0, y0, x1, y1 = box
+    patch = Image.frombytes(image.mode, (x1 - x0, y1 - y0), np.ascontiguousarray(region).tobytes())
+    image.paste(patch, (x0, y0))
+
+
+def copy_region(image: Image.Image, selection: Selection) -> Clip:
+    """
+    選択範囲のピクセルをコピーする
+
+    Args:
+        image: 描画データ
+        selection: 選択範囲
+
+    Returns:
+        コピーしたピクセル
+    """
+    palette = image.getpalette() if image.mode == "P" else None
+    return Clip(read_region(image, selection.box), selection.mask, image.mode, palette,
+                selection.box[0], selection.box[1])
+
+
+def difference_clip(source: Image.Image, target: Image.Image) -> Optional[Clip]:
+    """
+    同じサイズの2つの画像で異なるピクセルだけを、targetのピクセルのクリップにする
+    （貼り付けるとsourceと異なるピクセルだけがtargetになり、それ以外のピクセルは変わらない）
+
+    Args:
+        source: 変更前の画像
+        target: 変更後の画像
+
+    Returns:
+        異なるピクセルを囲む矩形のクリップ（異なるピクセルがない場合はNone）
+    """
+    source_pixels = np.asarray(source.convert("RGB"))
+    target_pixels = np.asarray(target.convert("RGB"))
+    changed = (source_pixels != target_pixels).any(axis=2)
+    rows = np.flatnonzero(changed.any(axis=1))
+    if len(rows) == 0:
+        return None
+    columns = np.flatnonzero(changed.any(axis=0))
+    y0, y1 = int(rows[0]), int(rows[-1]) + 1
+    x0, x1 = int(columns[0]), int(columns[-1]) + 1
+    mask = changed[y0:y1, x0:x1]
+    return Clip(np.ascontiguousarray(target_pixels[y0:y1, x0:x1]), None if mask.all() else mask, "RGB", None,
+                x0, y0)
+
+
+def erase_region(image: Image.Image, selection: Selection) -> Image.Image:
+    """
+    選択範囲を白で消去する
+
+    Args:
+        image: 描画データ
+        selection: 選択範囲
+
+    Returns:
+        消去後の描画データ（インデックスカラーのパレットが一杯の場合はRGBに変換される）
+    """
+    image, ink = canvas_ops.prepare_ink(image, WHITE)
+    region = read_region(image, selection.box)
+    if selection.mask is None:
+        region[...] = ink
+    else:
+        region[selection.mask] = ink
+    write_region(image, selection.box, region)
+    return image
+
+
+def lift_region(image: Image.Image, selection: Selection) -> Tuple[Image.Image, Clip]:
+    """
+    選択範囲を持ち上げる（コピーして元の場所を白で消去する）
+
+    Returns:
+        (消去後の描画データ, 持ち上げたピクセル)のタプル
+    """
+    clip = copy_region(image, selection)
+    return erase_region(image, selection), clip
+
+
+def _pixels_for(image: Image.Image, clip: Clip) -> Tuple[Image.Image, np.ndarray]:
+    """
+    クリップのピクセルを描画データのモードに合わせる
+    インデックスカラーの描画データにはパレット番号へ変換し、パレットが一杯の場合はRGBに変換する
+    """
+    if clip.mode == image.mode == "RGB":
+        return image, clip.pixels
+    rgb = clip.rgb_pixels()
+    if image.mode != "P":
+        return image, rgb
+
+    keys = (rgb[..., 0].astype(np.uint32) << 16) | (rgb[..., 1].astype(np.uint32) << 8) | rgb[..., 2]
+    used = np.unique(keys if clip.mask is None else keys[clip.mask])
+    inks = []
+    for key in used.tolist():
+        ink = canvas_ops.ink_for(image, ((key >> 16) & 0xFF, (key >> 8) & 0xFF, key & 0xFF))
+        if ink is None:
+            return image.convert("RGB"), rgb
+        inks.append(ink)
+    if not inks:
+        return image, np.zeros(keys.shape, dtype=np.uint8)
+    # マスク外のピクセルは書き込まれないため、どの番号になっても構わない
+    positions = np.minimum(np.searchsorted(used, keys), len(used) - 1)
+    return image, np.asarray(inks, dtype=np.uint8)[positions]
+
+
+def paste_clip(image: Image.Image, clip: Clip) -> Tuple[Image.Image, Optional[Box]]:
+    """
+    クリップを現在の位置に貼り付ける（キャンバス外にはみ出した部分は捨てる）
+
+    Args:
+        image: 描画データ
+        clip: 貼り付けるピクセル
+
+    Returns:
+        (貼り付け後の描画データ, 書き換えた矩形（キャンバス外の場合はNone）)のタプル
+    """
+    box = clip_box(clip.box, image.size)
+    if box is None:
+        return image, None
+    image, pixels = _pixels_for(image, clip)
+
+    x0, y0, x1, y1 = box
+    source = pixels[y0 - clip.y:y1 - clip.y, x0 - clip.x:x1 - clip.x]
+    region = read_region(image, box)
+    if clip.mask is None:
+        region[...] = source
+    else:
+        mask = clip.mask[y0 - clip.y:y1 - clip.y, x0 - clip.x:x1 - clip.x]
+        region[mask] = source[mask]
+    write_region(image, box, region)
+    return image, box
+
+
+def apply_selection_operation(image: Image.Image, operation: dict) -> Image.Image:
+    """
+    記録された選択範囲の操作を画像に適用する
+
+    操作は以下の形式の辞書:
+        {"op": "cut", "box": [x0, y0, x1, y1], "polygon": [[x, y], ...] または None}
+        {"op": "move", "box": [...], "polygon": [...], "x": 移動先のX座標, "y": 移動先のY座標}
+        {"op": "paste", "x": X座標, "y": Y座標, "png": Clip.to_pngの文字列}
+
+    Args:
+        image: 適用先の画像
+        operation: 選択範囲の操作
+
+    Returns:
+        操作後の画像
+    """
+    kind = operation["op"]
+    if kind == "cut":
+        image = erase_region(image, Selection.from_operation(operation))
+    elif kind == "move":
+        image, clip = lift_region(image, Selection.from_operation(operation))
+        clip.x, clip.y = operation["x"], operation["y"]
+        image, _ = paste_clip(image, clip)
+    elif kind == "paste":
+        image, _ = paste_clip(image, Clip.from_png(operation["png"], operation["x"], operation["y"]))
+    else:
+        raise ValueError(f"未知の操作です: {kind}")
+    return image
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ストロークの点の逐次的な間引き
+マウスの点を保留し、直前に確定した点からの線分で保留中の全ての点を許容誤差以内で表せる間は確定しない
+（表せなくなったら直前の点を確定する）。確定した点だけを描画とストローク予測に渡すため、
+ほぼ静止している間の重複した点やまっすぐな区間の途中の点を処理しない
+"""
+
+from typing import List, Optional, Tuple
+import math
+
+Point = Tuple[float, float, Optional[float]]
+
+
+def _segment_distance(px: float, py: float, ax: float, ay: float, bx: float, by: float) -> float:
+    """
+    点から線分までの距離
+    """
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+class StrokeSimplifier:
+    """
+    ストロークの点を逐次的に間引く
+    """
+    def __init__(self, tolerance: float = 0.75, min_distance: float = 1.5, max_pending: int = 32):
+        """
+        Args:
+            tolerance: 間引いた点と確定した線分との距離の上限（ピクセル）
+            min_distance: 確定した点からこの距離未満の点は判定せずに読み飛ばす（ほぼ静止している間の点）
+            max_pending: 保留する点の上限（超えたら確定する）
+        """
+        self.tolerance = tolerance
+        self.min_distance = min_distance
+        self.max_pending = max_pending
+        self.anchor: Optional[Point] = None  # 最後に確定した点
+        self._pending: List[Point] = []
+        self._latest: Optional[Point] = None
+        self.received = 0
+        self.emitted = 0
+
+    def start(self, x: float, y: float, time_ms: Optional[float] = None) -> None:
+        """
+        ストロークを開始する（始点は確定した点として扱う）
+
+        Args:
+            x, y: 始点
+            time_ms: イベントの時刻
+        """
+        self.anchor = (x, y, time_ms)
+        self._pending = []
+        self._latest = None
+        self.received += 1
+        self.emitted += 1
+
+    def add(self, x: float, y: float, time_ms: Optional[float] = None) -> Optional[Point]:
+        """
+        点を追加する
+
+        Args:
+            x, y: 座標
+            time_ms: イベントの時刻
+
+        Returns:
+            新たに確定した点（x, y, 時刻）、確定しない場合はNone
+        """
+        self.received += 1
+        point = (x, y, time_ms)
+        self._latest = point
+        ax, ay = self.anchor[0], self.anchor[1]
+        if math.hypot(x - ax, y - ay) < self.min_distance:
+            return None
+
+        if len(self._pending) < self.max_pending and all(
+                _segment_distance(px, py, ax, ay, x, y) <= self.tolerance for px, py, _ in self._pending):
+            self._pending.append(point)
+            return None
+
+        # 新しい点まで延ばせないので、保留中の最後の点を確定してそこから保留し直す
+        emitted = self._pending[-1]
+        self.anchor = emitted
+        self._pending = [point]
+        self.emitted += 1
+        return emitted
+
+    def finish(self) -> Optional[Point]:
+        """
+        ストロークを終了する
+
+        Returns:
+            最後に受け取った点（確定した点と異なる場合のみ）
+        """
+        latest = self._latest
+        anchor = self.anchor
+        self.anchor = None
+        self._pending = []
+        self._latest = None
+        if latest is None or latest[:2] == anchor[:2]:
+            return None
+        self.emitted += 1
+        return latest
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+高解像度（スーパーサンプリング）の描画データの表示
+描画データは表示の整数倍の解像度で保持し、キャンバスにはタイルに分けて縮小した画像を表示する
+描画で書き換えた矩形に掛かるタイルだけを縮小し直す
+"""
+
+from typing import List, Optional, Set, Tuple
+import math
+
+from PIL import Image
+
+Box = Tuple[int, int, int, int]
+
+# 基準とする画面の解像度（Tkのピクセル/インチ）
+BASE_DPI = 96
+
+# 描画データの倍率の上限
+MAX_SCALE = 4
+
+
+def scale_for_dpi(dpi: float) -> int:
+    """
+    画面の解像度から描画データの倍率を決める（96dpiで等倍、192dpiで2倍）
+
+    Args:
+        dpi: 画面の解像度（root.winfo_fpixels("1i")）
+
+    Returns:
+        1〜MAX_SCALEの整数の倍率
+    """
+    return max(1, min(MAX_SCALE, int(round(dpi / BASE_DPI))))
+
+
+def downsample(image: Image.Image, factor: int) -> Image.Image:
+    """
+    画像を整数分の1に縮小する（factor×factorのピクセルの平均）
+
+    Args:
+        image: 元の画像（書き換えない）
+        factor: 縮小率
+
+    Returns:
+        縮小した画像（インデックスカラーはRGBに変換する）
+    """
+    if image.mode not in ("RGB", "RGBA", "L"):
+        # パレット番号は平均できないため、先にRGBにする
+        image = image.convert("RGB")
+    if factor == 1:
+        return image
+    return image.reduce(factor)
+
+
+class TileGrid:
+    """
+    表示を一定の大きさのタイルに分け、縮小し直す必要のあるタイルを管理する
+    """
+    def __init__(self, size: Tuple[int, int], factor: int, tile_size: int = 64):
+        """
+        Args:
+            size: 描画データのサイズ
+            factor: 描画データの倍率
+            tile_size: 表示上のタイルの一辺（ピクセル）
+        """
+        self.size = size
+        self.factor = factor
+        self.tile_size = tile_size
+        self.view_size = (math.ceil(size[0] / factor), math.ceil(size[1] / factor))
+        self.columns = math.ceil(self.view_size[0] / tile_size)
+        self.rows = math.ceil(self.view_size[1] / tile_size)
+        self._dirty: Set[Tuple[int, int]] = set()
+
+    def __len__(self) -> int:
+        return self.columns * self.rows
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    def mark(self, box: Optional[Box] = None) -> None:
+        """
+        描画データの矩形を書き換えたことを記録する
+
+        Args:
+            box: 描画データ上の矩形 (x0, y0, x1, y1)（Noneの場合は全体）
+        """
+        if box is None:
+            self._dirty.update((column, row) for row in range(self.rows) for column in range(self.columns))
+            return
+        span = self.tile_size * self.factor
+        column0 = max(0, int(box[0]) // span)
+        row0 = max(0, int(box[1]) // span)
+        column1 = min(self.columns, (math.ceil(box[2]) + span - 1) // span)
+        row1 = min(self.rows, (math.ceil(box[3]) + span - 1) // span)
+        self._dirty.update((column, row) for row in range(row0, row1) for column in range(column0, column1))
+
+    def take_dirty(self) -> List[Tuple[int, int]]:
+        """
+        縮小し直す必要のあるタイルを取り出す（取り出したタイルは記録から消える）
+
+        Returns:
+            (列, 行)のリスト
+        """
+        dirty = sorted(self._dirty, key=lambda tile: (tile[1], tile[0]))
+        self._dirty.clear()
+        return dirty
+
+    def view_origin(self, tile: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        タイルの左上の表示上の座標
+        """
+        return tile[0] * self.tile_size, tile[1] * self.tile_size
+
+    def tile_box(self, tile: Tuple[int, int]) -> Box:
+        """
+        タイルに対応する描画データ上の矩形
+        """
+        span = self.tile_size * self.factor
+        x0, y0 = tile[0] * span, tile[1] * span
+        return x0, y0, min(x0 + span, self.size[0]), min(y0 + span, self.size[1])
+
+    def render(self, image: Image.Image, tile: Tuple[int, int]) -> Image.Image:
+        """
+        タイルの範囲の描画データを縮小する
+
+        Args:
+            image: 描画データ
+            tile: (列, 行)
+
+        Returns:
+            表示用の画像
+        """
+        return downsample(image.crop(self.tile_box(tile)), self.factor)
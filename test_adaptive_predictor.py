@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ユーザーの描き方から学習するストローク予測のテスト
+"""
+
+import numpy as np
+
+from models.adaptive_predictor import AdaptiveModel
+from models.stroke_predictor import StrokePredictor
+
+
+def _arc(rng, count):
+    """
+    半径と向きがランダムな円弧のストローク（整数座標）
+    """
+    radius = rng.uniform(40, 150)
+    speed = rng.uniform(3, 8) / radius * rng.choice([-1, 1])
+    start = rng.uniform(0, 2 * np.pi)
+    center = rng.uniform(100, 500, 2)
+    angles = start + speed * np.arange(count)
+    return [(round(center[0] + radius * np.cos(angle)), round(center[1] + radius * np.sin(angle)))
+            for angle in angles]
+
+
+def test_learning_on_background_thread_beats_simple_model(tmp_path):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / "predictor.npz")
+    model = AdaptiveModel(state_path=path)
+    assert not model.ready
+    for _ in range(40):
+        model.submit(_arc(rng, 60))
+    model.flush()
+    assert model.ready
+
+    simple_errors, adaptive_errors = [], []
+    for _ in range(50):
+        stroke = _arc(rng, 35)
+        truth = np.array(stroke[25:35])
+        simple = StrokePredictor()
+        adaptive = StrokePredictor(adaptive_model=model)
+        for x, y in stroke[:25]:
+            simple.add_point(x, y)
+            adaptive.add_point(x, y)
+        simple_errors.append(np.hypot(*(np.array(simple.predict_next_points()) - truth).T).mean())
+        adaptive_errors.append(np.hypot(*(np.array(adaptive.predict_next_points()) - truth).T).mean())
+    assert np.mean(adaptive_errors) < np.mean(simple_errors) * 0.9
+
+    # 学習スレッドが保存した状態を次回の起動で読み込む
+    restored = AdaptiveModel(state_path=path)
+    model.close()
+    assert restored.sample_count == model.sample_count
+    assert np.allclose(restored.weights, model.weights)
+    assert restored.ready
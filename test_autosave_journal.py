@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+自動保存ジャーナルのテスト
+"""
+
+import os
+
+from PIL import Image
+
+import canvas_ops
+from autosave_journal import (AutosaveJournal, document_journal_path, find_recovery_journals, has_recovery_data,
+                              replay_journal)
+
+
+def _apply_all(image, operations):
+    for operation in operations:
+        image = canvas_ops.apply_operation(image, operation)
+    return image
+
+
+OPERATIONS = [
+    {"op": "stroke", "color": "#ff0000", "width": 3, "points": [[10, 10], [50, 40], [90, 10]]},
+    {"op": "stroke", "color": "white", "width": 5, "points": [[30, 5], [30, 60]]},
+    {"op": "fill", "x": 60, "y": 60, "color": "#00ff00"},
+    {"op": "resize", "width": 120, "height": 80},
+]
+
+
+def test_replay_matches_live_drawing(tmp_path):
+    path = str(tmp_path / "autosave.journal")
+    base = Image.new("RGB", (100, 100), "white")
+
+    journal = AutosaveJournal(path, fsync_interval=0.01)
+    journal.start(base)
+    assert not has_recovery_data(path)
+    for operation in OPERATIONS:
+        journal.record(operation)
+    journal.close()
+
+    assert has_recovery_data(path)
+    expected = _apply_all(base.copy(), OPERATIONS)
+    assert replay_journal(path).tobytes() == expected.tobytes()
+
+
+def test_checkpoint_compacts_journal(tmp_path):
+    path = str(tmp_path / "autosave.journal")
+    image = Image.new("RGB", (100, 100), "white")
+
+    journal = AutosaveJournal(path, checkpoint_every=2)
+    journal.start(image)
+    for operation in OPERATIONS[:2]:
+        journal.record(operation)
+        image = canvas_ops.apply_operation(image, operation)
+    assert journal.checkpoint_due
+    journal.checkpoint(image)
+    journal.record(OPERATIONS[2])
+    image = canvas_ops.apply_operation(image, OPERATIONS[2])
+    journal.close()
+
+    assert replay_journal(path).tobytes() == image.tobytes()
+
+
+def test_torn_tail_is_ignored(tmp_path):
+    path = str(tmp_path / "autosave.journal")
+    base = Image.new("RGB", (100, 100), "white")
+
+    journal = AutosaveJournal(path)
+    journal.start(base)
+    journal.record(OPERATIONS[0])
+    journal.close()
+
+    # 書き込み途中でクラッシュしたレコードを模擬
+    with open(path, "ab") as file:
+        file.write(b"\x03\xff\x00\x00\x00garbage")
+
+    expected = canvas_ops.apply_operation(base.copy(), OPERATIONS[0])
+    assert replay_journal(path).tobytes() == expected.tobytes()
+
+    journal.close(discard=True)
+    assert not os.path.exists(path)
+
+
+def test_invalid_operation_stops_replay_at_last_good_image(tmp_path):
+    path = str(tmp_path / "autosave.journal")
+    base = Image.new("RGB", (100, 100), "white")
+
+    journal = AutosaveJournal(path, fsync_interval=0.01)
+    journal.start(base)
+    journal.record(OPERATIONS[0])
+    journal.record({"op": "stroke", "color": "#0000ff"})
+    journal.record(OPERATIONS[1])
+    journal.close()
+
+    expected = canvas_ops.apply_operation(base.copy(), OPERATIONS[0])
+    assert replay_journal(path).tobytes() == expected.tobytes()
+
+
+def test_recovery_journals_are_found_per_document(tmp_path):
+    base_path = str(tmp_path / "autosave.journal")
+    assert document_journal_path(1, base_path) == base_path
+    assert document_journal_path(3, base_path) == str(tmp_path / "autosave-3.journal")
+
+    # 1番目は変更なし、3番目だけ変更あり
+    for number, operations in ((1, []), (3, OPERATIONS[:1])):
+        journal = AutosaveJournal(document_journal_path(number, base_path))
+        journal.start(Image.new("RGB", (100, 100), "white"))
+        for operation in operations:
+            journal.record(operation)
+        journal.close()
+
+    assert find_recovery_journals(base_path, max_documents=4) == [(3, document_journal_path(3, base_path))]
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+スタンプ方式のブラシのテスト
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+import brush_engine
+import canvas_ops
+from headless_paint import HeadlessPaint
+
+
+def test_dab_cache_evicts_least_recently_used():
+    cache = brush_engine.DabCache(max_entries=2)
+    small = cache.get(4, True)
+    cache.get(8, True)
+    # 0.25ピクセル未満の差は同じマスク
+    assert cache.get(4.1, True) is small
+    cache.get(12, False)
+    # 直前に使った4ピクセルのマスクが残り、8ピクセルのマスクが追い出される
+    assert len(cache) == 2
+    assert cache.get(4, True) is small
+    assert (32, True) not in cache._masks
+
+    hard = brush_engine.make_dab(9, soft=False)
+    soft = brush_engine.make_dab(9, soft=True)
+    center = hard.shape[0] // 2
+    assert hard[center, center] == 1.0 and soft[center, center] > 0.9
+    assert hard[0, 0] == 0.0 and soft[0, 0] == 0.0
+
+
+def test_stamps_keep_fixed_spacing_across_events():
+    stroke = brush_engine.BrushStroke((100, 100), "#000000", 8, soft=False, spacing=0.5)
+    centers = []
+    for x in range(10, 60, 3):
+        before = len(stroke._pending)
+        stroke.add_point(x, 50, diameter=8, opacity=1.0)
+        for group in stroke._pending[before:]:
+            centers.extend(center[0] for center in group[0])
+    assert np.allclose(np.diff(centers), 4.0)
+
+
+def test_replay_matches_live_stroke_regardless_of_batching():
+    size = (120, 90)
+    live = Image.new("RGB", size, "white")
+    stroke = brush_engine.BrushStroke(size, "#336699", 10, soft=True, opacity=0.8, velocity_width=True)
+    for i in range(40):
+        stroke.add_point(10 + i * 2.5, 45 + 30 * np.sin(i / 6), time_ms=i * (4 if i < 20 else 16))
+        if i % 3 == 0:
+            stroke.flush(live)
+    stroke.flush(live)
+
+    replayed = canvas_ops.apply_operation(Image.new("RGB", size, "white"), stroke.to_operation("#336699"))
+    assert replayed.tobytes() == live.tobytes()
+    # 重なったダブで濃くならない
+    assert min(live.getpixel((50, y))[0] for y in range(size[1])) >= 0x33
+
+    # 速く動かした前半ほど細くなる
+    diameters = [point[2] for point in stroke.points]
+    assert diameters[10] < diameters[-1] < 10
+
+
+def test_headless_brush_in_indexed_mode_enters_history():
+    app = HeadlessPaint(80, 60)
+    app.drawing_data = canvas_ops.new_canvas_image(80, 60, "P")
+    app.set_brush("soft")
+    app.change_brush_size(9)
+    app.start_draw(SimpleNamespace(x=10, y=30))
+    for x in range(12, 70, 4):
+        app.draw(SimpleNamespace(x=x, y=30))
+    app.stop_draw(SimpleNamespace(x=70, y=30))
+
+    assert app.drawing_data.mode == "P"
+    assert app.drawing_data.convert("RGB").getpixel((40, 30)) == (0, 0, 0)
+    assert app.drawing_data.convert("RGB").getpixel((40, 20)) == (255, 255, 255)
+    app.undo()
+    assert app.drawing_data.convert("RGB").getpixel((40, 30)) == (255, 255, 255)
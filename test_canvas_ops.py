@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+描画データに対する操作（インデックスカラーを含む）のテスト
+"""
+
+from PIL import Image
+
+import canvas_ops
+from history_store import HistoryStore
+
+
+def _stroke(color, y):
+    return {"op": "stroke", "color": color, "width": 3, "points": [[5, y], [40, y]]}
+
+
+def test_to_indexed_roundtrip_is_exact():
+    image = Image.new("RGB", (64, 48), "white")
+    for i, color in enumerate(["#ff0000", "#00ff00", "#123456"]):
+        image = canvas_ops.apply_operation(image, _stroke(color, 10 + i * 10))
+
+    indexed = canvas_ops.to_indexed(image)
+    assert indexed.mode == "P"
+    # 1ピクセル1バイト
+    assert len(indexed.tobytes()) == 64 * 48
+    # 白が0番
+    assert indexed.getpalette()[:3] == [255, 255, 255]
+    assert indexed.convert("RGB").tobytes() == image.tobytes()
+
+
+def test_to_indexed_rejects_too_many_colors():
+    image = Image.new("RGB", (32, 32))
+    image.putdata([(i % 256, i // 256, 0) for i in range(32 * 32)])
+    assert canvas_ops.to_indexed(image) is None
+
+
+def test_operations_match_rgb_and_fall_back_when_palette_is_full():
+    operations = [_stroke("#ff0000", 10), {"op": "fill", "x": 1, "y": 1, "color": "#0000ff"},
+                  {"op": "resize", "width": 80, "height": 60}, _stroke("#00ff00", 30)]
+    rgb = Image.new("RGB", (64, 48), "white")
+    indexed = canvas_ops.new_canvas_image(64, 48, "P")
+    for operation in operations:
+        rgb = canvas_ops.apply_operation(rgb, operation)
+        indexed = canvas_ops.apply_operation(indexed, operation)
+    assert indexed.mode == "P"
+    assert indexed.convert("RGB").tobytes() == rgb.tobytes()
+
+    # パレットが一杯になったらRGBに切り替えて描画を続ける
+    indexed.putpalette([value for i in range(256) for value in (i, i, 0)])
+    indexed = canvas_ops.apply_operation(indexed, _stroke("#abcdef", 20))
+    assert indexed.mode == "RGB"
+    assert indexed.getpixel((20, 20)) == (0xab, 0xcd, 0xef)
+
+
+def test_history_keeps_palette_when_compressed():
+    image = canvas_ops.new_canvas_image(64, 64, "P")
+    image = canvas_ops.apply_operation(image, _stroke("#ff8800", 20))
+
+    store = HistoryStore(max_bytes=1)
+    store.push(image)
+    store.push(canvas_ops.new_canvas_image(64, 64, "P"))
+    restored = store.undo()
+    assert restored.mode == "P"
+    assert restored.convert("RGB").getpixel((20, 20)) == (0xff, 0x88, 0x00)
+
+
+def test_shapes_stay_inside_bounds_and_enter_history_as_patches():
+    from types import SimpleNamespace
+    from headless_paint import HeadlessPaint
+
+    app = HeadlessPaint(120, 90)
+    app.change_brush_size(9)
+    expected = Image.new("RGB", (120, 90), "white")
+    for shape, points in (("line", [(10, 80), (100, 12)]), ("rectangle", [(30, 30), (34, 70)]),
+                          ("ellipse", [(60, 20), (115, 85)])):
+        app.change_tool(shape)
+        app.start_draw(SimpleNamespace(x=points[0][0], y=points[0][1]))
+        app.stop_draw(SimpleNamespace(x=points[1][0], y=points[1][1]))
+
+        operation = {"op": "shape", "shape": shape, "color": "#000000", "width": 9, "points": points}
+        single = canvas_ops.apply_operation(Image.new("RGB", (120, 90), "white"), operation)
+        x0, y0, x1, y1 = single.convert("L").point(lambda value: 255 - value).getbbox()
+        bx0, by0, bx1, by1 = canvas_ops.shape_bounds(points, 9, (120, 90))
+        assert bx0 <= x0 and by0 <= y0 and x1 <= bx1 and y1 <= by1
+        expected = canvas_ops.apply_operation(expected, operation)
+
+        # 履歴はキャンバス全体ではなく外接矩形の変更前後だけ
+        assert app.history.entries[-1].memory_bytes == 2 * (bx1 - bx0) * (by1 - by0) * 3
+
+    assert app.drawing_data.tobytes() == expected.tobytes()
+    app.undo()
+    app.undo()
+    app.undo()
+    assert app.drawing_data.tobytes() == Image.new("RGB", (120, 90), "white").tobytes()
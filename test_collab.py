@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+共同編集サーバーとクライアントのテスト（localhostで複数クライアントを接続）
+"""
+
+import time
+
+from PIL import Image
+
+import canvas_ops
+import selection_ops
+from collab import CollabClient, CollabServer, coalesce_operations, decode_operations, encode_operations
+from history_store import HistoryStore
+
+
+def _wait_for(client, count, timeout=5.0):
+    received = []
+    deadline = time.monotonic() + timeout
+    while len(received) < count and time.monotonic() < deadline:
+        received.extend(client.receive_operations())
+        time.sleep(0.01)
+    return received
+
+
+def test_encoding_roundtrip_and_coalesce():
+    segments = [
+        {"op": "stroke", "color": "#ff0000", "width": 3, "points": [(10, 10), (12, 15)]},
+        {"op": "stroke", "color": "#ff0000", "width": 3, "points": [(12, 15), (20, 18)]},
+        {"op": "fill", "x": 5, "y": 5, "color": "#00ff00"},
+    ]
+    merged = coalesce_operations(segments)
+    assert len(merged) == 2
+    assert merged[0]["points"] == [(10, 10), (12, 15), (20, 18)]
+    # 元の操作は変更しない
+    assert segments[0]["points"] == [(10, 10), (12, 15)]
+
+    assert decode_operations(encode_operations(merged)) == merged
+
+
+def test_clients_share_operations_over_localhost():
+    server = CollabServer("127.0.0.1", 0, width=200, height=150)
+    server.start_background()
+    clients = [CollabClient("127.0.0.1", server.port, batch_interval=0.01) for _ in range(3)]
+    try:
+        snapshots = [client.connect() for client in clients]
+        assert all(snapshot.size == (200, 150) for snapshot in snapshots)
+
+        stroke = {"op": "stroke", "color": "#0000ff", "width": 4, "points": [(10, 10), (80, 60), (150, 20)]}
+        fill = {"op": "fill", "x": 190, "y": 140, "color": "#ffff00"}
+        clients[0].send(stroke)
+        assert _wait_for(clients[1], 1) == [stroke]
+        clients[1].send(fill)
+
+        received = _wait_for(clients[2], 2)
+        assert received == [stroke, fill]
+        # 送信元には送り返さない
+        assert _wait_for(clients[0], 1, timeout=0.2) == [fill]
+
+        expected = Image.new("RGB", (200, 150), "white")
+        for operation in (stroke, fill):
+            expected = canvas_ops.apply_operation(expected, operation)
+        assert server.document.tobytes() == expected.tobytes()
+
+        # 後から参加したクライアントは現在のキャンバスを受け取る
+        late = CollabClient("127.0.0.1", server.port)
+        assert late.connect().tobytes() == expected.tobytes()
+        late.close()
+    finally:
+        for client in clients:
+            client.close()
+        server.shutdown()
+        server.server_close()
+
+
+
+def test_undo_while_remote_stroke_is_in_flight_converges():
+    server = CollabServer("127.0.0.1", 0, width=200, height=150)
+    server.start_background()
+    clients = [CollabClient("127.0.0.1", server.port, batch_interval=0.01) for _ in range(3)]
+    try:
+        canvases = [client.connect() for client in clients]
+        history = HistoryStore()
+        history.push(canvases[0])
+
+        own = {"op": "stroke", "color": "#ff0000", "width": 5, "points": [(10, 20), (90, 20)]}
+        canvases[0] = canvas_ops.apply_operation(canvases[0], own)
+        history.push(canvases[0])
+        clients[0].send(own)
+        for index in (1, 2):
+            for operation in _wait_for(clients[index], 1):
+                canvases[index] = canvas_ops.apply_operation(canvases[index], operation)
+
+        # 2台目のストロークが届く前に1台目がアンドゥする（どちらが先にサーバーに届いても結果は同じ）
+        remote = {"op": "stroke", "color": "#0000ff", "width": 5, "points": [(150, 5), (150, 140)]}
+        canvases[1] = canvas_ops.apply_operation(canvases[1], remote)
+        clients[1].send(remote)
+        source = history.get(history.index)
+        clip = selection_ops.difference_clip(source, history.undo())
+        undo = {"op": "paste", "x": clip.x, "y": clip.y, "png": clip.to_png()}
+        # 送るのは自分のストロークで変わったピクセルだけ
+        assert clip.box[2] <= 100 and clip.box[3] <= 30
+        canvases[0] = canvas_ops.apply_operation(canvases[0], undo)
+        clients[0].send(undo)
+
+        for index, count in ((0, 1), (1, 1), (2, 2)):
+            received = _wait_for(clients[index], count)
+            assert len(received) == count
+            for operation in received:
+                assert operation["op"] != "snapshot"
+                canvases[index] = canvas_ops.apply_operation(canvases[index], operation)
+
+        # 他の人のストロークはアンドゥした端末・描いた端末・サーバーのどれでも残る
+        expected = canvas_ops.apply_operation(Image.new("RGB", (200, 150), "white"), remote)
+        for canvas in canvases:
+            assert canvas.tobytes() == expected.tobytes()
+        deadline = time.monotonic() + 5.0
+        while server.document.tobytes() != expected.tobytes() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert server.document.tobytes() == expected.tobytes()
+    finally:
+        for client in clients:
+            client.close()
+        server.shutdown()
+        server.server_close()
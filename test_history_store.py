@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+メモリ予算付き履歴ストアのテスト
+"""
+
+from PIL import Image
+
+from history_store import HistoryStore
+
+
+def _make_state(value):
+    return Image.new("RGB", (64, 64), (value, value, value))
+
+
+def test_undo_redo_roundtrip():
+    store = HistoryStore()
+    for value in range(5):
+        store.push(_make_state(value))
+
+    assert store.undo().getpixel((0, 0)) == (3, 3, 3)
+    assert store.undo().getpixel((0, 0)) == (2, 2, 2)
+    assert store.redo().getpixel((0, 0)) == (3, 3, 3)
+
+    # 途中から新しい状態を追加するとリドゥ分は破棄される
+    store.push(_make_state(100))
+    assert not store.can_redo
+    assert len(store) == 5
+
+
+def test_budget_compresses_and_spills_old_states():
+    # 1枚分 (64*64*3 = 12288バイト) よりわずかに大きい予算
+    store = HistoryStore(max_bytes=13000)
+    for value in range(30):
+        store.push(_make_state(value))
+
+    assert store.memory_bytes <= 13000
+    assert store.disk_bytes > 0
+    assert len(store) == 30
+
+    # 一時ファイルへ退避された状態も透過的に復元できる
+    for value in reversed(range(29)):
+        assert store.undo().getpixel((10, 10)) == (value, value, value)
+    assert not store.can_undo
+    store.close()
+
+
+def test_disk_budget_drops_oldest_states():
+    store = HistoryStore(max_bytes=13000, max_disk_bytes=200)
+    for value in range(50):
+        store.push(_make_state(value))
+
+    assert store.disk_bytes <= 200
+    assert len(store) < 50
+    assert store.get(store.index).getpixel((0, 0)) == (49, 49, 49)
+    store.close()
+
+
+def test_jump_patches_in_place_and_thumbnails_from_snapshot():
+    from concurrent.futures import ThreadPoolExecutor
+    import history_thumbnails
+
+    # 全体の状態と部分的な変更を混ぜ、古い履歴は圧縮させる
+    store = HistoryStore(max_bytes=64 * 64 * 3 * 2)
+    image = _make_state(0)
+    store.push(image)
+    states = [image.copy()]
+    for value in range(1, 9):
+        if value == 4:
+            image = _make_state(value)
+            store.push(image)
+        else:
+            box = (value * 4, 0, value * 4 + 8, 8)
+            before = image.crop(box)
+            image.paste((value, 0, 0), box)
+            store.push_patch(image, [(box, before, image.crop(box))])
+        states.append(image.copy())
+
+    # 部分的な変更だけをたどる場合は現在の描画データをそのまま書き換える
+    assert store.jump(5, image) is image
+    assert image.tobytes() == states[5].tobytes()
+    assert store.jump(1, image).tobytes() == states[1].tobytes()
+    assert store.jump(8, None).tobytes() == states[8].tobytes()
+    assert store.jump(8, image) is None
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        results = executor.submit(history_thumbnails.render_thumbnails, store.snapshot(2),
+                                  store.serials[2:], (16, 16)).result()
+    assert [serial for serial, _ in results] == store.serials[2:]
+    for (_, thumbnail), state in zip(results, states[2:]):
+        assert thumbnail.tobytes() == history_thumbnails.make_thumbnail(state, (16, 16)).tobytes()
+
+    # 先頭の履歴が破棄されても通し番号は変わらず、キャッシュから消える
+    cache = history_thumbnails.ThumbnailCache()
+    cache.update(results, store.serials[3:])
+    assert cache.missing(store.serials) == store.serials[:3]
+
+
+def _draw_shape(store, image, box, color):
+    before = image.crop(box)
+    image.paste(color, box)
+    store.push_patch(image, [(box, before, image.crop(box))])
+
+
+def test_patch_after_clear_rebuilds_cleared_state():
+    store = HistoryStore()
+    image = Image.new("RGB", (100, 100), "white")
+    store.push(image)
+    image.paste((0, 0, 0), (40, 40, 60, 60))
+    store.push(image)
+
+    # クリア後の状態を保存してから図形を描く（PaintApp.clear_canvas）
+    image = Image.new("RGB", (100, 100), "white")
+    store.push(image)
+    _draw_shape(store, image, (0, 0, 10, 10), (255, 0, 0))
+    top = store.index
+    assert store.entries[top].patches is not None
+    assert store.get(top).getpixel((50, 50)) == (255, 255, 255)
+    assert store.jump(0).getpixel((50, 50)) == (255, 255, 255)
+    state = store.jump(top)
+    assert state.getpixel((50, 50)) == (255, 255, 255) and state.getpixel((5, 5)) == (255, 0, 0)
+
+    # 履歴に記録していない変更やサイズの変更の後は、部分的な変更ではなく全体を保持する
+    image = Image.new("RGB", (100, 100), "white")
+    _draw_shape(store, image, (5, 5, 15, 15), (0, 255, 0))
+    assert store.entries[store.index].patches is None
+    assert store.get(store.index).getpixel((2, 2)) == (255, 255, 255)
+    image = Image.new("RGB", (80, 80), "white")
+    _draw_shape(store, image, (0, 0, 10, 10), (0, 0, 255))
+    assert store.entries[store.index].patches is None
+    assert store.undo().size == (100, 100)
+    assert store.redo().size == (80, 80)
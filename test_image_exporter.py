@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+画像の書き出しのテスト
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image, ImageDraw
+
+import image_exporter
+
+
+def _make_drawing(mode="RGB"):
+    image = Image.new("RGB", (300, 170), "white")
+    draw = ImageDraw.Draw(image)
+    draw.line((0, 0, 299, 169), fill=(255, 0, 0), width=5)
+    draw.ellipse((100, 40, 200, 140), fill=(0, 120, 215))
+    return image.convert(mode)
+
+
+def test_streaming_png_roundtrip(tmp_path):
+    for mode in ("RGB", "RGBA", "L", "P"):
+        image = _make_drawing(mode)
+        path = str(tmp_path / f"drawing_{mode}.png")
+        # 帯の境界をまたぐように小さな帯で書き出す
+        with open(path, "wb") as file:
+            image_exporter.write_png_streaming(image, file, compress_level=1, rows_per_band=7)
+
+        with Image.open(path) as loaded:
+            expected = image if mode != "P" else image.convert("RGB")
+            assert loaded.mode == expected.mode
+            assert loaded.tobytes() == expected.tobytes()
+
+
+def test_export_many_writes_all_formats(tmp_path):
+    image = _make_drawing()
+    paths = [str(tmp_path / name) for name in ("out.png", "out.jpg", "out.webp")]
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = image_exporter.export_many(image, paths, executor, preset="fast")
+        assert [future.result() for future in futures] == paths
+
+    for path, expected_format in zip(paths, ("PNG", "JPEG", "WEBP")):
+        with Image.open(path) as loaded:
+            assert loaded.format == expected_format
+            assert loaded.size == image.size
+
+
+def test_small_preset_is_not_larger_than_fast(tmp_path):
+    image = _make_drawing()
+    fast = image_exporter.export_image(image, str(tmp_path / "fast.png"), preset="fast")
+    small = image_exporter.export_image(image, str(tmp_path / "small.png"), preset="small")
+    assert (tmp_path / "small.png").stat().st_size <= (tmp_path / "fast.png").stat().st_size
+    assert fast != small
+
+
+def test_other_extensions_use_pillow_formats(tmp_path):
+    assert image_exporter.detect_format("out.JPG") == "jpeg"
+    for mode in ("RGB", "P"):
+        image = _make_drawing(mode)
+        for name, expected_format in (("out.bmp", "BMP"), ("out.gif", "GIF"), ("out.tif", "TIFF")):
+            path = image_exporter.export_image(image, str(tmp_path / f"{mode}_{name}"))
+            with Image.open(path) as loaded:
+                assert loaded.format == expected_format
+                assert loaded.convert("RGB").tobytes() == image.convert("RGB").tobytes()
+
+    for name in ("out.unknownext", "out", "out.psd"):
+        with pytest.raises(ValueError):
+            image_exporter.detect_format(name)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+段階的な画像読み込みのテスト
+"""
+
+from PIL import Image
+
+import canvas_ops
+import image_loader
+
+
+def test_load_full_normalizes_transparent_png(tmp_path):
+    path = str(tmp_path / "transparent.png")
+    image = Image.new("RGBA", (40, 30), (255, 0, 0, 0))
+    image.paste((0, 0, 255, 255), (0, 0, 20, 30))
+    image.save(path)
+
+    loaded = image_loader.load_full(path)
+    assert loaded.mode == "RGB"
+    assert loaded.getpixel((5, 5)) == (0, 0, 255)
+    assert loaded.getpixel((30, 5)) == (255, 255, 255)
+
+    # RGBに変換されているので塗りつぶしが正しく動く
+    assert canvas_ops.flood_fill(loaded, 30, 5, (0, 255, 0))
+    assert loaded.getpixel((39, 29)) == (0, 255, 0)
+
+
+def test_load_full_resizes_palette_image(tmp_path):
+    path = str(tmp_path / "palette.png")
+    Image.new("RGB", (40, 30), (10, 20, 30)).convert("P").save(path)
+
+    loaded = image_loader.load_full(path, (80, 60))
+    assert loaded.mode == "RGB"
+    assert loaded.size == (80, 60)
+
+
+def test_preview_uses_draft_decoding_for_jpeg(tmp_path):
+    jpeg_path = str(tmp_path / "large.jpg")
+    png_path = str(tmp_path / "large.png")
+    image = Image.new("RGB", (800, 600), (200, 100, 50))
+    image.save(jpeg_path)
+    image.save(png_path)
+
+    assert image_loader.read_image_size(jpeg_path) == (800, 600)
+
+    preview = image_loader.open_preview(jpeg_path, (800, 600))
+    assert preview.size == (800, 600)
+    assert preview.mode == "RGB"
+
+    # 縮小デコードできない形式ではプレビューを作らない
+    assert image_loader.open_preview(png_path, (800, 600)) is None
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+入力セッションの記録と再生のテスト
+"""
+
+import math
+from types import SimpleNamespace
+
+from headless_paint import HeadlessPaint
+from input_session import SessionRecorder, image_hash, load_session, replay_session
+
+
+def _record_session(path):
+    """
+    HeadlessPaintを操作しながら記録する（PaintAppのハンドラと同じ順序で記録）
+    """
+    app = HeadlessPaint(200, 150)
+    recorder = SessionRecorder(path, app)
+
+    def pointer(kind, x, y):
+        recorder.record(kind, x, y)
+        getattr(app, kind)(SimpleNamespace(x=x, y=y))
+
+    def call(kind, method, *args):
+        recorder.record(kind, *args)
+        getattr(app, method)(*args)
+
+    call("color", "set_color", "#ff0000")
+    call("size", "change_brush_size", 6)
+    pointer("start_draw", 10, 10)
+    for i in range(1, 30):
+        pointer("draw", 10 + i * 5, 10 + i * 4)
+    pointer("stop_draw", 155, 126)
+
+    call("tool", "change_tool", "fill")
+    call("color", "set_color", "#00ff00")
+    pointer("start_draw", 190, 5)
+    pointer("stop_draw", 190, 5)
+
+    call("tool", "change_tool", "eraser")
+    pointer("start_draw", 50, 140)
+    pointer("draw", 50, 20)
+    pointer("stop_draw", 50, 20)
+    call("undo", "undo")
+    call("redo", "redo")
+    call("undo", "undo")
+
+    recorder.close()
+    return app, recorder.event_count
+
+
+def test_replay_reproduces_final_image(tmp_path):
+    path = str(tmp_path / "session.jsonl.gz")
+    recorded_app, event_count = _record_session(path)
+
+    header, events = load_session(path)
+    assert len(events) == event_count
+    assert header["canvas"] == [200, 150]
+
+    report = replay_session(HeadlessPaint(200, 150), header, events)
+    assert report["initial_hash_matches"]
+    assert report["image_hash"] == image_hash(recorded_app.drawing_data)
+    assert report["per_event"]["draw"]["count"] == 30
+    assert report["per_event"]["undo"]["count"] == 2
+
+
+def test_realtime_replay_follows_recorded_timing(tmp_path):
+    path = str(tmp_path / "session.jsonl.gz")
+    _record_session(path)
+    header, events = load_session(path)
+
+    # 記録時刻を引き伸ばして、原速度での再生が待機することを確認
+    stretched = [[index * 2.0] + event[1:] for index, event in enumerate(events)]
+    report = replay_session(HeadlessPaint(200, 150), header, stretched, realtime=True)
+    assert report["seconds"] >= stretched[-1][0] / 1000
+
+
+def test_replay_reproduces_selection_edits(tmp_path):
+    path = str(tmp_path / "session.jsonl.gz")
+    app = HeadlessPaint(200, 150)
+    recorder = SessionRecorder(path, app)
+
+    def pointer(kind, x, y):
+        recorder.record(kind, x, y)
+        getattr(app, kind)(SimpleNamespace(x=x, y=y))
+
+    def call(kind, method, *args):
+        recorder.record(kind, *args)
+        getattr(app, method)(*args)
+
+    def drag(points):
+        pointer("start_draw", *points[0])
+        for point in points[1:]:
+            pointer("draw", *point)
+        pointer("stop_draw", *points[-1])
+
+    call("color", "set_color", "#ff0000")
+    call("size", "change_brush_size", 6)
+    drag([(10, 20), (35, 20), (60, 20)])
+
+    # 矩形選択して下に移動し、Escで確定する
+    call("tool", "change_tool", "select")
+    drag([(5, 10), (70, 30)])
+    drag([(30, 20), (30, 50), (30, 80)])
+    call("commit", "release_selection")
+    # コピーして貼り付け、右に移動してから別のツールに切り替えて確定する
+    drag([(5, 70), (70, 90)])
+    call("copy", "copy_selection")
+    call("paste", "paste_clipboard")
+    drag([(30, 80), (130, 80)])
+    call("tool", "change_tool", "pen")
+    # 投げ縄で切り取る
+    call("tool", "change_tool", "lasso")
+    drag([(110, 70), (160, 70), (160, 90), (110, 90)])
+    call("cut", "cut_selection")
+    recorder.close()
+
+    assert app.drawing_data.getpixel((30, 20)) == (255, 255, 255)
+    assert app.drawing_data.getpixel((30, 80)) == (255, 0, 0)
+    assert app.drawing_data.getpixel((130, 80)) == (255, 255, 255)
+    app.undo()
+    assert app.drawing_data.getpixel((130, 80)) == (255, 0, 0)
+    app.redo()
+
+    header, events = load_session(path)
+    report = replay_session(HeadlessPaint(200, 150), header, events)
+    assert report["image_hash"] == image_hash(app.drawing_data)
+    assert {"copy", "paste", "cut", "commit"} <= set(report["per_event"])
+
+
+def test_replay_reproduces_velocity_brush(tmp_path):
+    path = str(tmp_path / "session.jsonl.gz")
+    app = HeadlessPaint(200, 150)
+    recorder = SessionRecorder(path, app)
+
+    def pointer(kind, x, y, time_ms):
+        recorder.record(kind, x, y, time_ms)
+        getattr(app, kind)(SimpleNamespace(x=x, y=y, time=time_ms))
+
+    def call(kind, method, *args):
+        recorder.record(kind, *args)
+        getattr(app, method)(*args)
+
+    call("brush", "set_brush", "soft")
+    call("size", "change_brush_size", 12)
+    call("velocity", "set_velocity_dynamics", True, True)
+    # 前半はゆっくり、後半は速く動かす
+    pointer("start_draw", 10, 75, 1000)
+    for i in range(1, 40):
+        pointer("draw", 10 + i * 4, 75 + (i % 3), 1000 + (i * 40 if i < 20 else 760 + (i - 20) * 4))
+    pointer("stop_draw", 166, 75, 1200)
+    recorder.close()
+
+    header, events = load_session(path)
+    assert header["velocity_width"] is False
+    # 記録したイベントの時刻から速度を求めるため、再生の速さによらず同じ画像になる
+    report = replay_session(HeadlessPaint(200, 150), header, events)
+    assert report["image_hash"] == image_hash(app.drawing_data)
+    without_velocity = [event for event in events if event[1] != "velocity"]
+    assert replay_session(HeadlessPaint(200, 150), header, without_velocity)["image_hash"] != report["image_hash"]
+
+
+def test_replay_honours_simplify_toggle(tmp_path):
+    path = str(tmp_path / "session.jsonl.gz")
+    app = HeadlessPaint(200, 150)
+    app.set_simplify_strokes(False)
+    recorder = SessionRecorder(path, app)
+
+    def pointer(kind, x, y):
+        recorder.record(kind, x, y)
+        getattr(app, kind)(SimpleNamespace(x=x, y=y))
+
+    def stroke(top):
+        pointer("start_draw", 10, top)
+        for i in range(1, 60):
+            pointer("draw", 10 + i * 3, top + round(8 * math.sin(i / 5)))
+        pointer("stop_draw", 187, top)
+
+    stroke(40)
+    recorder.record("simplify", True)
+    app.set_simplify_strokes(True)
+    stroke(100)
+    recorder.close()
+
+    header, events = load_session(path)
+    assert header["simplify"] is False
+    report = replay_session(HeadlessPaint(200, 150), header, events)
+    assert report["image_hash"] == image_hash(app.drawing_data)
+    simplified = dict(header, simplify=True)
+    assert replay_session(HeadlessPaint(200, 150), simplified, events)["image_hash"] != report["image_hash"]
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+塗りつぶし用の連結領域ラベルのテスト
+"""
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import canvas_ops
+import region_labels
+
+
+def test_fill_matches_flood_fill_after_partial_invalidation():
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 3, (70, 90)).astype(np.uint8) * 100
+    image = Image.frombytes("RGB", (90, 70), np.dstack([values] * 3).tobytes())
+    labels = region_labels.RegionLabels(tile_size=16)
+
+    for step in range(12):
+        x, y = int(rng.integers(0, 90)), int(rng.integers(0, 70))
+        expected = image.copy()
+        canvas_ops.flood_fill(expected, x, y, (step, 1, 2))
+
+        box, mask = labels.region_at(image, x, y)
+        region_labels.fill_region(image, box, mask, (step, 1, 2))
+        labels.invalidate(box)
+        assert image.tobytes() == expected.tobytes()
+
+        # 線を描いて領域を分断し、描いた範囲だけを無効にする
+        x0, y0, x1, y1 = (int(value) for value in rng.integers(0, 70, 4))
+        ImageDraw.Draw(image).line((x0, y0, x1, y1), fill=(200, 200, 200), width=3)
+        labels.invalidate((min(x0, x1) - 3, min(y0, y1) - 3, max(x0, x1) + 4, max(y0, y1) + 4))
+
+
+def test_regions_connect_across_tiles_and_follow_replaced_image():
+    image = Image.new("RGB", (100, 60), "white")
+    ImageDraw.Draw(image).line((50, 0, 50, 59), fill="black")
+    labels = region_labels.RegionLabels(tile_size=8)
+
+    assert labels.label_at(image, 0, 0) == labels.label_at(image, 49, 59)
+    assert labels.label_at(image, 0, 0) != labels.label_at(image, 51, 0)
+    box, mask = labels.region_at(image, 0, 0)
+    assert box == (0, 0, 50, 60) and mask.all()
+
+    # 描画データが置き換わった場合は全体を作り直す
+    cleared = Image.new("RGB", (100, 60), "white")
+    assert labels.label_at(cleared, 0, 0) == labels.label_at(cleared, 99, 0)
+
+    highlight = region_labels.highlight_image(mask, (255, 0, 0))
+    assert highlight.size == (50, 60)
+    assert highlight.getpixel((0, 0)) == (255, 0, 0, 96)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+レンダリングサービスのテスト（localhostで起動して確認）
+"""
+
+import io
+import urllib.error
+
+import pytest
+from PIL import Image
+
+import canvas_ops
+from render_service import RenderServer, render_request, run_load_test
+
+STROKES = [
+    {"op": "stroke", "color": "#ff0000", "width": 7, "points": [[10, 10], [120, 80], [190, 20]]},
+    {"op": "stroke", "color": "white", "width": 3, "points": [[50, 0], [50, 99]]},
+]
+FILL = {"op": "fill", "x": 5, "y": 90, "color": "#00ff00"}
+
+
+@pytest.fixture(scope="module")
+def service_url():
+    server = RenderServer("127.0.0.1", 0, workers=2)
+    server.start_background()
+    yield f"http://127.0.0.1:{server.port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _expected(operations, size=(200, 100)):
+    image = Image.new("RGB", size, "white")
+    for operation in operations:
+        image = canvas_ops.apply_operation(image, operation)
+    return image
+
+
+def test_render_matches_desktop_pixels(service_url):
+    data = render_request(service_url, STROKES + [FILL], width=200, height=100)
+    with Image.open(io.BytesIO(data)) as rendered:
+        assert rendered.tobytes() == _expected(STROKES + [FILL]).tobytes()
+
+
+def test_warm_document_accumulates_batches(service_url):
+    render_request(service_url, STROKES, document_id="doc-a", width=200, height=100)
+    data = render_request(service_url, [FILL], document_id="doc-a", width=200, height=100)
+    with Image.open(io.BytesIO(data)) as rendered:
+        assert rendered.tobytes() == _expected(STROKES + [FILL]).tobytes()
+
+
+def test_invalid_operation_is_rejected(service_url):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        render_request(service_url, [{"op": "unknown"}], width=200, height=100)
+    assert error.value.code == 400
+
+
+def test_load_test_reports_latency(service_url):
+    result = run_load_test(service_url, requests=8, concurrency=4, strokes_per_request=3)
+    assert result["requests"] == 8
+    assert result["p95_ms"] >= result["p50_ms"] > 0
+
+
+def test_oversized_operations_are_rejected_without_touching_document(service_url):
+    render_request(service_url, STROKES, document_id="doc-b", width=200, height=100)
+    for operation in ({"op": "resize", "width": 100000, "height": 100000},
+                      {"op": "stroke", "color": "#000000", "width": 10 ** 9, "points": [[0, 0], [1, 1]]}):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            render_request(service_url, [operation], document_id="doc-b", width=200, height=100)
+        assert error.value.code == 400
+
+    # 途中の操作でエラーになったバッチは常駐するドキュメントに反映しない
+    with pytest.raises(urllib.error.HTTPError):
+        render_request(service_url, [FILL, {"op": "unknown"}], document_id="doc-b", width=200, height=100)
+    data = render_request(service_url, [], document_id="doc-b", width=200, height=100)
+    with Image.open(io.BytesIO(data)) as rendered:
+        assert rendered.tobytes() == _expected(STROKES).tobytes()
+
+
+def test_documents_are_evicted_least_recently_used(monkeypatch):
+    import render_service
+
+    monkeypatch.setattr(render_service, "_documents", render_service.OrderedDict())
+    monkeypatch.setattr(render_service, "MAX_DOCUMENT_BYTES", 2 * 200 * 100 * 3)
+    for document_id in ("a", "b", "a", "c"):
+        render_service._render_in_worker(document_id, 200, 100, [], "png", "fast")
+    assert list(render_service._documents) == ["a", "c"]
+
+
+def test_broken_worker_is_replaced():
+    import os
+    from concurrent.futures.process import BrokenProcessPool
+    from render_service import RenderPool
+
+    pool = RenderPool(workers=1)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            pool.workers[0].submit(os._exit, 1).result()
+        with pytest.raises(BrokenProcessPool):
+            pool.render("doc", 200, 100, STROKES)
+        data = pool.render("doc", 200, 100, STROKES)
+        with Image.open(io.BytesIO(data)) as rendered:
+            assert rendered.tobytes() == _expected(STROKES).tobytes()
+    finally:
+        pool.shutdown()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+サンプリングプロファイラのテスト
+"""
+
+import threading
+import time
+
+from sampling_profiler import SamplingProfiler, handler_tag
+
+
+def _busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += 1
+    return total
+
+
+@handler_tag("flood_fill")
+def _tagged_handler():
+    return _busy_loop(0.2)
+
+
+def test_samples_are_tagged_by_handler(tmp_path):
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    worker = threading.Thread(target=_busy_loop, args=(0.2,), name="paint-io_0")
+    worker.start()
+    _tagged_handler()
+    worker.join()
+    profiler.stop()
+
+    assert profiler.sample_count > 0
+    stacks = list(profiler.samples)
+    assert any("[flood_fill]" in stack and "_busy_loop" in stack for stack in stacks)
+    assert any(stack.startswith("paint-io_0;") and "_busy_loop" in stack for stack in stacks)
+
+    output_path = str(tmp_path / "profile.collapsed")
+    assert profiler.write_collapsed(output_path) == len(profiler.samples)
+    with open(output_path, encoding="utf-8") as file:
+        for line in file:
+            stack, count = line.rsplit(" ", 1)
+            assert stack and int(count) > 0
+
+
+def test_handler_tag_is_transparent_without_profiler():
+    assert _tagged_handler() > 0
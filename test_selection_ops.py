@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+選択範囲のコピー・切り取り・貼り付け・移動のテスト
+"""
+
+import canvas_ops
+import selection_ops
+from history_store import HistoryStore
+from selection_ops import Clip, Selection
+
+
+def _canvas(mode="RGB"):
+    image = canvas_ops.new_canvas_image(80, 60, mode)
+    image = canvas_ops.apply_operation(image, {"op": "fill", "x": 0, "y": 0, "color": "#ff0000"})
+    return canvas_ops.apply_operation(image, {"op": "stroke", "color": "#0000ff", "width": 5,
+                                              "points": [[0, 30], [79, 30]]})
+
+
+def test_move_rectangle_touches_only_source_and_destination():
+    image = _canvas()
+    selection = Selection.rectangle(10, 25, 19, 34, image.size)
+    assert selection.box == (10, 25, 20, 35)
+
+    expected = image.crop(selection.box)
+    image, clip = selection_ops.lift_region(image, selection)
+    assert image.getpixel((15, 30)) == (255, 255, 255)
+
+    clip.x, clip.y = 50, 5
+    image, box = selection_ops.paste_clip(image, clip)
+    assert box == (50, 5, 60, 15)
+    assert image.crop(box).tobytes() == expected.tobytes()
+    # 範囲外は変わらない
+    assert image.getpixel((0, 0)) == (255, 0, 0)
+    assert image.getpixel((79, 30)) == (0, 0, 255)
+
+
+def test_lasso_mask_and_paste_clipped_at_canvas_edge():
+    image = _canvas()
+    selection = Selection.lasso([(20, 20), (40, 20), (20, 40)], image.size)
+    assert selection.contains(22, 22)
+    assert not selection.contains(39, 39)
+
+    image = selection_ops.erase_region(image, selection)
+    assert image.getpixel((22, 22)) == (255, 255, 255)
+    assert image.getpixel((39, 39)) == (255, 0, 0)
+
+    clip = Clip.from_png(selection_ops.copy_region(_canvas(), selection).to_png(), 70, 50)
+    image, box = selection_ops.paste_clip(image, clip)
+    assert box == (70, 50, 80, 60)
+
+
+def test_operations_replay_like_direct_calls_in_indexed_mode():
+    operations = [
+        {"op": "move", "box": [5, 25, 30, 36], "polygon": None, "x": 40, "y": 2},
+        {"op": "cut", "box": [0, 0, 20, 20], "polygon": [[0, 0], [19, 0], [0, 19]]},
+    ]
+    clip = selection_ops.copy_region(_canvas(), Selection((60, 28, 70, 33)))
+    clip.x, clip.y = 0, 50
+    operations.append({"op": "paste", "x": 0, "y": 50, "png": clip.to_png()})
+
+    rgb, indexed = _canvas(), _canvas("P")
+    for operation in operations:
+        rgb = canvas_ops.apply_operation(rgb, operation)
+        indexed = canvas_ops.apply_operation(indexed, operation)
+    assert indexed.mode == "P"
+    assert indexed.convert("RGB").tobytes() == rgb.tobytes()
+
+
+def test_history_records_only_changed_region():
+    image = _canvas()
+    store = HistoryStore()
+    store.push(image)
+    original = image.copy()
+
+    selection = Selection((10, 25, 20, 35))
+    before = image.crop(selection.box)
+    image = selection_ops.erase_region(image, selection)
+    store.push_patch(image, [(selection.box, before, image.crop(selection.box))])
+    assert store.entries[-1].memory_bytes == 2 * 10 * 10 * 3
+    erased = image.copy()
+
+    assert store.undo(image) is image
+    assert image.tobytes() == original.tobytes()
+    assert store.redo(image).tobytes() == erased.tobytes()
+    # 現在の描画データを渡さない場合は直前の全体の状態から組み立てる
+    assert store.get(1).tobytes() == erased.tobytes()
+    assert store.undo().tobytes() == original.tobytes()
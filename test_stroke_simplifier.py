@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ストロークの点の間引きのテスト
+"""
+
+import math
+from types import SimpleNamespace
+
+import numpy as np
+
+from headless_paint import HeadlessPaint
+from stroke_simplifier import StrokeSimplifier, _segment_distance
+
+
+def _simplify(points, simplifier):
+    simplifier.start(*points[0])
+    output = [points[0]]
+    for point in points[1:]:
+        emitted = simplifier.add(*point)
+        if emitted:
+            output.append(emitted[:2])
+    last = simplifier.finish()
+    if last:
+        output.append(last[:2])
+    return output
+
+
+def test_straight_runs_and_still_jitter_collapse_but_turns_are_kept():
+    points = [(10 + i, 20) for i in range(50)]
+    points += [(59 + (i % 2), 20) for i in range(30)]  # ほぼ静止
+    points += [(59 - i, 20) for i in range(1, 40)]  # 折り返し
+    output = _simplify(points, StrokeSimplifier(max_pending=32))
+    # 折り返し点は残り、それ以外は保留の上限ごとの点だけになる
+    assert (60, 20) in output
+    assert output[0] == (10, 20) and output[-1] == (20, 20)
+    assert len(output) <= 6
+
+
+def test_deviation_is_bounded_on_curves():
+    rng = np.random.default_rng(1)
+    angle, x, y = 0.0, 100.0, 100.0
+    points = []
+    for _ in range(2000):
+        angle += rng.uniform(-0.08, 0.08)
+        x, y = x + 3 * math.cos(angle), y + 3 * math.sin(angle)
+        points.append((round(x), round(y)))
+    simplifier = StrokeSimplifier()
+    output = _simplify(points, simplifier)
+    assert len(output) < len(points) / 3
+    assert simplifier.emitted == len(output)
+    for px, py in points:
+        distance = min(_segment_distance(px, py, *output[i], *output[i + 1]) for i in range(len(output) - 1))
+        assert distance <= simplifier.min_distance
+
+
+def test_headless_stroke_looks_the_same_with_fewer_segments():
+    images = []
+    for simplify in (False, True):
+        app = HeadlessPaint(200, 150)
+        app.simplify_strokes = simplify
+        app.change_brush_size(3)
+        app.start_draw(SimpleNamespace(x=20, y=20))
+        for i in range(300):
+            app.draw(SimpleNamespace(x=20 + i // 2, y=round(20 + 40 * math.sin(i / 60))))
+        app.stop_draw(SimpleNamespace(x=170, y=20))
+        images.append(np.asarray(app.drawing_data.convert("L")) < 128)
+    # 違いは線の縁の1ピクセルだけ
+    for a, b in (images, images[::-1]):
+        grown = b.copy()
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                grown |= np.roll(np.roll(b, dy, axis=0), dx, axis=1)
+        assert not (a & ~grown).any()
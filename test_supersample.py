@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+高解像度の描画データの縮小表示のテスト
+"""
+
+from PIL import Image, ImageDraw
+
+import canvas_ops
+import supersample
+
+
+def test_scale_for_dpi():
+    assert supersample.scale_for_dpi(96) == 1
+    assert supersample.scale_for_dpi(72) == 1
+    assert supersample.scale_for_dpi(192) == 2
+    assert supersample.scale_for_dpi(1000) == supersample.MAX_SCALE
+
+
+def test_only_tiles_touched_by_box_are_dirty():
+    grid = supersample.TileGrid((1000, 600), 2, tile_size=64)
+    assert (grid.columns, grid.rows) == (8, 5)
+    assert grid.view_size == (500, 300)
+
+    # 描画データ上の1タイルは128ピクセル四方
+    grid.mark((120, 10, 140, 20))
+    assert grid.take_dirty() == [(0, 0), (1, 0)]
+    assert grid.take_dirty() == []
+
+    grid.mark((-10, 590, 2000, 700))
+    assert grid.take_dirty() == [(column, 4) for column in range(8)]
+    # 端のタイルは描画データの範囲で切り詰める
+    assert grid.tile_box((7, 4)) == (896, 512, 1000, 600)
+    assert grid.view_origin((7, 4)) == (448, 256)
+
+    grid.mark()
+    assert grid.dirty_count == len(grid)
+
+
+def test_tiles_average_supersampled_pixels():
+    image = canvas_ops.new_canvas_image(256, 256, "P")
+    ImageDraw.Draw(image).line((0, 1, 255, 1), fill=canvas_ops.ink_for(image, "#000000"), width=1)
+    grid = supersample.TileGrid(image.size, 2, tile_size=64)
+    grid.mark((0, 0, 10, 10))
+    tile = grid.render(image, grid.take_dirty()[0])
+
+    # パレット番号ではなく色を平均する（1行だけ黒の2×2ブロックは灰色）
+    assert tile.mode == "RGB" and tile.size == (64, 64)
+    assert tile.getpixel((5, 0)) == (128, 128, 128)
+    assert tile.getpixel((5, 1)) == (255, 255, 255)
+
+    rgb = Image.new("RGB", (4, 4), "white")
+    assert supersample.downsample(rgb, 1) is rgb
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+タイムラプスの記録と書き出しのテスト
+"""
+
+from PIL import Image
+
+import selection_ops
+import timelapse
+from selection_ops import Selection
+
+
+def _record(path):
+    recorder = timelapse.TimelapseRecorder(str(path), Image.new("RGB", (60, 40), "white"))
+    for i in range(9):
+        recorder.record({"op": "stroke", "color": f"#{i * 25:02x}0000", "width": 3,
+                         "points": [[5, 4 * i], [55, 4 * i]]})
+    # アンドゥなどの後は状態として記録する
+    recorder.record_state(Image.new("RGB", (60, 40), "blue"))
+    recorder.record({"op": "resize", "width": 120, "height": 40})
+    recorder.close()
+    return recorder
+
+
+def test_frames_replay_operations_and_ignore_partial_tail(tmp_path):
+    path = tmp_path / "drawing.jsonl"
+    _record(path)
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"op": "clear"')  # 書き込み途中
+
+    frames = [frame.copy() for frame in timelapse.iter_frames(str(path), every=4)]
+    # 最初の状態 + 9操作 + 状態 + サイズ変更 = 12件
+    assert len(frames) == 3
+    assert frames[0].getpixel((30, 4)) == (25, 0, 0)
+    # サイズが変わっても最初のキャンバスに合わせる（縦横比を保ち、余白は白）
+    assert all(frame.size == (60, 40) for frame in frames)
+    assert frames[-1].getpixel((10, 5)) == (0, 0, 255)
+    assert frames[-1].getpixel((30, 35)) == (255, 255, 255)
+
+
+def test_export_streams_gif_webp_and_png_sequence(tmp_path):
+    path = tmp_path / "drawing.jsonl"
+    _record(path)
+    expected = [frame.copy() for frame in timelapse.iter_frames(str(path), every=2, max_size=30)]
+
+    assert timelapse.export_timelapse(str(path), str(tmp_path / "out.gif"), every=2, max_size=30) == 6
+    with Image.open(tmp_path / "out.gif") as gif:
+        assert gif.size == (30, 20) and gif.n_frames == 6
+        for index, frame in enumerate(expected):
+            gif.seek(index)
+            assert gif.convert("RGB").tobytes() == frame.tobytes()
+
+    assert timelapse.export_timelapse(str(path), str(tmp_path / "out.webp"), every=2, duration_ms=50) == 6
+    with Image.open(tmp_path / "out.webp") as webp:
+        assert webp.size == (60, 40) and webp.n_frames == 6
+        webp.seek(5)
+        webp.load()
+        assert webp.info["duration"] == 50
+
+    assert timelapse.export_timelapse(str(path), str(tmp_path / "frame.png"), every=12) == 1
+    assert (tmp_path / "frame_00000.png").exists()
+
+
+def test_frames_replay_pasted_selection(tmp_path):
+    path = tmp_path / "drawing.jsonl"
+    recorder = timelapse.TimelapseRecorder(str(path), Image.new("RGB", (60, 40), "white"))
+    recorder.record({"op": "stroke", "color": "#ff0000", "width": 3, "points": [[5, 5], [15, 5]]})
+    clip = selection_ops.copy_region(Image.new("RGB", (60, 40), "blue"), Selection.rectangle(0, 0, 9, 9, (60, 40)))
+    recorder.record({"op": "paste", "x": 40, "y": 20, "png": clip.to_png()})
+    recorder.close()
+
+    frames = [frame.copy() for frame in timelapse.iter_frames(str(path))]
+    assert len(frames) == 3
+    assert frames[-1].getpixel((10, 5)) == (255, 0, 0)
+    assert frames[-1].getpixel((45, 25)) == (0, 0, 255)
+    assert frames[-1].getpixel((35, 25)) == (255, 255, 255)
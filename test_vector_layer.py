@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ベクターのストロークと空間インデックスのテスト
+"""
+
+import random
+
+import pytest
+from PIL import ImageChops, ImageDraw
+
+import canvas_ops
+import vector_layer
+
+
+def _draw(image, layer, points, color, width):
+    """
+    PaintAppと同じく描画データに描いてからストロークを登録する
+    """
+    canvas_ops.draw_stroke(ImageDraw.Draw(image), points, canvas_ops.ink_for(image, color), width)
+    return layer.add(points, color, width)
+
+
+def _same(a, b):
+    return ImageChops.difference(a.convert("RGB"), b.convert("RGB")).getbbox() is None
+
+
+def test_hit_test_queries_only_nearby_cells():
+    image = canvas_ops.new_canvas_image(4000, 4000, "RGB")
+    layer = vector_layer.VectorLayer(image)
+    generator = random.Random(0)
+    for _ in range(20000):
+        x, y = generator.randrange(0, 3900), generator.randrange(0, 3900)
+        layer.add([(x, y), (x + generator.randrange(1, 60), y + generator.randrange(1, 60))], "#000000", 3)
+    top = layer.add([(100, 100), (300, 100)], "#ff0000", 9)
+
+    assert layer.hit_test(200, 104) is top
+    assert layer.hit_test(200, 110) is not top
+    assert layer.hit_test(200, 110, tolerance=6) is top
+    # 調べるのは点の周りのセルに登録されたストロークだけ
+    assert len(layer.grid.query((199, 103, 202, 106))) < 100
+
+    layer.remove(top)
+    assert top.id not in layer.grid.query((199, 103, 202, 106))
+    assert top not in layer.strokes_in_box((0, 0, 4000, 4000))
+
+
+@pytest.mark.parametrize("mode", ["RGB", "P"])
+def test_erase_redraws_only_the_stroke_box(mode):
+    image = canvas_ops.new_canvas_image(200, 150, mode)
+    ImageDraw.Draw(image).rectangle((20, 20, 120, 100), fill=canvas_ops.ink_for(image, "#00ff00"))
+    layer = vector_layer.VectorLayer(image)
+    below = _draw(image, layer, [(10, 30), (150, 90)], "#ff0000", 5)
+    erased = _draw(image, layer, [(10, 90), (80, 40), (150, 30)], "#0000ff", 7)
+    above = _draw(image, layer, [(60, 10), (70, 140)], "#000000", 3)
+
+    expected = canvas_ops.new_canvas_image(200, 150, mode)
+    ImageDraw.Draw(expected).rectangle((20, 20, 120, 100), fill=canvas_ops.ink_for(expected, "#00ff00"))
+    for stroke in (below, above):
+        stroke.render(ImageDraw.Draw(expected), canvas_ops.ink_for(expected, stroke.color))
+
+    inks = {color: canvas_ops.ink_for(image, color) for color in layer.colors}
+    regions = layer.erase([erased], image, inks)
+    assert [box for box, _, _ in regions] == [layer.clip(erased.bounds)]
+    assert _same(image, expected)
+    assert list(layer.strokes) == [below.id, above.id]
+
+
+def test_flatten_keeps_pixels_and_stroke_order():
+    image = canvas_ops.new_canvas_image(200, 150, "RGB")
+    layer = vector_layer.VectorLayer(image)
+    first = _draw(image, layer, [(10, 75), (190, 75)], "#ff0000", 9)
+    second = _draw(image, layer, [(100, 10), (100, 140)], "#0000ff", 9)
+    apart = _draw(image, layer, [(10, 10), (40, 10)], "#000000", 3)
+
+    # 消しゴムで描いた範囲に掛かるストロークと、その下のストロークを確定する
+    eraser_box = (95, 120, 106, 141)
+    ImageDraw.Draw(image).rectangle((95, 120, 105, 140), fill="white")
+    inks = {color: color for color in layer.colors}
+    flattened = layer.flatten(image, inks, eraser_box)
+    assert {stroke.id for stroke in flattened} == {first.id, second.id}
+    assert list(layer.strokes) == [apart.id]
+
+    before = image.copy()
+    layer.erase([apart], image, inks)
+    ImageDraw.Draw(before).rectangle(layer.clip(apart.bounds), fill="white")
+    assert _same(image, before)
+
+    assert layer.colors == []
+    assert len(layer.flatten(image, {})) == 0
+    assert _same(layer.base, image)
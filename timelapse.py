@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+描画過程のタイムラプス
+描画操作と、アンドゥなど操作として再生できない変化の後の状態を追記専用のファイルに記録する
+書き出しでは記録を1件ずつ再生しながらフレームを1枚ずつエンコードする（ジェネレータでつなぐため、
+操作数によらずメモリ上のフレームは常に1枚）
+
+GIFとWebPはPillowの複数フレームの保存が全フレームを保持するため、
+1フレームずつエンコードした結果をアニメーションのコンテナに追記する
+
+書き出し:
+    python timelapse.py drawing.timelapse.jsonl out.gif --every 5
+    python timelapse.py drawing.timelapse.jsonl out.webp --max-size 400
+    python timelapse.py drawing.timelapse.jsonl frames/out.png  # out_00000.png, out_00001.png, ...
+"""
+
+from typing import BinaryIO, Iterator, Optional, Tuple
+import argparse
+import base64
+import io
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+from PIL import Image
+
+import canvas_ops
+
+TIMELAPSE_VERSION = 1
+
+# 書き出し形式と拡張子の対応（それ以外の拡張子は連番PNG）
+_EXTENSION_FORMATS = {
+    ".gif": "gif",
+    ".webp": "webp",
+}
+
+# 書き込みスレッドへの停止要求
+_STOP = object()
+
+
+def default_output_path() -> str:
+    """
+    既定の記録先のパス（カレントディレクトリに日時付きで作成）
+    """
+    return os.path.abspath(time.strftime("timelapse-%Y%m%d-%H%M%S.jsonl"))
+
+
+def _encode_state(image: Image.Image) -> str:
+    """
+    状態の画像をPNG（速度優先）のbase64にする
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _decode_state(data: str) -> Image.Image:
+    image = Image.open(io.BytesIO(base64.b64decode(data)))
+    image.load()
+    return image
+
+
+class TimelapseRecorder:
+    """
+    タイムラプス用の記録
+    UIスレッドは操作と状態のコピーをキューに積むだけで、エンコードと書き込みは書き込みスレッドで行う
+    """
+    def __init__(self, output_path: str, image: Image.Image):
+        """
+        記録を開始する
+
+        Args:
+            output_path: 記録先のパス
+            image: 現在の描画データ（最初のフレームになる）
+        """
+        self.output_path = output_path
+        self.operation_count = 0
+        self._file = open(output_path, "w", encoding="utf-8")
+        header = {"version": TIMELAPSE_VERSION, "canvas": [image.width, image.height]}
+        self._file.write(json.dumps(header, separators=(",", ":")) + "\n")
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._writer_loop, name="timelapse-recorder", daemon=True)
+        self._thread.start()
+        self.record_state(image)
+
+    def record(self, operation: dict) -> None:
+        """
+        描画操作を記録する
+
+        Args:
+            operation: canvas_ops.apply_operationで再生できる操作
+        """
+        self.operation_count += 1
+        self._queue.put(operation)
+
+    def record_state(self, image: Image.Image) -> None:
+        """
+        操作として再生できない変化（アンドゥ・読み込みなど）の後の状態を記録する
+
+        Args:
+            image: 現在の描画データ（コピーして書き込みスレッドに渡す）
+        """
+        self._queue.put(image.copy())
+
+    def flush(self) -> None:
+        """
+        キューに積んだ記録を全てファイルに書き終えるまで待つ（書き出しの前に呼ぶ）
+        """
+        self._queue.join()
+
+    def close(self) -> None:
+        """
+        書き込みスレッドを停止してファイルを閉じる
+        """
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+            self._file.close()
+
+    def _writer_loop(self) -> None:
+        """
+        書き込みスレッドの処理（キューが空になるたびにファイルをフラッシュする）
+        """
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if isinstance(item, Image.Image):
+                    item = {"op": "state", "png": _encode_state(item)}
+                self._file.write(json.dumps(item, separators=(",", ":")) + "\n")
+                if self._queue.empty():
+                    self._file.flush()
+            except (OSError, ValueError) as e:
+                print(f"タイムラプスの記録エラー: {e}")
+            finally:
+                self._queue.task_done()
+
+
+def iter_records(path: str) -> Iterator[dict]:
+    """
+    記録を1件ずつ読み出す（書き込み途中の末尾の行は無視する）
+
+    Args:
+        path: 記録のパス
+
+    Yields:
+        操作、または{"op": "state", "png": base64}の状態
+    """
+    with open(path, encoding="utf-8") as file:
+        header = json.loads(file.readline())
+        if header.get("version") != TIMELAPSE_VERSION:
+            raise ValueError(f"未対応の記録ファイルです: {path}")
+        for line in file:
+            if not line.endswith("\n"):
+                return
+            yield json.loads(line)
+
+
+def _fit_frame(image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """
+    フレームをRGBにして指定サイズに合わせる（縦横比を保って縮小し、余白は白）
+    """
+    rgb = image if image.mode == "RGB" else image.convert("RGB")
+    if rgb.size == size:
+        return rgb
+    scale = min(size[0] / rgb.width, size[1] / rgb.height)
+    scaled = rgb.resize((max(1, round(rgb.width * scale)), max(1, round(rgb.height * scale))),
+                        Image.BILINEAR, reducing_gap=2.0)
+    if scaled.size == size:
+        return scaled
+    frame = Image.new("RGB", size, "white")
+    frame.paste(scaled, (0, 0))
+    return frame
+
+
+def frame_size(path: str, max_size: Optional[int] = None) -> Tuple[int, int]:
+    """
+    書き出すフレームのサイズ（記録開始時のキャンバスを長辺がmax_size以下になるよう縮小）
+    """
+    with open(path, encoding="utf-8") as file:
+        width, height = json.loads(file.readline())["canvas"]
+    if max_size and max(width, height) > max_size:
+        scale = max_size / max(width, height)
+        width, height = max(1, round(width * scale)), max(1, round(height * scale))
+    return width, height
+
+
+def iter_frames(path: str, every: int = 1, max_size: Optional[int] = None) -> Iterator[Image.Image]:
+    """
+    記録を再生しながらフレームを1枚ずつ生成する
+
+    Args:
+        path: 記録のパス
+        every: 1フレームにまとめる記録の件数
+        max_size: フレームの長辺の上限（Noneの場合は元のサイズ）
+
+    Yields:
+        RGBのフレーム（次のフレームの生成で書き換えられることがあるため、必要ならコピーする）
+    """
+    size = frame_size(path, max_size)
+    image = None
+    pending = 0
+    for record in iter_records(path):
+        if record["op"] == "state":
+            image = _decode_state(record["png"])
+        elif image is not None:
+            image = canvas_ops.apply_operation(image, record)
+        else:
+            continue
+        pending += 1
+        if pending >= every:
+            pending = 0
+            yield _fit_frame(image, size)
+    if pending and image is not None:
+        yield _fit_frame(image, size)
+
+
+class GifStreamWriter:
+    """
+    フレームを1枚ずつ追記するアニメーションGIF
+    各フレームはPillowで1枚のGIFとしてエンコードし、パレットをローカルカラーテーブルにして追記する
+    """
+    def __init__(self, file: BinaryIO, size: Tuple[int, int], duration_ms: int = 100, loop: int = 0):
+        self.file = file
+        self.duration_ms = duration_ms
+        # ヘッダ・論理画面（グローバルカラーテーブルなし）・ループ回数
+        file.write(b"GIF89a" + struct.pack("<HHBBB", size[0], size[1], 0, 0, 0))
+        file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", loop) + b"\x00")
+
+    def add(self, frame: Image.Image) -> None:
+        # 256色以下なら減色せずにパレット化する
+        paletted = canvas_ops.to_indexed(frame)
+        if paletted is None:
+            paletted = frame.quantize(256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        buffer = io.BytesIO()
+        paletted.save(buffer, format="GIF", optimize=False)
+        data = buffer.getvalue()
+
+        flags = data[10]
+        position = 13
+        table = b""
+        if flags & 0x80:
+            table = data[13:13 + (3 << ((flags & 7) + 1))]
+            position += len(table)
+        # 拡張ブロックを読み飛ばす
+        while data[position] == 0x21:
+            position += 2
+            while data[position]:
+                position += data[position] + 1
+            position += 1
+        descriptor = bytearray(data[position:position + 10])
+        if table and not descriptor[9] & 0x80:
+            descriptor[9] |= 0x80 | (flags & 7)
+        else:
+            table = b""
+
+        # 表示時間（1/100秒単位）と、次のフレームで消さない指定
+        self.file.write(b"\x21\xf9\x04\x04" + struct.pack("<H", max(1, round(self.duration_ms / 10))) + b"\x00\x00")
+        # 画像記述子・カラーテーブル・LZWのデータ（末尾のトレーラーは除く）
+        self.file.write(bytes(descriptor) + table + data[position + 10:-1])
+
+    def close(self) -> None:
+        self.file.write(b"\x3b")
+
+
+class WebPStreamWriter:
+    """
+    フレームを1枚ずつ追記するアニメーションWebP
+    各フレームはPillowで1枚のWebPとしてエンコードし、画像のチャンクをANMFチャンクに入れて追記する
+    RIFFのサイズは最後に書き戻す
+    """
+    def __init__(self, file: BinaryIO, size: Tuple[int, int], duration_ms: int = 100, loop: int = 0,
+                 quality: int = 80, method: int = 4):
+        self.file = file
+        self.size = size
+        self.duration_ms = duration_ms
+        self.quality = quality
+        self.method = method
+        self._start = file.tell()
+        file.write(b"RIFF\x00\x00\x00\x00WEBP")
+        # アニメーションのフラグとキャンバスのサイズ
+        file.write(b"VP8X" + struct.pack("<I", 10) + b"\x02\x00\x00\x00"
+                   + _u24(size[0] - 1) + _u24(size[1] - 1))
+        # 背景色（白）とループ回数
+        file.write(b"ANIM" + struct.pack("<I", 6) + struct.pack("<IH", 0xFFFFFFFF, loop))
+
+    def add(self, frame: Image.Image) -> None:
+        buffer = io.BytesIO()
+        frame.save(buffer, format="WEBP", quality=self.quality, method=self.method)
+        data = buffer.getvalue()
+
+        chunks = []
+        position = 12
+        while position + 8 <= len(data):
+            fourcc = data[position:position + 4]
+            length = struct.unpack("<I", data[position + 4:position + 8])[0]
+            end = position + 8 + length + (length & 1)
+            if fourcc in (b"ALPH", b"VP8 ", b"VP8L"):
+                chunks.append(data[position:end])
+            position = end
+        image_data = b"".join(chunks)
+
+        # 位置(0, 0)・フレームのサイズ・表示時間・重ね合わせなし
+        header = (_u24(0) + _u24(0) + _u24(frame.width - 1) + _u24(frame.height - 1)
+                  + _u24(self.duration_ms) + b"\x02")
+        self.file.write(b"ANMF" + struct.pack("<I", len(header) + len(image_data)) + header + image_data)
+
+    def close(self) -> None:
+        end = self.file.tell()
+        self.file.seek(self._start + 4)
+        self.file.write(struct.pack("<I", end - self._start - 8))
+        self.file.seek(end)
+
+
+def _u24(value: int) -> bytes:
+    return struct.pack("<I", value)[:3]
+
+
+def detect_format(output_path: str) -> str:
+    """
+    拡張子から書き出し形式を判定する
+
+    Returns:
+        "gif"・"webp"・"png"（連番PNG）のいずれか
+    """
+    return _EXTENSION_FORMATS.get(os.path.splitext(output_path)[1].lower(), "png")
+
+
+def export_timelapse(recording_path: str, output_path: str, every: int = 1, duration_ms: int = 100,
+                     max_size: Optional[int] = None, max_frames: Optional[int] = None) -> int:
+    """
+    記録からタイムラプスを書き出す（フレームは1枚ずつ生成・エンコードする）
+
+    Args:
+        recording_path: 記録のパス
+        output_path: 書き出し先（.gif・.webp、それ以外は連番PNGの基準のパス）
+        every: 1フレームにまとめる記録の件数
+        duration_ms: 1フレームの表示時間（ミリ秒）
+        max_size: フレームの長辺の上限
+        max_frames: フレーム数の上限（超える場合は1フレームにまとめる件数を増やす）
+
+    Returns:
+        書き出したフレーム数
+    """
+    if max_frames:
+        with open(recording_path, encoding="utf-8") as file:
+            record_count = sum(1 for _ in file) - 1
+        every = max(every, -(-record_count // max_frames))
+    format_name = detect_format(output_path)
+    frames = iter_frames(recording_path, every, max_size)
+    count = 0
+    if format_name == "png":
+        base = os.path.splitext(output_path)[0]
+        for count, frame in enumerate(frames, 1):
+            frame.save(f"{base}_{count - 1:05d}.png", compress_level=1)
+        return count
+
+    size = frame_size(recording_path, max_size)
+    with open(output_path, "wb") as file:
+        if format_name == "gif":
+            writer = GifStreamWriter(file, size, duration_ms)
+        else:
+            writer = WebPStreamWriter(file, size, duration_ms)
+        for count, frame in enumerate(frames, 1):
+            writer.add(frame)
+        writer.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="記録からタイムラプスを書き出す")
+    parser.add_argument("recording", help="記録ファイルのパス")
+    parser.add_argument("output", help="書き出し先（.gif・.webp、それ以外は連番PNG）")
+    parser.add_argument("--every", type=int, default=1, help="1フレームにまとめる操作の数")
+    parser.add_argument("--duration", type=int, default=100, help="1フレームの表示時間（ミリ秒）")
+    parser.add_argument("--max-size", type=int, help="フレームの長辺の上限（ピクセル）")
+    parser.add_argument("--max-frames", type=int, help="フレーム数の上限")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = export_timelapse(args.recording, args.output, args.every, args.duration, args.max_size,
+                             args.max_frames)
+    print(f"{count}フレームを書き出しました ({time.perf_counter() - start:.1f}秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ベクターのストローク
+ペンのストロークを描画データに描いた後もオブジェクトとして保持し、一様グリッドの空間インデックスで
+マウス位置の近くのストロークだけを調べる（ストロークの数によらずヒットテストの時間がほぼ一定）
+
+描画データ = 下地（ストローク以外の全て） + 残っているストロークを古い順に描いたもの、が常に成り立つようにし、
+ストロークを消す時は下地の矩形にその矩形に掛かる残りのストロークだけを描き直す
+"""
+
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+import math
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import canvas_ops
+
+Box = Tuple[int, int, int, int]
+
+# 空間インデックスのセルの一辺（描画データのピクセル）
+DEFAULT_CELL_SIZE = 32
+
+
+def _intersects(a: Box, b: Box) -> bool:
+    """
+    2つの矩形が重なるかどうか
+    """
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class VectorStroke:
+    """
+    描画データに描いたペンのストローク
+    """
+    def __init__(self, stroke_id: int, points: Sequence[Tuple[int, int]], color: str, width: int):
+        """
+        Args:
+            stroke_id: 描いた順の番号（大きいほど上に描かれている）
+            points: ストロークの点のリスト（2点以上）
+            color: 線の色
+            width: 線の太さ（描画データのピクセル）
+        """
+        self.id = stroke_id
+        self.points = [(int(x), int(y)) for x, y in points]
+        self.color = color
+        self.width = width
+        xs = [x for x, _ in self.points]
+        ys = [y for _, y in self.points]
+        # 点の外接矩形と、線の太さの分だけ広げた描画で書き換わる可能性がある矩形（PaintApp.draw_line_segmentと同じ）
+        self.extent = (min(xs), min(ys), max(xs) + 1, max(ys) + 1)
+        self.bounds = (min(xs) - width, min(ys) - width, max(xs) + width + 1, max(ys) + width + 1)
+        self._segments = None  # ヒットテスト用の線分の始点と向き（最初のヒットテストで作成する）
+
+    def distance(self, x: float, y: float) -> float:
+        """
+        点からストロークの中心線までの最短距離
+        """
+        if self._segments is None:
+            points = np.asarray(self.points, dtype=np.float64)
+            segment = points[1:] - points[:-1]
+            self._segments = (points[:-1, 0], points[:-1, 1], segment[:, 0], segment[:, 1],
+                              np.maximum(segment[:, 0] ** 2 + segment[:, 1] ** 2, 1e-12))
+        x0, y0, sx, sy, length = self._segments
+        t = np.clip(((x - x0) * sx + (y - y0) * sy) / length, 0.0, 1.0)
+        dx = x0 + t * sx - x
+        dy = y0 + t * sy - y
+        return float(np.sqrt((dx * dx + dy * dy).min()))
+
+    def render(self, draw: ImageDraw.ImageDraw, ink, offset: Tuple[int, int] = (0, 0)) -> None:
+        """
+        ストロークを描画する（描画中と同じ線分単位の描画）
+
+        Args:
+            draw: 描画先のImageDraw
+            ink: 線のインク（インデックスカラーではパレット番号）
+            offset: 座標に加える移動量（矩形を切り出した画像に描く場合）
+        """
+        dx, dy = offset
+        canvas_ops.draw_stroke(draw, [(x + dx, y + dy) for x, y in self.points], ink, self.width)
+
+
+class SpatialGrid:
+    """
+    ストロークの一様グリッドの空間インデックス
+    ストロークは外接矩形ではなく線分ごとに掛かるセルに登録するため、長いストロークでも近くのセルにしか入らない
+    """
+    def __init__(self, cell_size: int = DEFAULT_CELL_SIZE):
+        """
+        Args:
+            cell_size: セルの一辺（ピクセル）
+        """
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._stroke_cells: Dict[int, List[Tuple[int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._stroke_cells)
+
+    def _cell_range(self, box: Sequence[float]) -> Iterable[Tuple[int, int]]:
+        """
+        矩形に掛かるセル
+        """
+        size = self.cell_size
+        column0, row0 = math.floor(box[0] / size), math.floor(box[1] / size)
+        column1, row1 = math.floor((box[2] - 1) / size), math.floor((box[3] - 1) / size)
+        return ((column, row) for row in range(row0, row1 + 1) for column in range(column0, column1 + 1))
+
+    def insert(self, stroke: VectorStroke) -> None:
+        """
+        ストロークを登録する
+        """
+        margin = stroke.width / 2 + 1
+        cells = set()
+        for (x1, y1), (x2, y2) in zip(stroke.points, stroke.points[1:]):
+            cells.update(self._cell_range((min(x1, x2) - margin, min(y1, y2) - margin,
+                                           max(x1, x2) + margin + 1, max(y1, y2) + margin + 1)))
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(stroke.id)
+        self._stroke_cells[stroke.id] = list(cells)
+
+    def remove(self, stroke_id: int) -> None:
+        """
+        ストロークの登録を消す
+        """
+        for cell in self._stroke_cells.pop(stroke_id, ()):
+            ids = self.cells[cell]
+            ids.discard(stroke_id)
+            if not ids:
+                del self.cells[cell]
+
+    def query(self, box: Sequence[float]) -> Set[int]:
+        """
+        矩形に掛かるセルに登録されたストロークの番号（候補のため、実際に重なるかは呼び出し側で確かめる）
+
+        Args:
+            box: 矩形 (x0, y0, x1, y1)
+
+        Returns:
+            ストロークの番号の集合
+        """
+        found = set()
+        for cell in self._cell_range(box):
+            ids = self.cells.get(cell)
+            if ids:
+                found |= ids
+        return found
+
+
+class VectorLayer:
+    """
+    描画データに描いたストロークのオブジェクトと、ストロークを除いた下地
+    """
+    def __init__(self, image: Image.Image, cell_size: int = DEFAULT_CELL_SIZE):
+        """
+        Args:
+            image: 現在の描画データ（コピーを下地にする）
+            cell_size: 空間インデックスのセルの一辺
+        """
+        self.cell_size = cell_size
+        self.reset(image)
+
+    def __len__(self) -> int:
+        return len(self.strokes)
+
+    def reset(self, image: Image.Image) -> None:
+        """
+        全てのストロークを通常のピクセルとして確定し、描画データを下地にする
+
+        Args:
+            image: 現在の描画データ
+        """
+        self.base = image.copy()
+        self.strokes: Dict[int, VectorStroke] = {}
+        self.grid = SpatialGrid(self.cell_size)
+        self._next_id = 1
+        self._color_counts: Dict[str, int] = {}
+
+    @property
+    def colors(self) -> List[str]:
+        """
+        残っているストロークで使われている色（描き直す前にインクを求めるために使う）
+        """
+        return list(self._color_counts)
+
+    def clip(self, box: Sequence[float]) -> Optional[Box]:
+        """
+        矩形を描画データの範囲に切り詰める（範囲外の場合はNone）
+        """
+        width, height = self.base.size
+        clipped = (max(0, int(box[0])), max(0, int(box[1])),
+                   min(width, math.ceil(box[2])), min(height, math.ceil(box[3])))
+        if clipped[0] >= clipped[2] or clipped[1] >= clipped[3]:
+            return None
+        return clipped
+
+    def add(self, points: Sequence[Tuple[int, int]], color: str, width: int) -> VectorStroke:
+        """
+        描画データに描き終えたストロークを登録する（描画データには呼び出し側で描画済み）
+
+        Args:
+            points: ストロークの点
+            color: 線の色
+            width: 線の太さ
+
+        Returns:
+            登録したストローク
+        """
+        stroke = VectorStroke(self._next_id, points, color, width)
+        self._next_id += 1
+        self.strokes[stroke.id] = stroke
+        self.grid.insert(stroke)
+        self._color_counts[color] = self._color_counts.get(color, 0) + 1
+        return stroke
+
+    def remove(self, stroke: VectorStroke) -> None:
+        """
+        ストロークの登録を消す（描画データと下地は変えない）
+        """
+        if self.strokes.pop(stroke.id, None) is None:
+            return
+        self.grid.remove(stroke.id)
+        count = self._color_counts[stroke.color] - 1
+        if count:
+            self._color_counts[stroke.color] = count
+        else:
+            del self._color_counts[stroke.color]
+
+    def strokes_near(self, box: Sequence[float]) -> List[VectorStroke]:
+        """
+        描画で矩形を書き換える可能性があるストローク
+
+        Args:
+            box: 矩形 (x0, y0, x1, y1)
+
+        Returns:
+            描いた順のストロークのリスト
+        """
+        found = [self.strokes[stroke_id] for stroke_id in self.grid.query(box)]
+        return sorted((stroke for stroke in found if _intersects(stroke.bounds, box)), key=lambda stroke: stroke.id)
+
+    def hit_test(self, x: float, y: float, tolerance: float = 0.0) -> Optional[VectorStroke]:
+        """
+        点に重なるストロークのうち一番上のもの
+
+        Args:
+            x, y: 座標
+            tolerance: 線の外側でも当たりとする距離
+
+        Returns:
+            ストローク（重なるものがない場合はNone）
+        """
+        box = (x - tolerance, y - tolerance, x + tolerance + 1, y + tolerance + 1)
+        for stroke in reversed(self.strokes_near(box)):
+            if stroke.distance(x, y) <= stroke.width / 2 + tolerance:
+                return stroke
+        return None
+
+    def strokes_in_box(self, box: Sequence[float]) -> List[VectorStroke]:
+        """
+        点が全て矩形の中にあるストローク（ラバーバンドでの選択）
+
+        Args:
+            box: 矩形 (x0, y0, x1, y1)
+
+        Returns:
+            描いた順のストロークのリスト
+        """
+        found = (self.strokes[stroke_id] for stroke_id in self.grid.query(box))
+        return sorted((stroke for stroke in found
+                       if box[0] <= stroke.extent[0] and box[1] <= stroke.extent[1]
+                       and stroke.extent[2] <= box[2] and stroke.extent[3] <= box[3]),
+                      key=lambda stroke: stroke.id)
+
+    def render(self, box: Box, inks: Mapping[str, object]) -> Image.Image:
+        """
+        下地の矩形に、矩形に掛かる残りのストロークを描いた画像
+
+        Args:
+            box: 描画データの範囲内の矩形
+            inks: colorsの各色の描画データのインク
+
+        Returns:
+            矩形の大きさの画像
+        """
+        region = self.base.crop(box)
+        draw = ImageDraw.Draw(region)
+        for stroke in self.strokes_near(box):
+            stroke.render(draw, inks[stroke.color], (-box[0], -box[1]))
+        return region
+
+    def erase(self, strokes: Sequence[VectorStroke], image: Image.Image,
+              inks: Mapping[str, object]) -> List[Tuple[Box, Image.Image, Image.Image]]:
+        """
+        ストロークを消し、描画データのストロークの矩形だけを描き直す
+        インクは呼び出し前に求めておく（パレットが一杯でRGBに切り替わると描画データが置き換わるため）
+
+        Args:
+            strokes: 消すストローク
+            image: 描画データ（書き換える）
+            inks: colorsの各色の描画データのインク
+
+        Returns:
+            履歴に記録する(矩形, 変更前, 変更後)のリスト
+        """
+        for stroke in strokes:
+            self.remove(stroke)
+        regions = []
+        for stroke in strokes:
+            box = self.clip(stroke.bounds)
+            if box is None:
+                continue
+            after = self.render(box, inks)
+            before = image.crop(box)
+            image.paste(after, box)
+            regions.append((box, before, after))
+        return regions
+
+    def flatten(self, image: Image.Image, inks: Mapping[str, object],
+                box: Optional[Sequence[float]] = None) -> List[VectorStroke]:
+        """
+        ストローク以外の描画で描画データを書き換えた時に、矩形に掛かるストロークを通常のピクセルとして確定する
+
+        Args:
+            image: 書き換えた後の描画データ
+            inks: colorsの各色の描画データのインク
+            box: 書き換えた矩形（Noneの場合は全体）
+
+        Returns:
+            確定したストロークのリスト
+        """
+        if box is None:
+            flattened = list(self.strokes.values())
+            self.reset(image)
+            return flattened
+        box = self.clip(box)
+        if box is None:
+            return []
+
+        flattened: Dict[int, VectorStroke] = {}
+        pending = self.strokes_near(box)
+        while pending:
+            stroke = pending.pop()
+            if stroke.id in flattened:
+                continue
+            flattened[stroke.id] = stroke
+            # 下にある（先に描いた）ストロークが確定したストロークより上に描き直されないよう、一緒に確定する
+            pending.extend(other for other in self.strokes_near(stroke.bounds)
+                           if other.id < stroke.id and other.id not in flattened)
+
+        draw = ImageDraw.Draw(self.base)
+        for stroke in sorted(flattened.values(), key=lambda stroke: stroke.id):
+            self.remove(stroke)
+            stroke.render(draw, inks[stroke.color])
+        self.base.paste(image.crop(box), box)
+        return list(flattened.values())
+
+    def to_rgb(self, palette: Optional[Sequence[int]]) -> None:
+        """
+        描画データをインデックスカラーからRGBに変換した時に、下地も同じパレットで変換する
+        （下地には描画データのパレット番号で描いているため、下地自身のパレットは使わない）
+
+        Args:
+            palette: 変換前の描画データのパレット
+        """
+        if self.base.mode == "P" and palette is not None:
+            self.base.putpalette(palette)
+        self.base = self.base.convert("RGB")